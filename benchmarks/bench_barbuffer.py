@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+'''
+Compares the feed's array backed bar buffer with the former queue.Queue of
+bar lists: bars/sec through put + get (including the datetime conversion
+``_load_bar`` needs) and the peak RSS of a process holding a whole backfill.
+
+Each path runs in its own process so the peak RSS figures do not mix.
+
+    python benchmarks/bench_barbuffer.py --bars 2000000 --page 1000
+
+The buffer path also runs as the ``barbuffer`` benchmark of run.py.
+'''
+from __future__ import (absolute_import, division, print_function, unicode_literals)
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def make_pages(bars, page):
+    '''Pages of bars as returned by fetch_ohlcv: lists of python lists'''
+    ts = 1500000000000
+    for start in range(0, bars, page):
+        yield [[ts + i * 60000, 100.0, 101.0, 99.0, 100.5, 12.5] for i in range(start, min(start + page, bars))]
+
+
+def run_queue(bars, page):
+    import backtrader as bt
+    from backtrader.utils.py3 import queue
+    data = queue.Queue()
+    started = time.time()
+    for bars_page in make_pages(bars, page):
+        for bar in bars_page:
+            data.put(bar)
+    while True:
+        try:
+            bar = data.get(block=False)
+        except queue.Empty:
+            break
+        tstamp, open_, high, low, close, volume = bar
+        bt.date2num(datetime.utcfromtimestamp(tstamp // 1000))
+    return time.time() - started
+
+
+def run_buffer(bars, page):
+    from backtrader.utils.py3 import queue
+    from ccxtbt.ohlcvbuffer import OHLCVBuffer
+    data = OHLCVBuffer()
+    started = time.time()
+    for bars_page in make_pages(bars, page):
+        data.put_many(bars_page)
+    while True:
+        try:
+            bar = data.get()
+        except queue.Empty:
+            break
+        tstamp, open_, high, low, close, volume, dtnum = bar
+    return time.time() - started
+
+
+PATHS = {'queue': run_queue, 'buffer': run_buffer}
+
+
+def measure(path, bars, page):
+    '''Run one path in this process and return its figures'''
+    elapsed = PATHS[path](bars, page)
+    # ru_maxrss is in KiB on Linux
+    return {'path': path, 'bars': bars, 'seconds': elapsed, 'bars_per_sec': bars / elapsed,
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0}
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Bar buffer benchmark')
+    parser.add_argument('--bars', type=int, default=1000000)
+    parser.add_argument('--page', type=int, default=1000)
+    parser.add_argument('--path', choices=sorted(PATHS), help='run a single path in this process')
+    args = parser.parse_args(args)
+
+    if args.path:
+        print(json.dumps(measure(args.path, args.bars, args.page)))
+        return
+
+    results = []
+    for path in ('queue', 'buffer'):
+        out = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--path', path,
+                                       '--bars', str(args.bars), '--page', str(args.page)])
+        results.append(json.loads(out.decode().strip().splitlines()[-1]))
+    for r in results:
+        print('{path:>7}: {bars_per_sec:>12,.0f} bars/s  peak RSS {peak_rss_mb:8.1f} MB'.format(**r))
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+'''
+Deterministic in-process stand-in for a ccxt exchange used by the benchmarks.
+
+It implements the unified calls the store, feed and broker make
+(fetch_ohlcv, create_order(s), fetch_order, fetch_open_orders,
+fetch_closed_orders, cancel_order, fetch_balance) without any network. Every
+call sleeps ``latency`` seconds, ``rateLimit`` (ms, like ccxt) drives the
+store's rate limiter, and bars are a pure function of their timestamp, so two
+runs see exactly the same data.
+
+Options are passed in the exchange config, as ccxt does:
+
+    store = CCXTStore(exchange='bench', currency='USDT', retries=1,
+                      config={'latency': 0.005, 'rateLimit': 50})
+'''
+from __future__ import (absolute_import, division, print_function, unicode_literals)
+
+import copy
+import itertools
+import threading
+import time
+
+import ccxt
+
+
+class BenchExchange(object):
+
+    id = 'bench'
+    name = 'Bench'
+    has = {'fetchOHLCV': True, 'fetchOrder': True, 'fetchOpenOrders': True, 'fetchClosedOrders': True,
+           'createOrders': True}
+    timeframes = {'1m': '1m', '5m': '5m', '15m': '15m', '1h': '1h', '1d': '1d'}
+
+    parse_timeframe = staticmethod(ccxt.Exchange.parse_timeframe)
+
+    def __init__(self, config=None):
+        config = config or {}
+        self.latency = config.get('latency', 0.0)
+        self.rateLimit = config.get('rateLimit', 0)
+        self.clock_ms = config.get('clock_ms')  # None: bars up to the wall clock
+        self.markets = {}
+        self.currencies = {}
+        self.orders = {}
+        self.calls = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def set_sandbox_mode(self, enabled):
+        pass
+
+    def _request(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    @staticmethod
+    def bar(ts, period):
+        price = 100.0 + (ts // period) % 1000 * 0.01
+        return [ts, price, price + 0.5, price - 0.5, price + 0.1, 1.0 + (ts // period) % 7]
+
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=None, params={}):
+        self._request()
+        period = self.parse_timeframe(timeframe) * 1000
+        now = self.clock_ms if self.clock_ms is not None else int(time.time() * 1000)
+        limit = limit or 500
+        last = now // period * period  # the bar still open is returned, as exchanges do
+        first = last - (limit - 1) * period if since is None else -(-since // period) * period
+        return [self.bar(ts, period) for ts in range(first, min(last, first + (limit - 1) * period) + 1, period)]
+
+    def create_order(self, symbol, type, side, amount, price=None, params={}):
+        self._request()
+        with self._lock:
+            oid = str(next(self._ids))
+            self.orders[oid] = {'id': oid, 'symbol': symbol, 'type': type, 'side': side, 'amount': amount,
+                                'price': price, 'status': 'open', 'filled': 0.0, 'remaining': amount,
+                                'average': None, 'timestamp': int(time.time() * 1000), 'trades': None,
+                                'fee': None, 'clientOrderId': params.get('clientOrderId')}
+            return copy.deepcopy(self.orders[oid])
+
+    def create_orders(self, orders, params={}):
+        self._request()
+        latency, self.latency = self.latency, 0.0  # one request for the whole batch
+        try:
+            return [self.create_order(o['symbol'], o['type'], o['side'], o['amount'], o.get('price'),
+                                      o.get('params', {})) for o in orders]
+        finally:
+            self.latency = latency
+
+    def fetch_order(self, id, symbol=None, params={}):
+        self._request()
+        return copy.deepcopy(self.orders[id])
+
+    def _orders(self, status, symbol):
+        with self._lock:
+            return [copy.deepcopy(o) for o in self.orders.values()
+                    if o['status'] in status and (symbol is None or o['symbol'] == symbol)]
+
+    def fetch_open_orders(self, symbol=None, since=None, limit=None, params={}):
+        self._request()
+        return self._orders(('open',), symbol)
+
+    def fetch_closed_orders(self, symbol=None, since=None, limit=None, params={}):
+        self._request()
+        return self._orders(('closed', 'canceled'), symbol)
+
+    def cancel_order(self, id, symbol=None, params={}):
+        self._request()
+        self.orders[id]['status'] = 'canceled'
+        return copy.deepcopy(self.orders[id])
+
+    def fetch_balance(self, params=None):
+        self._request()
+        return {'free': {'USDT': 1e9}, 'total': {'USDT': 1e9}}
+
+    def load_markets(self, reload=False, params={}):
+        return self.markets
+
+    def set_markets(self, markets, currencies=None):
+        self.markets = markets
+
+
+def install():
+    '''Make ``CCXTStore(exchange='bench', ...)`` build a BenchExchange'''
+    ccxt.bench = BenchExchange
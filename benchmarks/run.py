@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+'''
+Offline benchmark suite of the store, feed and broker.
+
+Every benchmark runs in its own process against the deterministic
+BenchExchange (see benchexchange.py), so no network is needed and the peak
+RSS figures do not mix. Figures named ``*_per_sec`` are better when higher,
+all the others (latencies in ms, memory in MB, requests) when lower.
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --compare results.json --tolerance 0.2
+    python benchmarks/run.py --only backfill poll_cost --latency 0.01
+
+With ``--compare`` the exit status is 1 when a figure got worse than the
+baseline by more than ``--tolerance`` (a fraction).
+'''
+from __future__ import (absolute_import, division, print_function, unicode_literals)
+
+import argparse
+import collections
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, HERE)
+
+
+def make_store(args, **config):
+    from benchexchange import install
+    from ccxtbt import CCXTStore
+    install()
+    CCXTStore.clear_registry()
+    config = dict({'latency': args.latency, 'rateLimit': args.rate_limit}, **config)
+    return CCXTStore(exchange='bench', currency='USDT', config=config, retries=1)
+
+
+def make_feed(store, **kwargs):
+    import backtrader as bt
+    params = dict(dataname='BTC/USDT', timeframe=bt.TimeFrame.Minutes, compression=1, ohlcv_limit=1000)
+    params.update(kwargs)
+    return store.getdata(**params)
+
+
+def make_broker(store, **kwargs):
+    return store.getbroker(check_orders=False, **kwargs)
+
+
+def priced_data(store, dataname='BTC/USDT'):
+    '''A feed with one bar loaded, enough to place orders against'''
+    import backtrader as bt
+    data = make_feed(store, dataname=dataname)
+    data._tz = None
+    data.forward()
+    data.lines.datetime[0] = bt.date2num(datetime(2020, 1, 1))
+    data.lines.close[0] = 100.0
+    return data
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def bench_backfill(args):
+    '''Historical download speed, serial paging and parallel windows'''
+    results = {}
+    for workers in (1, 4):
+        store = make_store(args)
+        feed = make_feed(store, download_workers=workers, historical=True)
+        fromdate = datetime.utcfromtimestamp((int(time.time()) // 60 - args.bars) * 60)
+        started = time.perf_counter()
+        feed._update_bar(fromdate)
+        elapsed = time.perf_counter() - started
+        results['backfill_{}_workers_bars_per_sec'.format(workers)] = feed._data.qsize() / elapsed
+    return results
+
+
+def bench_live_latency(args):
+    '''Time from a new bar being available on the exchange to _load() returning it'''
+    store = make_store(args, clock_ms=1500000000000)
+    feed = make_feed(store, ohlcv_limit=3)
+    feed._tz = None
+    feed._state = feed._ST_LIVE
+    feed._laststatus = feed.LIVE
+    feed._last_ts = store.exchange.clock_ms - 60000
+    latencies = []
+    for _ in range(args.iterations):
+        store.exchange.clock_ms += 60000
+        feed._next_poll_time = 0
+        feed.forward()
+        started = time.perf_counter()
+        if not feed._load():
+            raise RuntimeError('no live bar loaded')
+        latencies.append((time.perf_counter() - started) * 1000.0)
+    return {'live_latency_ms_mean': sum(latencies) / len(latencies), 'live_latency_ms_p99': percentile(latencies, 0.99)}
+
+
+def bench_order_rtt(args):
+    '''Time for buy() to return (synchronous submit) and to the exchange ack (async submit)'''
+    import backtrader as bt
+    results = {}
+    store = make_store(args)
+    broker = make_broker(store)
+    data = priced_data(store)
+    rtts = []
+    for _ in range(args.iterations):
+        started = time.perf_counter()
+        broker.buy(None, data, 1.0, price=90.0, exectype=bt.Order.Limit, parent=None, transmit=True)
+        rtts.append((time.perf_counter() - started) * 1000.0)
+    results['sync_submit_ms_mean'] = sum(rtts) / len(rtts)
+
+    store = make_store(args)
+    broker = make_broker(store, async_submit=True)
+    data = priced_data(store)
+    started = time.perf_counter()
+    for _ in range(args.iterations):
+        broker.buy(None, data, 1.0, price=90.0, exectype=bt.Order.Limit, parent=None, transmit=True)
+    returned = time.perf_counter() - started
+    while len(broker.open_orders) < args.iterations:
+        broker._next_acks()
+        time.sleep(0.0005)
+    acked = time.perf_counter() - started
+    broker.stop()
+    results['async_submit_ms_mean'] = returned * 1000.0 / args.iterations
+    results['async_all_acked_ms'] = acked * 1000.0
+    return results
+
+
+def bench_poll_cost(args):
+    '''Cost of one broker poll of the open orders against their number'''
+    import backtrader as bt
+    results = {}
+    for count in (1, 10, 100):
+        store = make_store(args)
+        broker = make_broker(store)
+        datas = [priced_data(store, dataname) for dataname in ('BTC/USDT', 'ETH/USDT')]
+        for i in range(count):
+            broker.buy(None, datas[i % 2], 1.0, price=90.0, exectype=bt.Order.Limit, parent=None, transmit=True)
+        calls = store.exchange.calls
+        started = time.perf_counter()
+        for _ in range(args.polls):
+            broker._next()
+        results['poll_ms_{}_orders'.format(count)] = (time.perf_counter() - started) * 1000.0 / args.polls
+        results['poll_requests_{}_orders'.format(count)] = (store.exchange.calls - calls) / float(args.polls)
+    return results
+
+
+def bench_feed_memory(args):
+    '''Peak RSS growth per feed holding a backfill of ``--bars`` bars'''
+    store = make_store(args)
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    feeds = []
+    for i in range(args.feeds):
+        feed = make_feed(store, dataname='SYM{}/USDT'.format(i), historical=True)
+        feed._update_bar(datetime.utcfromtimestamp((int(time.time()) // 60 - args.bars) * 60))
+        feeds.append(feed)
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux
+    return {'feed_memory_mb': (after - before) / 1024.0 / args.feeds}
+
+
+def bench_barbuffer(args):
+    '''Bar buffer throughput, see bench_barbuffer.py'''
+    from bench_barbuffer import run_buffer
+    elapsed = run_buffer(args.bars * 10, 1000)
+    return {'buffer_bars_per_sec': args.bars * 10 / elapsed}
+
+
+def bench_simulated(args):
+    '''Orders through CCXTBroker against the SimulatedExchange in a cerebro backtest'''
+    import backtrader as bt
+    import numpy as np
+    from ccxtbt import CCXTStore, SimulatedExchange
+
+    class Flip(bt.Strategy):
+        def next(self):
+            if len(self) % 2:
+                self.buy(size=0.1)
+            else:
+                self.sell(size=0.1)
+
+    start = 1577836800000
+    closes = 100 + np.sin(np.arange(args.bars) / 20.0) * 5
+    bars = np.column_stack([start + np.arange(args.bars) * 60000, closes, closes + 1, closes - 1, closes,
+                            np.ones(args.bars)])
+    CCXTStore.clear_registry()
+    exchange = SimulatedExchange({'ohlcv': {'BTC/USDT': bars}, 'balance': {'USDT': 1e9}})
+    store = CCXTStore(exchange=exchange, currency='USDT', config={}, retries=1)
+    cerebro = bt.Cerebro()
+    cerebro.setbroker(store.getbroker())
+    cerebro.adddata(make_feed(store, fromdate=datetime(2020, 1, 1), historical=True))
+    cerebro.addstrategy(Flip)
+    started = time.perf_counter()
+    cerebro.run()
+    elapsed = time.perf_counter() - started
+    return {'simulated_orders_per_sec': len(exchange.orders) / elapsed}
+
+
+BENCHMARKS = collections.OrderedDict([
+    ('backfill', bench_backfill),
+    ('live_latency', bench_live_latency),
+    ('order_rtt', bench_order_rtt),
+    ('poll_cost', bench_poll_cost),
+    ('feed_memory', bench_feed_memory),
+    ('barbuffer', bench_barbuffer),
+    ('simulated', bench_simulated),
+])
+
+
+def higher_is_better(metric):
+    return metric.endswith('_per_sec')
+
+
+def compare(results, baseline, tolerance):
+    '''Print the change of every figure against ``baseline``, returns the regressed ones'''
+    regressions = []
+    for name, figures in results.items():
+        for metric, value in figures.items():
+            old = baseline.get(name, {}).get(metric)
+            if not old:
+                continue
+            change = (value - old) / old
+            worse = -change if higher_is_better(metric) else change
+            flag = 'REGRESSION' if worse > tolerance else ''
+            if flag:
+                regressions.append((name, metric))
+            print('{:>14} {:>28}: {:>12.3f} -> {:>12.3f} ({:+.1%}) {}'.format(name, metric, old, value, change, flag))
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE,
+                                       stderr=subprocess.STDOUT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='ccxtbt offline benchmarks')
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help='benchmarks to run, all by default')
+    parser.add_argument('--latency', type=float, default=0.002, help='seconds per exchange request')
+    parser.add_argument('--rate-limit', type=int, default=0, help='exchange rateLimit in ms')
+    parser.add_argument('--bars', type=int, default=20000)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--polls', type=int, default=20)
+    parser.add_argument('--feeds', type=int, default=10)
+    parser.add_argument('--output', help='write the results to this json file')
+    parser.add_argument('--compare', help='json results of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(args)
+    names = args.only or list(BENCHMARKS)
+
+    if args.child:
+        print(json.dumps(BENCHMARKS[names[0]](args)))
+        return
+
+    options = ['--latency', str(args.latency), '--rate-limit', str(args.rate_limit), '--bars', str(args.bars),
+               '--iterations', str(args.iterations), '--polls', str(args.polls), '--feeds', str(args.feeds)]
+    results = collections.OrderedDict()
+    for name in names:
+        out = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--child', '--only', name] + options)
+        results[name] = json.loads(out.decode().strip().splitlines()[-1])
+        for metric, value in results[name].items():
+            print('{:>14} {:>28}: {:>14,.3f}'.format(name, metric, value))
+
+    if args.output:
+        report = {'meta': {'date': datetime.now().isoformat(), 'revision': git_revision(),
+                           'python': platform.python_version(), 'platform': platform.platform(),
+                           'options': options},
+                  'results': results}
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        print()
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,14 @@
 from .ccxtbroker import *
 from .ccxtfeed import *
+from .ccxtledger import *
+from .ccxtmetrics import *
+from .ccxtsimulator import *
 from .ccxtstore import *
+from .ccxtstream import *
+from .ccxttradefeed import *
+from .ccxtvaluation import *
+from .ohlcvbuffer import *
+from .ohlcvcache import *
+from .ohlcvdownloader import *
+from .ohlcvhub import *
+from .ohlcvresample import *
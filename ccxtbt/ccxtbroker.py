@@ -22,13 +22,19 @@ from __future__ import (absolute_import, division, print_function, unicode_liter
 
 import collections
 import json
-from datetime import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from backtrader import BrokerBase, Order
 from backtrader.position import Position
 from backtrader.utils.py3 import queue, with_metaclass
+from ccxt.base.errors import ExchangeError, InvalidOrder, OrderNotFound
 
+from .ccxtledger import CCXTLedger, split_symbol
 from .ccxtstore import CCXTStore
+from .ccxtvaluation import CCXTValuation
+from .ohlcvbuffer import num_to_ts
 
 
 class CCXTOrder(Order):
@@ -40,9 +46,41 @@ class CCXTOrder(Order):
         self.size = float(amount)
         self.price = float(price) if price else None
         self.ccxt_order = ccxt_order
-        self.executed_fills = []
+        self.executed_fills = set()  # keys (see trade_key) of the trades already applied
+        self.fill_watermark = None  # timestamp of the newest trade applied
+        self.fee_booked = 0.0  # cumulative order fee already booked in the ledger
         super(CCXTOrder, self).__init__()
 
+    @staticmethod
+    def trade_key(trade):
+        '''The trade id, or (timestamp, amount, price) for the exchanges which return trades without one'''
+        if trade['id'] is not None:
+            return trade['id']
+        return trade.get('timestamp'), trade.get('amount'), trade.get('price')
+
+    def new_fills(self, trades):
+        '''Returns the trades (in time order) which have not been applied yet and marks them applied
+
+        Exchanges return every trade of an order on each request, sorted by time. The list is
+        walked backwards only down to the newest trade already applied, so each poll costs
+        the number of new trades and not the number of trades of the order.
+        '''
+        watermark = self.fill_watermark
+        fresh = []
+        for trade in reversed(trades):
+            ts = trade.get('timestamp')
+            if watermark is not None and ts is not None and ts < watermark:
+                break
+            if self.trade_key(trade) not in self.executed_fills:
+                fresh.append(trade)
+        fresh.reverse()
+        for trade in fresh:
+            self.executed_fills.add(self.trade_key(trade))
+            ts = trade.get('timestamp')
+            if ts is not None and (self.fill_watermark is None or ts > self.fill_watermark):
+                self.fill_watermark = ts
+        return fresh
+
 
 class MetaCCXTBroker(BrokerBase.__class__):
     def __init__(cls, name, bases, dct):
@@ -72,6 +110,20 @@ class CCXTBroker(with_metaclass(MetaCCXTBroker, BrokerBase)):
         Backtrader will call getcash and getvalue before and after next, slowing things down
         with rest calls. As such, th
 
+    getcash() and getvalue() read the in-memory ``ledger`` (see CCXTLedger): seeded from the
+        balance the store fetched, updated from every order and fill (fees included) and
+        reconciled with fetch_balance every ``reconcile_interval`` seconds (None to disable).
+        The drift found by the last reconciliation is kept in ``ledger_drift``
+
+    getvalue() marks every currency of the ledger to the store currency (see CCXTValuation),
+        with the last close of the running feeds and, for currencies no feed prices, the
+        tickers fetched in bulk every ``tickers_interval`` seconds (None to disable)
+
+    With ``check_orders`` (default) amounts and prices are rounded with amount_to_precision and
+        price_to_precision and checked against the market amount, price and cost (min notional)
+        limits before sending. An order the exchange would refuse is rejected at once, the
+        reason is in ``order.info.reject_reason``
+
     The broker mapping should contain a new dict for order_types and mappings like below:
 
     broker_mapping = {
@@ -94,6 +146,36 @@ class CCXTBroker(with_metaclass(MetaCCXTBroker, BrokerBase)):
 
     Added new private_end_point method to allow using any private non-unified end point
 
+    Open orders are polled in batches. ``order_poll`` selects how:
+        'symbol' (default): one fetch_open_orders call per symbol
+        'account': one fetch_open_orders call for all symbols
+        'order': one fetch_order call per open order
+        Orders which left the open set are then fetched on their own
+
+    When the store has a streaming backend, order updates from watch_orders (with the fills
+        from watch_my_trades) are applied on every next() call. The REST poll then only runs
+        every ``stream_poll_interval`` seconds as a safety net
+
+    The poll interval adapts to the open orders instead of a fixed 3 seconds:
+        ``poll_fast`` for ``poll_fast_window`` seconds after a submit or cancel and while an
+        order is marketable (market orders, limits crossing the last close)
+        ``poll_slow`` when every order rests more than ``poll_far`` (fraction of the price)
+        away from the last close
+        ``poll_interval`` otherwise
+        No poll at all without open orders. The chosen interval and how late the polls run
+        (``next()`` is only called once per bar) are kept in ``poll_stats``
+
+    With ``async_submit=True`` buy()/sell() return a Submitted order at once and the orders
+        are sent by a pool of ``submit_workers`` threads, within the store's rate budget.
+        Orders queued while a request is in flight go out together through create_orders
+        (up to ``submit_batch_size`` per request) if the exchange supports it. The exchange
+        answer is notified as Accepted (or Rejected) on the next next() call. Cancelling an
+        order not sent yet drops it, an order in flight is cancelled once acknowledged
+
+    Backtests can run through this broker on a ``SimulatedExchange`` store: every next()
+        moves the simulated time of the traded symbols to their current bar and polls the
+        open orders, which the exchange fills on the bars after the ``created`` time
+
     '''
 
     order_types = {Order.Market: 'market',
@@ -111,7 +193,10 @@ class CCXTBroker(with_metaclass(MetaCCXTBroker, BrokerBase)):
             'value': 'canceled'}
     }
 
-    def __init__(self, broker_mapping=None, debug=False, **kwargs):
+    def __init__(self, broker_mapping=None, debug=False, order_poll='symbol', stream_poll_interval=60,
+                 poll_interval=3.0, poll_fast=0.5, poll_slow=15.0, poll_fast_window=10.0, poll_far=0.02,
+                 async_submit=False, submit_workers=4, submit_batch_size=10, reconcile_interval=300,
+                 tickers_interval=60, check_orders=True, **kwargs):
         super(CCXTBroker, self).__init__()
 
         if broker_mapping is not None:
@@ -124,29 +209,107 @@ class CCXTBroker(with_metaclass(MetaCCXTBroker, BrokerBase)):
             except KeyError:  # might not want to change the mappings
                 pass
 
-        self.store = CCXTStore(**kwargs)
+        store = kwargs.pop('store', None)
+        self.store = store if store is not None else CCXTStore(**kwargs)
 
         self.currency = self.store.currency
 
         self.positions = collections.defaultdict(Position)
 
         self.debug = debug
+        self.order_poll = order_poll
         self.indent = 4  # For pretty printing dictionaries
 
         self.notifs = queue.Queue()  # holds orders which are notified
 
         self.open_orders = list()
+        self.simulated = getattr(self.store.exchange, 'simulated', False)
+        self._order_datas = {}  # symbol -> data of the orders placed on it
 
         self.startingcash = self.store._cash
         self.startingvalue = self.store._value
 
+        self.ledger = CCXTLedger()
+        self._ledger_seeded = False
+        self._seed_ledger(wait=False)
+        self.ledger_drift = {}
+        self.reconcile_interval = reconcile_interval
+        self._last_reconcile = time.time()
+
+        self.valuation = CCXTValuation(self.currency)
+        self.tickers_interval = tickers_interval
+        self._last_tickers = 0
+
         self._last_op_time = 0
+        self._last_activity = 0  # time of the last submit or cancel
+        self.poll_interval = poll_interval
+        self.poll_fast = poll_fast
+        self.poll_slow = poll_slow
+        self.poll_fast_window = poll_fast_window
+        self.poll_far = poll_far
+        self.poll_stats = {'polls': 0, 'interval': None, 'lag': 0.0, 'max_lag': 0.0, 'last_poll': None}
+
+        self.check_orders = check_orders
+        self.async_submit = async_submit
+        self.submit_batch_size = submit_batch_size
+        self._submit_pool = ThreadPoolExecutor(max_workers=submit_workers) if async_submit else None
+        self._submit_lock = threading.Lock()
+        self._submit_pending = []  # (order, request) not sent yet
+        self._submit_acks = queue.Queue()  # (order, ccxt order or exception) from the workers
+        self._unacked = 0  # orders submitted whose acknowledgement has not been applied yet
+        self._cancel_on_ack = set()  # ids of the orders cancelled while in flight
+
+        self.stream_poll_interval = stream_poll_interval
+        self._stream_handles = None
+        self._stream_updates = queue.Queue()  # (kind, items) pushed by the stream thread
+        self._stream_orders = {}  # order id -> (received time, ccxt order) not yet applied
+        self._stream_trades = collections.defaultdict(dict)  # order id -> {trade id: trade}
 
     def get_balance(self):
         self.store.get_balance()
-        self.cash = self.store._cash
-        self.value = self.store._value
-        return self.cash, self.value
+        self._reconcile(self.store._balance)
+        return self.getcash(), self.getvalue()
+
+    def _seed_ledger(self, wait):
+        '''Seed the ledger with the start-up balance once the store has it'''
+        balance = self.store.initial_balance(wait)
+        if not self.store.balance_ready():
+            return
+        self._ledger_seeded = True
+        if balance:
+            self.ledger.seed(balance)
+            self.startingcash = self.store._cash
+            self.startingvalue = self.store._value
+
+    def _maybe_reconcile(self):
+        '''Reset the ledger to the exchange balance once ``reconcile_interval`` has passed
+
+        A fill already in the exchange balance but not booked yet would be counted twice, so
+        the balance is only taken over when the order poll made right after fetching it books
+        no new fill and no order is waiting for its acknowledgement; otherwise it is tried
+        again at the next bar.
+        '''
+        # 只有带密钥初始化时才有余额可核对
+        if not self.reconcile_interval or self.store._balance is None or \
+                time.time() - self._last_reconcile < self.reconcile_interval:
+            return
+        with self._submit_lock:
+            if self._unacked:
+                return  # 还没确认的订单可能已经成交
+        balance = self.store.get_wallet_balance()
+        if self.open_orders:
+            version = self.ledger.version
+            self._next()
+            if self.ledger.version != version:
+                return  # 轮询到了新的成交,不知道余额里是否已经包含
+        self._reconcile(balance)
+
+    def _reconcile(self, balance):
+        '''Reset the ledger to the exchange balance and record the drift'''
+        self._last_reconcile = time.time()
+        self.ledger_drift = self.ledger.reconcile(balance)
+        if self.ledger_drift and self.debug:
+            print('Ledger drift: {}'.format(self.ledger_drift))
 
     def get_wallet_balance(self, currencys, params={}):
         result = {}
@@ -161,14 +324,36 @@ class CCXTBroker(with_metaclass(MetaCCXTBroker, BrokerBase)):
         # Get cash seems to always be called before get value
         # Therefore it makes sense to add getbalance here.
         # return self.store.getcash(self.currency)
-        self.cash = self.store._cash
+        if not self._ledger_seeded:
+            self._seed_ledger(wait=False)
+        self.cash = self.ledger.free.get(self.currency, 0.0)
         return self.cash
 
     def getvalue(self, datas=None):
         # return self.store.getvalue(self.currency)
-        self.value = self.store._value
+        if not self._ledger_seeded:
+            self._seed_ledger(wait=False)
+        self.value = self.valuation.value(self.ledger)
         return self.value
 
+    def _update_prices(self):
+        '''Refresh the valuation prices from the tickers, then from the feeds which are more recent'''
+        feeds = {}
+        for feed in list(self._order_datas.values()) + self.store.feeds:
+            base, quote, settle = split_symbol(feed.p.dataname)
+            if len(feed) and quote == self.currency and settle is None:
+                feeds[base] = feed
+        now = time.time()
+        if self.tickers_interval and self.store.exchange.has.get('fetchTickers') and \
+                now - self._last_tickers >= self.tickers_interval:
+            held = [c for c, amount in self.ledger.total.items() if amount and c != self.currency and c not in feeds]
+            if held:
+                # 一次请求取回所有行情,只在有没被数据源覆盖的币种时才请求
+                self._last_tickers = now
+                self.valuation.update_tickers(self.store.fetch_tickers())
+        for base, feed in feeds.items():
+            self.valuation.set_price(base, feed.close[0])
+
     def get_notification(self):
         try:
             return self.notifs.get(False)
@@ -185,114 +370,455 @@ class CCXTBroker(with_metaclass(MetaCCXTBroker, BrokerBase)):
             pos = pos.clone()
         return pos
 
+    def stop(self):
+        super(CCXTBroker, self).stop()
+        if self._submit_pool is not None:
+            self._submit_pool.shutdown(wait=True)
+            self._next_acks()
+        if self._stream_handles is not None:
+            for handle in self._stream_handles:
+                self.store.stream.unsubscribe(handle)
+            self._stream_handles = None
+
     def next(self):
         if self.debug:
             print('Broker next() called')
+        if not self._ledger_seeded:
+            self._seed_ledger(wait=True)  # 延迟获取余额时在这里第一次获取
+        if self.async_submit:
+            self._next_acks()
+        if self.store.stream is not None:
+            self._next_stream()
+        if self.simulated:
+            self._advance_simulation()
+        self._maybe_reconcile()
+        self._update_prices()
         #===========================================
-        # 每隔3秒操作一下
-        nts = datetime.now().timestamp()
-        if nts - self._last_op_time < 3:
+        # 没有挂单时完全不轮询,否则按挂单的紧急程度决定轮询间隔
+        interval = self._poll_interval(time.time())
+        self.poll_stats['interval'] = interval
+        if interval is None:
+            return
+        nts = time.time()
+        due = self._last_op_time + interval
+        if nts < due:
             return
-        self._last_op_time = nts
+        if self._last_op_time:
+            lag = nts - due  # next()每根bar才调用一次,实际轮询会比计划晚
+            self.poll_stats['lag'] = lag
+            self.poll_stats['max_lag'] = max(self.poll_stats['max_lag'], lag)
         #===========================================
         self._next()
 
+    def _advance_simulation(self):
+        '''Move the simulated exchange time of the traded symbols to their current bar'''
+        for symbol, data in self._order_datas.items():
+            if len(data):
+                self.store.exchange.advance(symbol, num_to_ts(data.datetime[0]))
+
+    def _poll_interval(self, now):
+        '''Returns the seconds between two polls of the open orders, None if there is nothing to poll'''
+        if not self.open_orders:
+            return None
+        if self.simulated:
+            return 0.0  # 回测时每根bar都撮合
+        if self.store.stream is not None:
+            # 有推送数据时轮询只作为兜底
+            return self.stream_poll_interval
+        if now - self._last_activity < self.poll_fast_window:
+            return self.poll_fast
+        far = True
+        for o_order in self.open_orders:
+            if o_order.exectype in (None, Order.Market):
+                return self.poll_fast
+            distance = self._distance_to_market(o_order)
+            if distance is not None and distance <= 0:
+                return self.poll_fast  # 可以立即成交的订单
+            far = far and distance is not None and distance > self.poll_far
+        return self.poll_slow if far else self.poll_interval
+
+    @staticmethod
+    def _distance_to_market(o_order):
+        '''Relative distance of the order price to the last close, negative when marketable
+
+        Returns None when there is no price to compare with
+        '''
+        data = o_order.data
+        if o_order.price is None or data is None or not len(data):
+            return None
+        last = data.close[0]
+        if not last or last != last:  # 没有价格或NaN
+            return None
+        if o_order.isbuy():
+            return (last - o_order.price) / last
+        return (o_order.price - last) / last
+
     def _next(self):
         """
         1. 对于现货,不要使用市价单,只使用限价单,需要市价单时候也用限价单去模拟,因为有些交易所的市价单的size字段是金额,backtrader
         没考虑这种情况会出错,所以这里不适配市价单
         2. 对于期货,不支持中国期货同一标的同时开多仓和空仓,因为backtrader没考虑这种情况,所以这里我们同一标的同一时间只支持一个方向的仓位
         """
-        for o_order in list(self.open_orders):
-            oID = o_order.ccxt_order['id']
-
-            # Print debug before fetching so we know which order is giving an
-            # issue if it crashes
-            if self.debug:
-                print('Fetching Order ID: {}'.format(oID))
-
-            # Get the order
-            ccxt_order = self.store.fetch_order(oID, o_order.data.p.dataname)
-            status = ccxt_order['status']
-
-            # Check for new fills
-            if 'trades' in ccxt_order and ccxt_order['trades'] is not None: #判断此订单是否有成交
-                for fill in ccxt_order['trades']: #遍历此订单的所有成交
-                    if fill not in o_order.executed_fills: #该成交是否被处理
-                        fill_id, fill_dt, fill_size, fill_price = fill['id'], fill['datetime'], fill['amount'], fill['price']
-                        o_order.executed_fills.append(fill_id) #记录该成交已经被处理
-                        fill_size = fill_size if o_order.isbuy() else -fill_size #满足backtrader规范,卖单或空头仓位用负数表示
-                        o_order.execute(fill_dt, fill_size, fill_price, 
-                                        0, 0.0, 0.0, 
-                                        0, 0.0, 0.0, 
-                                        0.0, 0.0,
-                                        0, 0.0) #处理该成交,内部会标注订单状态,部分成交还是完全成交
-                        #准备通知上层策略
-                        #self.get_balance() #刷新账户余额 (余额不再更新,减少通信提高性能,可以在策略中根据需要自主去更新)
-                        pos = self.getposition(o_order.data, clone=False) #获取对应仓位
-                        pos.update(fill_size, fill_price) #刷新仓位
-                        #-------------------------------------------------------------------
-                        #用order.executed.remsize判断是否全部成交在市价买单的情况下可能不靠谱,所以用如下代码判断是否部分或者全部成交
-                        if status == 'open': #有成交的情况下状态仍然是open的话那肯定是部分成交
-                            o_order.partial()
-                        elif status == 'closed': #有成交的情况下如果状态是closed那意味着全部成交
-                            o_order.completed()
-                        #-------------------------------------------------------------------
-                        self.notify(o_order.clone()) #通知策略
+        self._last_op_time = time.time()
+        self.poll_stats['polls'] += 1
+        self.poll_stats['last_poll'] = self._last_op_time
+        metrics = self.store.metrics
+        if metrics.enabled:
+            metrics.gauge('broker_open_orders', len(self.open_orders))
+            if self.poll_stats['interval'] is not None:
+                metrics.gauge('broker_poll_interval_seconds', self.poll_stats['interval'])
+            metrics.gauge('broker_poll_lag_seconds', self.poll_stats['lag'])
+            started = time.perf_counter()
+        for o_order, ccxt_order in self._poll_orders():
+            self._process_order(o_order, ccxt_order)
+        if metrics.enabled:
+            metrics.timing('broker_poll_seconds', time.perf_counter() - started)
+
+    def _start_stream(self):
+        stream = self.store.stream
+        self._stream_handles = [stream.subscribe('watch_orders', (), lambda orders: self._stream_updates.put(('orders', orders)))]
+        if getattr(stream.exchange, 'has', {}).get('watchMyTrades'):
+            self._stream_handles.append(
+                stream.subscribe('watch_my_trades', (), lambda trades: self._stream_updates.put(('trades', trades))))
+
+    def _next_stream(self):
+        '''Apply the order updates and fills received from the stream'''
+        if self._stream_handles is None:
+            self._start_stream()
+
+        now = time.time()
+        while True:
+            try:
+                kind, items = self._stream_updates.get(False)
+            except queue.Empty:
+                break
+            if kind == 'orders':
+                for ccxt_order in items:
+                    self._stream_orders[ccxt_order['id']] = (now, ccxt_order)
             else:
-                fill_dt, cum_fill_size, average_fill_price = ccxt_order['timestamp'], ccxt_order['filled'], ccxt_order['average']
-                if cum_fill_size > abs(o_order.executed.size): #判断本次是否有新的成交
-                    new_cum_fill_value = cum_fill_size * average_fill_price #累计成交数量*平均成交价=累计成交总价值
-                    old_cum_fill_value = abs(o_order.executed.size) * o_order.executed.price
-                    fill_value = new_cum_fill_value - old_cum_fill_value #本次新成交的价值
-                    fill_size = cum_fill_size - abs(o_order.executed.size) #本次新成交的数量
-                    fill_price = fill_value / fill_size #本次新成交的价格
-                    fill_size = fill_size if o_order.isbuy() else -fill_size #满足backtrader规范,卖单或空头仓位用负数表示
-                    o_order.execute(fill_dt, fill_size, fill_price, 
-                                                        0, 0.0, 0.0, 
-                                                        0, 0.0, 0.0, 
-                                                        0.0, 0.0,
-                                                        0, 0.0) #处理该成交,内部会标注订单状态,部分成交还是完全成交
-                    #准备通知上层策略 
-                    #self.get_balance() #刷新账户余额 (余额不再更新,减少通信提高性能,可以在策略中根据需要自主去更新)
-                    pos = self.getposition(o_order.data, clone=False) #获取对应仓位
-                    pos.update(fill_size, fill_price) #刷新仓位
-                    #-------------------------------------------------------------------
-                    #用order.executed.remsize判断是否全部成交在市价买单的情况下可能不靠谱,所以用如下代码判断是否部分或者全部成交
-                    if status == 'open': #有成交的情况下状态仍然是open的话那肯定是部分成交
-                        o_order.partial()
-                    elif status == 'closed': #有成交的情况下如果状态是closed那意味着全部成交
-                        o_order.completed()
-                    #-------------------------------------------------------------------
-                    self.notify(o_order.clone()) #通知策略
+                for trade in items:
+                    self._stream_trades[trade['order']][CCXTOrder.trade_key(trade)] = trade
+
+        open_by_id = {o_order.ccxt_order['id']: o_order for o_order in self.open_orders}
+        for oID, (received, ccxt_order) in list(self._stream_orders.items()):
+            o_order = open_by_id.get(oID)
+            if o_order is None:
+                # 可能是下单确认还没返回的订单,保留一段时间,其他程序下的订单最终会被丢弃
+                if now - received > 60:
+                    del self._stream_orders[oID]
+                    self._stream_trades.pop(oID, None)
+                continue
+            del self._stream_orders[oID]
+            # 有逐笔成交数据并且和订单的累计成交数量一致时,按逐笔成交处理
+            trades = list(self._stream_trades.get(oID, {}).values())
+            if ccxt_order.get('trades') is None and trades and \
+                    sum(t['amount'] for t in trades) >= (ccxt_order.get('filled') or 0):
+                trades.sort(key=lambda t: t.get('timestamp') or 0)
+                ccxt_order = dict(ccxt_order, trades=trades)
+            self._process_order(o_order, ccxt_order)
+
+        # 丢弃不属于任何挂单的逐笔成交,没有逐笔成交时会按累计成交数量处理
+        open_ids = set(o_order.ccxt_order['id'] for o_order in self.open_orders)
+        for oID in list(self._stream_trades):
+            if oID not in open_ids and oID not in self._stream_orders:
+                del self._stream_trades[oID]
+
+    def _poll_orders(self):
+        '''Returns (order, ccxt_order) pairs with the latest exchange state of every open order
+
+        With ``order_poll='symbol'`` each symbol with several open orders costs a single
+        ``fetch_open_orders`` call and ``'account'`` fetches the open orders of all symbols
+        at once. Only orders which dropped out of the open set are fetched one by one
+        (or with one ``fetch_closed_orders`` call per symbol if ``fetch_order`` is not
+        supported). ``'order'`` fetches every open order on its own.
+        '''
+        by_symbol = collections.OrderedDict()
+        for o_order in self.open_orders:
+            by_symbol.setdefault(o_order.data.p.dataname, []).append(o_order)
+
+        batch = self.order_poll != 'order' and self.store.exchange.has.get('fetchOpenOrders')
+        account_open = None
+        if batch and self.order_poll == 'account' and len(self.open_orders) > 1:
+            account_open = {o['id']: o for o in self.store.fetch_open_orders()}
+
+        result = []
+        for symbol, o_orders in by_symbol.items():
+            if not batch or (account_open is None and len(o_orders) == 1):
+                # 只有一个挂单时直接查询该订单,和批量查询的开销一样
+                for o_order in o_orders:
+                    ccxt_order = self._fetch_order(o_order)
+                    if ccxt_order is not None:
+                        result.append((o_order, ccxt_order))
+                continue
+            if account_open is not None:
+                open_map = account_open
+            else:
+                open_map = {o['id']: o for o in self.store.fetch_open_orders(symbol)}
+            gone = [o_order for o_order in o_orders if o_order.ccxt_order['id'] not in open_map]
+            gone_map = self._fetch_gone_orders(symbol, gone) if gone else {}
+            for o_order in o_orders:
+                oID = o_order.ccxt_order['id']
+                ccxt_order = open_map.get(oID) or gone_map.get(oID)
+                if ccxt_order is not None:
+                    result.append((o_order, ccxt_order))
+                elif self.debug:
+                    print('Order ID {} not found, will retry'.format(oID))
+        return result
 
+    def _fetch_order(self, o_order):
+        '''Returns the ccxt order, None if the exchange does not find it (yet), it is retried at the next poll'''
+        oID = o_order.ccxt_order['id']
+
+        # Print debug before fetching so we know which order is giving an
+        # issue if it crashes
+        if self.debug:
+            print('Fetching Order ID: {}'.format(oID))
+
+        try:
+            return self.store.fetch_order(oID, o_order.data.p.dataname)
+        except OrderNotFound:
             if self.debug:
-                print(json.dumps(ccxt_order, indent=self.indent))
-
-            # Check if the order is closed
-            if status == 'closed':
-                #如果该订单全部成交完成就是此状态,因为上面已经通知过策略,所以这里不再重复通知
-                self.open_orders.remove(o_order)
-            elif status == 'canceled':
-                #考虑两种情况:用户下了限价单没有成交,直接取消了,用户下了限价单部分成交,然后再取消
+                print('Order ID {} not found, will retry'.format(oID))
+            return None
+
+    def _fetch_gone_orders(self, symbol, o_orders):
+        '''Fetch the final state of orders which are no longer open'''
+        if self.store.exchange.has.get('fetchOrder', True) or not self.store.exchange.has.get('fetchClosedOrders'):
+            return {o_order.ccxt_order['id']: self._fetch_order(o_order) for o_order in o_orders}
+        since = min(o_order.ccxt_order.get('timestamp') or 0 for o_order in o_orders) or None
+        return {o['id']: o for o in self.store.fetch_closed_orders(symbol, since=since)}
+
+    def _process_order(self, o_order, ccxt_order):
+        '''Apply the latest exchange state of an open order and notify the strategy'''
+        status = ccxt_order['status']
+
+        # Check for new fills
+        if 'trades' in ccxt_order and ccxt_order['trades'] is not None: #判断此订单是否有成交
+            for fill in o_order.new_fills(ccxt_order['trades']): #只遍历此订单尚未处理的成交
+                fill_dt, fill_size, fill_price = fill['datetime'], fill['amount'], fill['price']
+                self._book_fill(o_order, fill_size, fill_price, fill.get('fee'))
+                fill_size = fill_size if o_order.isbuy() else -fill_size #满足backtrader规范,卖单或空头仓位用负数表示
+                o_order.execute(fill_dt, fill_size, fill_price, 
+                                0, 0.0, 0.0, 
+                                0, 0.0, 0.0, 
+                                0.0, 0.0,
+                                0, 0.0) #处理该成交,内部会标注订单状态,部分成交还是完全成交
+                #准备通知上层策略
                 #self.get_balance() #刷新账户余额 (余额不再更新,减少通信提高性能,可以在策略中根据需要自主去更新)
-                o_order.cancel() #标注订单为取消状态
+                pos = self.getposition(o_order.data, clone=False) #获取对应仓位
+                pos.update(fill_size, fill_price) #刷新仓位
+                #-------------------------------------------------------------------
+                #用order.executed.remsize判断是否全部成交在市价买单的情况下可能不靠谱,所以用如下代码判断是否部分或者全部成交
+                if status == 'open': #有成交的情况下状态仍然是open的话那肯定是部分成交
+                    o_order.partial()
+                elif status == 'closed': #有成交的情况下如果状态是closed那意味着全部成交
+                    o_order.completed()
+                #-------------------------------------------------------------------
                 self.notify(o_order.clone()) #通知策略
-                self.open_orders.remove(o_order)
+        else:
+            fill_dt, cum_fill_size, average_fill_price = ccxt_order['timestamp'], ccxt_order['filled'], ccxt_order['average']
+            if cum_fill_size > abs(o_order.executed.size): #判断本次是否有新的成交
+                new_cum_fill_value = cum_fill_size * average_fill_price #累计成交数量*平均成交价=累计成交总价值
+                old_cum_fill_value = abs(o_order.executed.size) * o_order.executed.price
+                fill_value = new_cum_fill_value - old_cum_fill_value #本次新成交的价值
+                fill_size = cum_fill_size - abs(o_order.executed.size) #本次新成交的数量
+                fill_price = fill_value / fill_size #本次新成交的价格
+                self._book_fill(o_order, fill_size, fill_price, None)
+                fill_size = fill_size if o_order.isbuy() else -fill_size #满足backtrader规范,卖单或空头仓位用负数表示
+                o_order.execute(fill_dt, fill_size, fill_price, 
+                                                    0, 0.0, 0.0, 
+                                                    0, 0.0, 0.0, 
+                                                    0.0, 0.0,
+                                                    0, 0.0) #处理该成交,内部会标注订单状态,部分成交还是完全成交
+                #准备通知上层策略 
+                #self.get_balance() #刷新账户余额 (余额不再更新,减少通信提高性能,可以在策略中根据需要自主去更新)
+                pos = self.getposition(o_order.data, clone=False) #获取对应仓位
+                pos.update(fill_size, fill_price) #刷新仓位
+                #-------------------------------------------------------------------
+                #用order.executed.remsize判断是否全部成交在市价买单的情况下可能不靠谱,所以用如下代码判断是否部分或者全部成交
+                if status == 'open': #有成交的情况下状态仍然是open的话那肯定是部分成交
+                    o_order.partial()
+                elif status == 'closed': #有成交的情况下如果状态是closed那意味着全部成交
+                    o_order.completed()
+                #-------------------------------------------------------------------
+                self.notify(o_order.clone()) #通知策略
+
+        self._book_order_fee(o_order, ccxt_order)
+
+        if self.debug:
+            print(json.dumps(ccxt_order, indent=self.indent))
+
+        # Check if the order is closed
+        if status in ('closed', 'canceled'):
+            self.ledger.close_order(ccxt_order['id'])
+        if status == 'closed':
+            #如果该订单全部成交完成就是此状态,因为上面已经通知过策略,所以这里不再重复通知
+            self.open_orders.remove(o_order)
+        elif status == 'canceled':
+            #考虑两种情况:用户下了限价单没有成交,直接取消了,用户下了限价单部分成交,然后再取消
+            #self.get_balance() #刷新账户余额 (余额不再更新,减少通信提高性能,可以在策略中根据需要自主去更新)
+            o_order.cancel() #标注订单为取消状态
+            self.notify(o_order.clone()) #通知策略
+            self.open_orders.remove(o_order)
+
+    def _book_fill(self, o_order, amount, price, fee):
+        '''Book a fill of ``o_order`` in the ledger'''
+        if fee and fee.get('cost') is not None:
+            o_order.fee_booked = None  # 逐笔成交带手续费时不再按订单的累计手续费记账
+        side = 'buy' if o_order.isbuy() else 'sell'
+        self.ledger.fill(o_order.ccxt_order['id'], o_order.data.p.dataname, side, amount, price, fee)
+
+    def _book_order_fee(self, o_order, ccxt_order):
+        '''Book the part of the cumulative order fee which has not been booked yet'''
+        fee = ccxt_order.get('fee')
+        if o_order.fee_booked is None or not fee or not fee.get('cost') or not fee.get('currency'):
+            return
+        delta = fee['cost'] - o_order.fee_booked
+        if delta > 0:
+            o_order.fee_booked = fee['cost']
+            self.ledger.pay_fee({'cost': delta, 'currency': fee['currency']})
+
+    def _check_order(self, symbol, amount, price, last):
+        '''Round ``amount`` and ``price`` to the market precision and check them against the market limits
+
+        Returns ``(amount, price, None)`` or, when the exchange would reject the order,
+        ``(amount, price, reason)``. Symbols without market data are passed as they are
+        '''
+        market = (self.store.load_markets() or {}).get(symbol)
+        if market is None:
+            return amount, price, None
+        exchange = self.store.exchange
+        try:
+            amount = float(exchange.amount_to_precision(symbol, amount))
+            if price is not None:
+                price = float(exchange.price_to_precision(symbol, price))
+        except InvalidOrder as e:
+            return amount, price, str(e)
+        reference = price if price is not None else last  # 市价单按最新收盘价估算成交金额
+        cost = amount * reference if reference else None
+        limits = market.get('limits') or {}
+        for name, value in (('amount', amount), ('price', price), ('cost', cost)):
+            limit = limits.get(name) or {}
+            if value is None:
+                continue
+            if limit.get('min') is not None and value < limit['min']:
+                return amount, price, '{} {} {} is below the minimum of {}'.format(symbol, name, value, limit['min'])
+            if limit.get('max') is not None and value > limit['max']:
+                return amount, price, '{} {} {} is above the maximum of {}'.format(symbol, name, value, limit['max'])
+        return amount, price, None
+
+    def _open_in_ledger(self, order):
+        side = 'buy' if order.isbuy() else 'sell'
+        self.ledger.open_order(order.ccxt_order['id'], order.data.p.dataname, side, order.size, order.price)
 
     def _submit(self, owner, data, exectype, side, amount, price, params):
         order_type = self.order_types.get(exectype) if exectype else 'market'
-        created = int(data.datetime.datetime(0).timestamp()*1000)
+        created = num_to_ts(data.datetime[0])  # bar时间是UTC,不能按本地时间换算
+        self._order_datas[data.p.dataname] = data
         # Extract CCXT specific params if passed to the order
         params = params['params'] if 'params' in params else params
         params['created'] = created  # Add timestamp of order creation for backtesting
+        if self.check_orders:
+            # 本地按交易所的精度和限制检查订单,不合规的订单直接拒绝,不再浪费一次请求
+            last = data.close[0] if len(data) else None
+            amount, price, reason = self._check_order(data.p.dataname, amount, price, last)
+            if reason is not None:
+                order = CCXTOrder(owner, data, exectype, side, amount, price, None)
+                order.addinfo(reject_reason=reason)
+                order.reject(self)
+                if self.debug:
+                    print('Order rejected: {}'.format(reason))
+                self.notify(order.clone())
+                return order
+        if self.async_submit:
+            order = CCXTOrder(owner, data, exectype, side, amount, price, None)
+            order.submit(self)
+            request = {'symbol': data.p.dataname, 'type': order_type, 'side': side, 'amount': amount,
+                       'price': price, 'params': params}
+            with self._submit_lock:
+                self._submit_pending.append((order, request))
+                self._unacked += 1
+            self._submit_pool.submit(self._send_pending)
+            self.notify(order.clone())
+            return order
         ret_ord = self.store.create_order(symbol=data.p.dataname, order_type=order_type, side=side, amount=amount, price=price, params=params)
         order = CCXTOrder(owner, data, exectype, side, amount, price, ret_ord)
+        self._open_in_ledger(order)
         self.open_orders.append(order)
+        self._last_activity = time.time()
         self.notify(order.clone()) #先发一个订单创建通知
         self._next() #然后判断订单是否已经成交,有成交就发通知
         return order
 
+    def _send_pending(self):
+        '''Worker: send the orders queued so far, in batches if the exchange supports it'''
+        with self._submit_lock:
+            batch_size = self.submit_batch_size if self.store.exchange.has.get('createOrders') else 1
+            batch, self._submit_pending = self._submit_pending[:batch_size], self._submit_pending[batch_size:]
+        if not batch:
+            return  # 已经被其他线程一起发送了
+        orders = [order for order, _ in batch]
+        try:
+            if len(batch) == 1:
+                request = batch[0][1]
+                results = [self.store.create_order(symbol=request['symbol'], order_type=request['type'],
+                                                   side=request['side'], amount=request['amount'],
+                                                   price=request['price'], params=request['params'])]
+            else:
+                results = self.store.create_orders([request for _, request in batch])
+        except Exception as e:
+            results = [e] * len(orders)
+            if len(batch) > 1:
+                results = self._reconcile_batch(batch, e)
+        results = list(results)[:len(orders)]
+        results += [None] * (len(orders) - len(results))
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            # 交易所没有返回结果的订单按客户端订单号查找,查不到的按失败确认
+            error = ExchangeError('No result for {} of {} orders'.format(len(missing), len(orders)))
+            for i, result in zip(missing, self._reconcile_batch([batch[i] for i in missing], error)):
+                results[i] = result
+        for order, result in zip(orders, results):
+            self._submit_acks.put((order, result))
+
+    def _reconcile_batch(self, batch, error):
+        '''After a failed batch, look each order up by its clientOrderId, the error for those not found'''
+        results = []
+        for _, request in batch:
+            client_id = request['params'].get('clientOrderId')
+            try:
+                found = self.store.find_order_by_client_id(request['symbol'], client_id) if client_id else None
+            except Exception:
+                found = None
+            results.append(found if found is not None else error)
+        return results
+
+    def _next_acks(self):
+        '''Apply the exchange acknowledgements of the orders sent in the background'''
+        while True:
+            try:
+                order, result = self._submit_acks.get(False)
+            except queue.Empty:
+                break
+            with self._submit_lock:
+                self._unacked -= 1
+            if isinstance(result, Exception) or not result or result.get('id') is None:
+                if self.debug:
+                    print('Order {} rejected: {!r}'.format(order.ref, result))
+                self._cancel_on_ack.discard(order.ref)
+                order.reject(self)
+                self.notify(order.clone())
+                continue
+            order.ccxt_order = result
+            order.accept(self)
+            self.notify(order.clone())
+            self._open_in_ledger(order)
+            self.open_orders.append(order)
+            self._last_activity = time.time()
+            if order.ref in self._cancel_on_ack:
+                self._cancel_on_ack.discard(order.ref)
+                self.cancel(order)
+
     def buy(self, owner, data, size, price=None, plimit=None,
             exectype=None, valid=None, tradeid=0, oco=None,
             trailamount=None, trailpercent=None,
@@ -311,6 +837,20 @@ class CCXTBroker(with_metaclass(MetaCCXTBroker, BrokerBase)):
 
     def cancel(self, order):
 
+        if order.ccxt_order is None:
+            # 异步下单还没有收到交易所确认
+            with self._submit_lock:
+                pending = [item for item in self._submit_pending if item[0] is not order]
+                dropped = len(pending) != len(self._submit_pending)
+                self._submit_pending = pending
+                self._unacked -= dropped
+            if dropped:
+                order.cancel()
+                self.notify(order.clone())
+            else:
+                self._cancel_on_ack.add(order.ref)
+            return order
+
         oID = order.ccxt_order['id']
 
         if self.debug:
@@ -336,6 +876,7 @@ class CCXTBroker(with_metaclass(MetaCCXTBroker, BrokerBase)):
             print('Value Expected: {}'.format(self.mappings['canceled_order']['value']))
 
         #统一在next函数中处理策略通知
+        self._last_activity = time.time()
         self._next()
         if ccxt_order['status'] == 'canceled':
             order.cancel()
@@ -22,15 +22,21 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
-#import time
-#from collections import deque
+import threading
+import time
 from datetime import datetime
 
-import backtrader as bt
+import numpy as np
 from backtrader.feed import DataBase
-from backtrader.utils.py3 import queue, with_metaclass
+from backtrader.linebuffer import LineBuffer
+from backtrader.utils.py3 import queue, string_types, with_metaclass
 
 from .ccxtstore import CCXTStore
+from .ohlcvbuffer import OHLCVBuffer
+from .ohlcvcache import OHLCVCache
+from .ohlcvdownloader import OHLCVDownloader
+from .ohlcvhub import OHLCVSubscription
+from .ohlcvresample import CALENDAR_UNITS, bar_start, resample_ohlcv
 
 
 class MetaCCXTFeed(DataBase.__class__):
@@ -40,7 +46,7 @@ class MetaCCXTFeed(DataBase.__class__):
         super(MetaCCXTFeed, cls).__init__(name, bases, dct)
 
         # Register with the store
-        CCXTStore.DataCls = cls
+        setattr(CCXTStore, cls._store_slot, cls)
 
 
 class CCXTFeed(with_metaclass(MetaCCXTFeed, DataBase)):
@@ -52,9 +58,61 @@ class CCXTFeed(with_metaclass(MetaCCXTFeed, DataBase)):
         download of data.
         The standard data feed parameters ``fromdate`` and ``todate`` will be
         used as reference.
+        With ``preload`` (cerebro's default) the whole download is copied
+        into the line buffers in one vectorized pass instead of bar by bar.
       - ``backfill_start`` (default: ``True``)
         Perform backfilling at the start. The maximum possible historical data
         will be fetched in a single request.
+      - ``threaded`` (default: ``False``)
+        Poll live bars from a background worker thread. ``_load`` then only
+        drains the queue and never blocks on network I/O.
+      - ``store_poller`` (default: ``False``)
+        Register with the store's OHLCV scheduler instead of running a
+        thread per feed. The store refreshes all registered feeds in one
+        coordinated cycle using a bounded thread pool.
+      - ``streaming`` (default: ``False``)
+        Receive live bars from the store's streaming backend (``watch_ohlcv``)
+        instead of polling. Only closed bars are delivered. Needs a store
+        created with ``stream``.
+      - ``cache`` (default: ``None``)
+        Directory (or ``OHLCVCache`` instance) of an on-disk cache of closed
+        bars. Backfills are served from the cache and only the missing head
+        or tail is fetched; every fetched closed bar is added to it.
+      - ``download_workers`` (default: ``1``)
+        Number of threads downloading the history between ``fromdate`` and
+        ``todate`` (or now). With more than one, the range is split in
+        windows of ``ohlcv_limit`` bars fetched concurrently within the
+        store's rate limit.
+      - ``download_progress`` (default: ``None``)
+        Callable receiving ``(done, total, bars, elapsed)`` after each
+        downloaded window. The last figures are kept in ``download_stats``.
+      - ``shared`` (default: ``False``)
+        Get the bars through the store's ``ohlcv_hub``. Feeds of the same
+        symbol and granularity (e.g. one per sub-strategy) then share one
+        fetch of each bar and read views of one buffer of bars instead of
+        each polling into its own. ``cache``, ``download_workers`` and
+        ``streaming`` do not apply to shared feeds.
+      - ``poll_delay`` (default: ``1.0``)
+        Seconds to wait after a bar closes before polling the exchange for it.
+      - ``poll_retry`` (default: ``5.0``)
+        Seconds between polls while the bar that just closed is not yet
+        available (or after a failed poll in threaded mode).
+
+    Monthly and yearly bars follow the calendar, so their close cannot be
+    worked out: they are polled every ``CALENDAR_POLL`` seconds instead.
+
+    A live poll normally fetches one page of bars. When more than the bar
+    which just closed is missing (after failed polls, or the process was
+    suspended) the poll pages through the whole gap at once and notifies
+    ``LIVE`` with ``backfilled=<bars recovered>`` as keyword argument of
+    ``notify_data``.
+
+    A (timeframe, compression) the exchange does not offer, like 2, 10 or
+    90 minutes, is resampled from the finest exchange granularity dividing
+    it (see ``CCXTStore.resample_plan``). The base bars come from the
+    store's ``shared_ohlcv``, downloaded once for all the feeds of the
+    symbol, and are aggregated in bulk. ``cache`` and ``streaming`` do not
+    apply to resampled feeds.
 
     Changes From Ed's pacakge
 
@@ -71,10 +129,22 @@ class CCXTFeed(with_metaclass(MetaCCXTFeed, DataBase)):
         ('fetch_ohlcv_params', {}),
         ('ohlcv_limit', 20),
         ('drop_newest', False),
+        ('threaded', False),        # poll live bars from a worker thread
+        ('store_poller', False),    # let the store refresh this feed
+        ('streaming', False),       # live bars from the store stream
+        ('cache', None),            # on-disk OHLCV cache directory
+        ('download_workers', 1),    # parallel historical download threads
+        ('download_progress', None),  # progress callback of the download
+        ('shared', False),          # bars from the store's OHLCV hub
+        ('poll_delay', 1.0),        # seconds after bar close before polling
+        ('poll_retry', 5.0),        # seconds between polls when bar is late
         ('debug', False)
     )
 
+    CALENDAR_POLL = 60.0  # seconds between polls of monthly and yearly bars
+
     _store = CCXTStore
+    _store_slot = 'DataCls'  # attribute of the store class this feed registers as
 
     # States for the Finite State Machine in _load
     _ST_LIVE, _ST_HISTORBACK, _ST_OVER = range(3)
@@ -82,11 +152,23 @@ class CCXTFeed(with_metaclass(MetaCCXTFeed, DataBase)):
     # def __init__(self, exchange, symbol, ohlcv_limit=None, config={}, retries=5):
     def __init__(self, **kwargs):
         # self.store = CCXTStore(exchange, config, retries)
-        self.store = self._store(**kwargs)
-        self._data = queue.Queue()  # data queue for price data
+        store = kwargs.pop('store', None)
+        self.store = store if store is not None else self._store(**kwargs)
+        self._data = OHLCVBuffer()  # array backed queue for price data
         self._last_id = ''          # last processed trade id for ohlcv
         self._last_ts = self.utc_to_ts(datetime.utcnow()) # last processed timestamp for ohlcv
-        self._last_update_bar_time = 0
+        self._next_poll_time = 0    # epoch seconds of the next live poll
+        self._poller = None         # live polling worker thread
+        self._poll_failed = False   # last background poll raised
+        self._registered = False    # refreshed by the store scheduler
+        self._stream_handle = None  # watch_ohlcv subscription
+        self._stream_pending = None # latest, still forming, streamed bar
+        self._stop_event = threading.Event()
+        self.download_stats = {}
+        self._cache = OHLCVCache(self.p.cache) if isinstance(self.p.cache, string_types) else self.p.cache
+        self._base = np.empty((0, 6))  # base bars of the resampled bar still forming
+        self._base_ts = None  # base bars are fetched from this timestamp on
+        self._resampled_ts = None  # timestamp of the last resampled bar queued
 
     def utc_to_ts(self, dt):
         fromdate = datetime(dt.year, dt.month, dt.day, dt.hour, dt.minute)
@@ -95,14 +177,39 @@ class CCXTFeed(with_metaclass(MetaCCXTFeed, DataBase)):
 
     def start(self, ):
         DataBase.start(self)
+        self._stop_event.clear()
+        if not any(feed is self for feed in self.store.feeds):
+            self.store.feeds.append(self)
+        if self.p.shared and not isinstance(self._data, OHLCVSubscription) and self._resampled() is None:
+            granularity = self.store.get_granularity(self._timeframe, self._compression)
+            self._data = self.store.ohlcv_hub.subscribe(self.p.dataname, granularity, self.p.fetch_ohlcv_params,
+                                                        self.p.drop_newest)
+            self._data.seek(self._last_ts)
         if self.p.fromdate:
             self._state = self._ST_HISTORBACK
             self.put_notification(self.DELAYED)
-            self._update_bar(self.p.fromdate)
+            with self.store.profiled('backfill {}'.format(self.p.dataname)):
+                self._update_bar(self.p.fromdate)
         else:
             self._state = self._ST_LIVE
             self.put_notification(self.LIVE)
 
+    def stop(self):
+        DataBase.stop(self)
+        self._stop_event.set()
+        self.store.feeds = [feed for feed in self.store.feeds if feed is not self]
+        if isinstance(self._data, OHLCVSubscription):
+            self.store.ohlcv_hub.unsubscribe(self._data)
+        if self._stream_handle is not None:
+            self.store.stream.unsubscribe(self._stream_handle)
+            self._stream_handle = None
+        if self._registered:
+            self.store.ohlcv_scheduler.unregister(self)
+            self._registered = False
+        if self._poller is not None:
+            self._poller.join()
+            self._poller = None
+
     def _load(self):
         """ 
         return True  代表从数据源获取数据成功
@@ -114,14 +221,23 @@ class CCXTFeed(with_metaclass(MetaCCXTFeed, DataBase)):
         #
         while True:
             if self._state == self._ST_LIVE:
-                #===========================================
-                # 其实这段代码最好放到独立的工作线程中做,这里纯粹偷懒
-                # 每隔一分钟就更新一次bar
-                nts = datetime.now().timestamp()
-                if nts - self._last_update_bar_time > 60:
-                    self._last_update_bar_time = nts
-                    self._update_bar(livemode=True)
-                #===========================================
+                if self.p.streaming:
+                    if self._stream_handle is None:
+                        # 订阅之前先用REST补齐最新的bar
+                        self._poll()
+                        self._subscribe()
+                elif self.p.store_poller:
+                    # 由store统一调度拉取所有数据源的bar
+                    if not self._registered:
+                        self._registered = True
+                        self.store.ohlcv_scheduler.register(self)
+                elif self.p.threaded:
+                    # 由工作线程负责拉取bar,这里只从队列中取数据
+                    if self._poller is None:
+                        self._start_poller()
+                elif time.time() >= self._next_poll_time:
+                    # 按bar的收盘时间来拉取,而不是固定每隔一分钟
+                    self._poll()
                 return self._load_bar()
             elif self._state == self._ST_HISTORBACK:
                 ret = self._load_bar()
@@ -138,26 +254,124 @@ class CCXTFeed(with_metaclass(MetaCCXTFeed, DataBase)):
                         self.put_notification(self.LIVE)
                         continue
 
+    def _start_poller(self):
+        self._poller = threading.Thread(target=self._poll_loop, name='CCXTFeed-%s' % self.p.dataname)
+        self._poller.daemon = True
+        self._poller.start()
+
+    def _poll_loop(self):
+        '''Worker thread body: poll for bars until the feed is stopped'''
+        while not self._stop_event.wait(max(0.0, self._next_poll_time - time.time())):
+            self._background_poll()
+
+    def _background_poll(self):
+        '''Poll from a worker thread, turning failures into data notifications'''
+        try:
+            self._poll()
+        except Exception as e:
+            if self.p.debug:
+                print('{} - {} - Poll failed: {!r}'.format(datetime.now(), self.p.dataname, e))
+            if not self._poll_failed:
+                self._poll_failed = True
+                self.put_notification(self.CONNBROKEN)
+            self._next_poll_time = time.time() + self.p.poll_retry
+        else:
+            if self._poll_failed:
+                self._poll_failed = False
+                self.put_notification(self.LIVE)
+
+    def _subscribe(self):
+        granularity = self.store.get_granularity(self._timeframe, self._compression)
+        self._stream_handle = self.store.stream.subscribe(
+            'watch_ohlcv', (self.p.dataname, granularity), self._on_stream_bars, self._on_stream_error)
+
+    def _on_stream_bars(self, bars):
+        '''Stream thread callback: queue the bars which have closed'''
+        if self._poll_failed:
+            self._poll_failed = False
+            self.put_notification(self.LIVE)
+        for bar in sorted(bars):
+            if None in bar:
+                continue
+            pending = self._stream_pending
+            # 出现了更新的bar,说明之前那根已经收盘
+            if pending is not None and bar[0] > pending[0] and pending[0] > self._last_ts:
+                self._data.put(pending)
+                self._last_ts = pending[0]
+            if pending is None or bar[0] >= pending[0]:
+                self._stream_pending = bar
+
+    def _on_stream_error(self, e):
+        if not self._poll_failed:
+            self._poll_failed = True
+            self.put_notification(self.CONNBROKEN)
+
+    def _poll(self):
+        '''Fetch the latest bars and work out when the next poll is due'''
+        self._update_bar(livemode=True)
+        self._schedule_poll(time.time())
+
+    def _bar_seconds(self):
+        return self.store.resample_plan(self._timeframe, self._compression)[1]
+
+    def _resampled(self):
+        '''Returns (base granularity, bar ms) if the bars are resampled, else None'''
+        granularity, seconds = self.store.resample_plan(self._timeframe, self._compression)
+        if self.store.exchange.parse_timeframe(granularity) == seconds:
+            return None
+        return granularity, seconds * 1000
+
+    def _schedule_poll(self, now):
+        granularity, seconds = self.store.resample_plan(self._timeframe, self._compression)
+        if granularity.endswith(CALENDAR_UNITS):
+            self._next_poll_time = now + self.CALENDAR_POLL
+            return
+        period = seconds * 1000
+        open_ts = bar_start(int(now * 1000), period)  # 周线从周一开始
+        # 下一根bar收盘后稍等片刻再去拉取
+        next_close = (open_ts + period) / 1000.0 + self.p.poll_delay
+        # 刚刚收盘的那根bar的开盘时间戳(毫秒)
+        closed_ts = open_ts - period
+        if self._last_ts >= closed_ts:
+            self._next_poll_time = next_close
+        else:
+            # 交易所还没有生成刚收盘的bar,稍后重试
+            self._next_poll_time = min(now + self.p.poll_retry, next_close)
+
     def _update_bar(self, fromdate=None, livemode=False):
         """Fetch OHLCV data into self._data queue"""
+        resampled = self._resampled()
+        if resampled is not None:
+            return self._update_resampled(fromdate, *resampled)
+        if isinstance(self._data, OHLCVSubscription):
+            return self._update_shared(fromdate)
         #想要获取哪个时间粒度下的bar
         granularity = self.store.get_granularity(self._timeframe, self._compression)
         #从哪个时间点开始获取bar
         if fromdate:
             self._last_ts = self.utc_to_ts(fromdate)
+            if self._cache is not None:
+                self._load_cache(granularity)
+            if self.p.download_workers > 1:
+                if self._download(granularity):
+                    return
         #每次获取bar数目的最高限制
         limit = max(3, self.p.ohlcv_limit) #最少不能少于三个,原因:每次头bar时间重复要忽略,尾bar未完整要去掉,只保留中间的,所以最少三个
+        #断线或休眠后缺了不止一根bar时,一次性分页补齐,而不是每次轮询只补一页
+        catchup = livemode and self._gap(granularity) > 1
         #
+        since = self._last_ts
+        fetched = []
+        recovered = 0
         while True:
-            #先获取数据长度
-            dlen = self._data.qsize()
-            #
             bars = sorted(self.store.fetch_ohlcv(self.p.dataname, timeframe=granularity, since=self._last_ts, limit=limit, params=self.p.fetch_ohlcv_params))
             # Check to see if dropping the latest candle will help with
             # exchanges which return partial data
             if self.p.drop_newest and len(bars) > 0:
                 del bars[-1]
+            fetched.extend(bars)
             #
+            new_bars = []
             for bar in bars:
                 #获取的bar不能有空值
                 if None in bar:
@@ -166,24 +380,163 @@ class CCXTFeed(with_metaclass(MetaCCXTFeed, DataBase)):
                 tstamp = bar[0]
                 #通过时间戳判断bar是否为新的bar
                 if tstamp > self._last_ts:
-                    self._data.put(bar) #将新的bar保存到队列中
+                    new_bars.append(bar)
                     self._last_ts = tstamp
-                    #print(datetime.utcfromtimestamp(tstamp//1000))
-            #如果数据长度没有增长,那证明已经是当前最后一根bar,退出
-            if dlen == self._data.qsize():
+            #将新的bar整页保存到缓冲区中
+            self._data.put_many(new_bars)
+            recovered += len(new_bars)
+            #如果没有新的bar,那证明已经是当前最后一根bar,退出
+            if not new_bars:
                 break
-            #实时模式下,就没必须判断是否是最后一根bar,减少网络通信
-            if livemode:
+            #实时模式下,就没必须判断是否是最后一根bar,减少网络通信,补齐时取到最新收盘的bar为止
+            if livemode and (not catchup or not self._gap(granularity)):
                 break
+        if self._cache is not None:
+            self._write_cache(granularity, fetched, since)
+        if catchup:
+            self._notify_backfill(recovered)
+
+    def _gap(self, granularity):
+        """Number of closed bars missing after _last_ts, 1 when only the bar which just closed is"""
+        period = self.store.exchange.parse_timeframe(granularity) * 1000
+        #月线按30天估算
+        closed_ts = bar_start(int(time.time() * 1000), period) - period
+        return max(0, (closed_ts - self._last_ts) // period)
+
+    def _notify_backfill(self, recovered):
+        """Tell the strategy (notify_data) how many bars a live catch-up recovered"""
+        if self.p.debug:
+            print('{} - {} - Caught up {} missed bars'.format(datetime.now(), self.p.dataname, recovered))
+        self.store.metrics.count('feed_backfilled_bars', recovered, symbol=self.p.dataname)
+        #put_notification会丢弃和上一个状态相同的通知,这里已经是LIVE状态,直接放入队列
+        self.notifs.append((self.LIVE, (), {'backfilled': recovered}))
+
+    def _update_shared(self, fromdate=None):
+        """Have the shared series fetch the bars, this feed reads them after _last_ts"""
+        limit = max(3, self.p.ohlcv_limit)
+        series = self._data.series
+        if fromdate:
+            self._last_ts = self.utc_to_ts(fromdate)
+            self._data.seek(self._last_ts)
+            series.backfill(self._last_ts, limit)
+        elif self._gap(series.granularity) > 1:
+            #按本数据源自己的_last_ts判断断线,缺的bar可能已经被其他数据源补上了
+            series.refresh(self._last_ts, limit, catchup=True)
+            rows = series.rows()
+            self._notify_backfill(len(rows) - int(np.searchsorted(rows[:, 0], self._last_ts, side='right')))
+        else:
+            #其他数据源刚刚拉取过时不再重复请求
+            if series.last_ts is not None:
+                self._last_ts = max(self._last_ts, series.last_ts)
+            series.refresh(self._last_ts, limit, min_interval=self.p.poll_delay)
+        if series.last_ts is not None:
+            self._last_ts = max(self._last_ts, series.last_ts)
+
+    def _update_resampled(self, fromdate, granularity, period):
+        """Queue the bars of ``period`` ms completed by the closed base bars
+
+        A bar is complete once its last base bar is in, or ``poll_retry`` seconds after its end
+        when the exchange has not published it (no trades)
+        """
+        base_period = self.store.exchange.parse_timeframe(granularity) * 1000
+        if fromdate:
+            self._last_ts = self.utc_to_ts(fromdate)
+            self._base = np.empty((0, 6))
+            self._resampled_ts = self._base_ts = None
+        if self._base_ts is None:
+            #和原生时间粒度一样,从fromdate之后开盘的第一根bar开始
+            self._base_ts = bar_start(self._last_ts, period) + period
+        #只取已经收盘的基础bar
+        now = int(time.time() * 1000)
+        until = now // base_period * base_period
+        if self.p.todate:
+            until = min(until, self.utc_to_ts(self.p.todate) + period)
+        if until <= self._base_ts:
+            return
+        base = self.store.shared_ohlcv.bars(self.p.dataname, granularity, self._base_ts, until,
+                                            limit=max(3, self.p.ohlcv_limit), workers=self.p.download_workers,
+                                            params=self.p.fetch_ohlcv_params)
+        if len(base):
+            #只前进到收到的最后一根基础bar之后,迟到的bar下次还会去取
+            self._base_ts = int(base[-1, 0]) + base_period
+        base = np.concatenate((self._base, base))
+        if self._resampled_ts is not None:
+            #超时后已经输出的bar不再接受迟到的基础bar
+            base = base[base[:, 0] >= self._resampled_ts + period]
+        closed_until = min(until, max(self._base_ts, now - int(self.p.poll_retry * 1000)))
+        bars, used = resample_ohlcv(base, period, closed_until=closed_until)
+        self._base = base[used:]
+        if len(bars):
+            self._data.put_many(bars)
+            self._last_ts = self._resampled_ts = int(bars[-1, 0])
+
+    def _fetch_range(self, granularity, since, until):
+        """Fetch the bars with since <= timestamp < until"""
+        downloader = OHLCVDownloader(self.store, self.p.dataname, granularity, max(3, self.p.ohlcv_limit),
+                                     workers=self.p.download_workers, params=self.p.fetch_ohlcv_params,
+                                     progress=self.p.download_progress, debug=self.p.debug)
+        bars = downloader.download(since, until)
+        self.download_stats = downloader.stats
+        return bars
+
+    def _download(self, granularity):
+        """Download the closed bars after _last_ts up to todate in parallel
+
+        Returns True if todate was reached and nothing is left to fetch.
+        """
+        period = self.store.exchange.parse_timeframe(granularity) * 1000
+        #不包括当前还未收盘的bar
+        until = int(time.time() * 1000) // period * period
+        todate = self.utc_to_ts(self.p.todate) if self.p.todate else None
+        if todate is not None:
+            until = min(until, todate + period)
+        since = self._last_ts
+        bars = self._fetch_range(granularity, since, until)
+        new_bars = [bar for bar in bars if bar[0] > since]
+        if new_bars:
+            self._data.put_many(new_bars)
+            self._last_ts = new_bars[-1][0]
+        if self._cache is not None and bars:
+            self._cache.write(*self._cache_key(granularity), bars=bars, start=since, end=bars[-1][0])
+        return self.p.historical and todate is not None and self._last_ts >= todate
+
+    def _cache_key(self, granularity):
+        return self.store.exchange.id, self.p.dataname, granularity
+
+    def _load_cache(self, granularity):
+        """Queue the cached bars after _last_ts, fetching a missing head first"""
+        key = self._cache_key(granularity)
+        start = self._last_ts
+        cov = self._cache.coverage(*key)
+        if cov is None or start > cov[1]:
+            return
+        if start < cov[0]:
+            #缓存之前缺失的部分从交易所获取
+            self._cache.write(*key, bars=self._fetch_range(granularity, start, cov[0]), start=start, end=cov[0])
+        self._data.put_many(self._cache.read(*key, start=start, end=cov[1]))
+        self._last_ts = cov[1]
+
+    def _write_cache(self, granularity, bars, since):
+        """Add the closed bars fetched from since on to the cache"""
+        period = self.store.exchange.parse_timeframe(granularity) * 1000
+        now = time.time() * 1000
+        #只缓存已经收盘的bar
+        bars = [bar for bar in bars if None not in bar and bar[0] >= since and bar[0] + period <= now]
+        if bars:
+            self._cache.write(*self._cache_key(granularity), bars=bars, start=since, end=bars[-1][0])
 
     def _load_bar(self):
         try:
             bar = self._data.get(block=False) #不阻塞
         except queue.Empty:
             return None  # no data in the queue
-        tstamp, open_, high, low, close, volume = bar
-        dtime = datetime.utcfromtimestamp(tstamp // 1000)
-        self.lines.datetime[0] = bt.date2num(dtime)
+        tstamp, open_, high, low, close, volume, dtnum = bar
+        metrics = self.store.metrics
+        if metrics.enabled and self._state == self._ST_LIVE:
+            # 从K线收盘到交给策略的延迟
+            lag = time.time() - (tstamp / 1000.0 + self._bar_seconds())
+            metrics.timing('feed_lag_seconds', max(lag, 0.0), symbol=self.p.dataname)
+        self.lines.datetime[0] = dtnum
         self.lines.open[0] = open_
         self.lines.high[0] = high
         self.lines.low[0] = low
@@ -191,6 +544,34 @@ class CCXTFeed(with_metaclass(MetaCCXTFeed, DataBase)):
         self.lines.volume[0] = volume
         return True
 
+    # Column of each line in the rows of the bar buffer
+    _BUFFER_COLUMNS = {'open': 1, 'high': 2, 'low': 3, 'close': 4, 'volume': 5, 'datetime': 6}
+
+    def preload(self):
+        '''Copy a finished historical download into the lines in bulk'''
+        bulk = (self.p.historical and self._state == self._ST_HISTORBACK and
+                not self._filters and not self._tzinput and
+                all(line.mode == LineBuffer.UnBounded for line in self.lines))
+        if not bulk:
+            return DataBase.preload(self)
+
+        #历史数据在start中已经全部下载到缓冲区,直接整块写入各条line
+        rows = self._data.get_many()
+        dtnums = rows[:, self._BUFFER_COLUMNS['datetime']]
+        rows = rows[(dtnums >= self.fromdate) & (dtnums <= self.todate)]
+        size = len(rows)
+        for name, line in zip(self.lines.getlinealiases(), self.lines):
+            column = self._BUFFER_COLUMNS.get(name)
+            values = rows[:, column] if column is not None else np.full(size, np.nan)
+            line.array.frombytes(np.ascontiguousarray(values).tobytes())
+            line.idx += size
+            line.lencount += size
+
+        self.put_notification(self.DISCONNECTED)
+        self._state = self._ST_OVER
+        self._last()
+        self.home()
+
     def haslivedata(self):
         return self._state == self._ST_LIVE and not self._data.empty()
 
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function, unicode_literals)
+
+import collections
+import threading
+
+
+def split_symbol(symbol):
+    '''Returns (base, quote, settle) of a ccxt symbol, settle is None for spot markets'''
+    pair, _, settle = symbol.partition(':')
+    base, _, quote = pair.partition('/')
+    return base, quote, settle or None
+
+
+class CCXTLedger(object):
+    '''In-memory balances of all currencies of an account.
+
+    Seeded from a ccxt ``fetch_balance`` structure, then kept up to date from
+    the order flow: opening a priced order moves its cost from ``free`` to the
+    reserved funds, each fill moves base and quote (spot markets) and pays its
+    fee, and closing the order releases what is left of the reservation. For
+    contracts only the fees are booked, margin is left to the reconciliation.
+
+    ``reconcile`` replaces the balances with the exchange figures and returns
+    the drift, exchange minus ledger, of every currency which differed.
+    '''
+
+    def __init__(self, balance=None, tolerance=1e-8):
+        self.free = collections.defaultdict(float)
+        self.total = collections.defaultdict(float)
+        self.tolerance = tolerance
+        self._reserved = {}  # order id -> [currency, amount left, amount per unit filled]
+        self.version = 0  # bumped on every change of the totals
+        self._lock = threading.Lock()
+        if balance:
+            self.seed(balance)
+
+    def seed(self, balance):
+        with self._lock:
+            self._seed(balance)
+
+    def _seed(self, balance):
+        self.version += 1
+        self.free.clear()
+        self.total.clear()
+        for currency, amount in (balance.get('free') or {}).items():
+            self.free[currency] = amount or 0.0
+        for currency, amount in (balance.get('total') or {}).items():
+            self.total[currency] = amount or 0.0
+
+    def open_order(self, oid, symbol, side, amount, price):
+        '''Reserve the funds of a new order, market orders (no price) are booked on fill only'''
+        base, quote, settle = split_symbol(symbol)
+        if price is None or settle is not None:
+            return
+        currency, per_unit = (quote, price) if side == 'buy' else (base, 1.0)
+        with self._lock:
+            self.free[currency] -= amount * per_unit
+            self._reserved[oid] = [currency, amount * per_unit, per_unit]
+
+    def fill(self, oid, symbol, side, amount, price, fee=None):
+        '''Book a fill of ``amount`` at ``price`` and its ccxt ``fee`` structure'''
+        base, quote, settle = split_symbol(symbol)
+        with self._lock:
+            reserved = self._reserved.get(oid)
+            if reserved is not None:
+                released = min(reserved[1], amount * reserved[2])
+                reserved[1] -= released
+                self.free[reserved[0]] += released
+            self.version += 1
+            if settle is None:
+                sign = 1 if side == 'buy' else -1
+                for currency, delta in ((base, sign * amount), (quote, -sign * amount * price)):
+                    self.free[currency] += delta
+                    self.total[currency] += delta
+            self._pay_fee(fee)
+
+    def pay_fee(self, fee):
+        '''Book a ccxt ``fee`` structure on its own'''
+        with self._lock:
+            self._pay_fee(fee)
+
+    def _pay_fee(self, fee):
+        if fee and fee.get('cost') and fee.get('currency'):
+            self.version += 1
+            self.free[fee['currency']] -= fee['cost']
+            self.total[fee['currency']] -= fee['cost']
+
+    def close_order(self, oid):
+        '''Release the funds still reserved for a closed or cancelled order'''
+        with self._lock:
+            reserved = self._reserved.pop(oid, None)
+            if reserved is not None:
+                self.free[reserved[0]] += reserved[1]
+
+    def reconcile(self, balance):
+        '''Reset to the exchange ``balance``, returns {currency: drift} of the currencies which differed'''
+        with self._lock:
+            exchange_total = balance.get('total') or {}
+            drift = {}
+            for currency in set(self.total) | set(exchange_total):
+                delta = (exchange_total.get(currency) or 0.0) - self.total.get(currency, 0.0)
+                if abs(delta) > self.tolerance:
+                    drift[currency] = delta
+            self._seed(balance)
+            return drift
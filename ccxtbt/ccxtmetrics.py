@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function, unicode_literals)
+
+import bisect
+import collections
+import os
+import socket
+import tempfile
+import threading
+import time
+
+
+class NullMetrics(object):
+    '''Metrics collector which records nothing, used when metrics are disabled
+
+    Instrumented code checks ``enabled`` before taking any timing, so the cost
+    of disabled metrics is one attribute lookup.
+    '''
+
+    enabled = False
+
+    def count(self, name, value=1, **labels):
+        pass
+
+    def gauge(self, name, value, **labels):
+        pass
+
+    def timing(self, name, seconds, **labels):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+class Metrics(NullMetrics):
+    '''Hands every measure to its sinks.
+
+    Three kinds of measures are recorded: counters (``count``), gauges
+    (``gauge``) and durations in seconds (``timing``), each with a name and
+    optional labels, e.g. ``timing('store_call_seconds', 0.2, method='fetch_order')``.
+    '''
+
+    enabled = True
+
+    def __init__(self, *sinks):
+        self.sinks = list(sinks)
+
+    def count(self, name, value=1, **labels):
+        for sink in self.sinks:
+            sink.count(name, value, labels)
+
+    def gauge(self, name, value, **labels):
+        for sink in self.sinks:
+            sink.gauge(name, value, labels)
+
+    def timing(self, name, seconds, **labels):
+        for sink in self.sinks:
+            sink.timing(name, seconds, labels)
+
+
+class MemorySink(object):
+    '''Aggregates the measures in memory, durations into histograms with ``buckets`` upper bounds'''
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counters = collections.defaultdict(float)  # (name, labels) -> value
+        self.gauges = {}  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def count(self, name, value, labels):
+        with self._lock:
+            self.counters[self._key(name, labels)] += value
+
+    def gauge(self, name, value, labels):
+        with self._lock:
+            self.gauges[self._key(name, labels)] = value
+
+    def timing(self, name, seconds, labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * len(self.buckets) + [0.0, 0]
+            index = bisect.bisect_left(self.buckets, seconds)
+            if index < len(self.buckets):  # 超过最大上限的只计入+Inf
+                histogram[index] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+
+    def snapshot(self):
+        '''Returns {'counters': ..., 'gauges': ..., 'histograms': ...} keyed by (name, labels)'''
+        with self._lock:
+            return {'counters': dict(self.counters), 'gauges': dict(self.gauges),
+                    'histograms': dict((k, list(v)) for k, v in self.histograms.items())}
+
+
+class PrometheusFileSink(MemorySink):
+    '''Aggregates in memory and writes the Prometheus text format to ``path``
+
+    The file is rewritten (atomically) at most every ``interval`` seconds, as
+    measures come in, and on ``flush``. Point the node exporter textfile
+    collector at its folder. Metric names get the ``prefix``.
+
+    Like the other sinks it never raises: a file which cannot be written is
+    skipped and tried again at the next interval.
+    '''
+
+    def __init__(self, path, interval=15.0, prefix='ccxtbt', buckets=MemorySink.BUCKETS):
+        super(PrometheusFileSink, self).__init__(buckets)
+        self.path = path
+        self.interval = interval
+        self.prefix = prefix
+        self._written = 0.0
+        self._flush_lock = threading.Lock()
+
+    def count(self, name, value, labels):
+        super(PrometheusFileSink, self).count(name, value, labels)
+        self._maybe_flush()
+
+    def gauge(self, name, value, labels):
+        super(PrometheusFileSink, self).gauge(name, value, labels)
+        self._maybe_flush()
+
+    def timing(self, name, seconds, labels):
+        super(PrometheusFileSink, self).timing(name, seconds, labels)
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        # 其他线程正在写文件时不必等待
+        if not self._flush_lock.acquire(False):
+            return
+        try:
+            if time.time() - self._written >= self.interval:
+                self._write()
+        finally:
+            self._flush_lock.release()
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        items = list(labels) + list(extra)
+        if not items:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                              for k, v in items) + '}'
+
+    def render(self):
+        '''Returns the metrics in the Prometheus text exposition format'''
+        snapshot = self.snapshot()
+        lines = []
+        for kind, suffix, values in (('counter', '_total', snapshot['counters']), ('gauge', '', snapshot['gauges'])):
+            for name in sorted(set(k[0] for k in values)):
+                metric = '{}_{}{}'.format(self.prefix, name, suffix)
+                lines.append('# TYPE {} {}'.format(metric, kind))
+                for (n, labels), value in sorted(values.items()):
+                    if n == name:
+                        lines.append('{}{} {}'.format(metric, self._labels(labels), value))
+        histograms = snapshot['histograms']
+        for name in sorted(set(k[0] for k in histograms)):
+            metric = '{}_{}'.format(self.prefix, name)
+            lines.append('# TYPE {} histogram'.format(metric))
+            for (n, labels), histogram in sorted(histograms.items()):
+                if n != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets, histogram):
+                    cumulative += count
+                    lines.append('{}_bucket{} {}'.format(metric, self._labels(labels, [('le', bound)]), cumulative))
+                lines.append('{}_bucket{} {}'.format(metric, self._labels(labels, [('le', '+Inf')]), histogram[-1]))
+                lines.append('{}_sum{} {}'.format(metric, self._labels(labels), histogram[-2]))
+                lines.append('{}_count{} {}'.format(metric, self._labels(labels), histogram[-1]))
+        return '\n'.join(lines) + '\n'
+
+    def flush(self):
+        with self._flush_lock:
+            self._write()
+
+    def _write(self):
+        self._written = time.time()
+        folder, name = os.path.split(os.path.abspath(self.path))
+        tmp_path = None
+        try:
+            # 同一目录下的唯一临时文件,os.replace才是原子的
+            fd, tmp_path = tempfile.mkstemp(prefix=name + '.', suffix='.tmp', dir=folder)
+            with os.fdopen(fd, 'w') as f:
+                f.write(self.render())
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self.path)
+        except (IOError, OSError):
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+class StatsDSink(object):
+    '''Sends every measure as a StatsD UDP datagram, labels as DogStatsD tags
+
+    Sending is fire and forget: errors (no listener...) are ignored.
+    '''
+
+    def __init__(self, host='127.0.0.1', port=8125, prefix='ccxtbt'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def _send(self, name, value, kind, labels):
+        packet = '{}.{}:{}|{}'.format(self.prefix, name, value, kind)
+        if labels:
+            packet += '|#' + ','.join('{}:{}'.format(k, v) for k, v in sorted(labels.items()))
+        try:
+            self._socket.sendto(packet.encode(), self.address)
+        except (IOError, OSError):
+            pass
+
+    def count(self, name, value, labels):
+        self._send(name, value, 'c', labels)
+
+    def gauge(self, name, value, labels):
+        self._send(name, value, 'g', labels)
+
+    def timing(self, name, seconds, labels):
+        self._send(name, round(seconds * 1000.0, 3), 'ms', labels)
@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function, unicode_literals)
+
+import copy
+import itertools
+import threading
+from datetime import datetime
+
+import numpy as np
+from backtrader.utils.py3 import string_types
+from ccxt import Exchange
+from ccxt.base.errors import InvalidOrder, OrderNotFound
+
+from .ccxtledger import split_symbol
+from .ohlcvcache import OHLCVCache
+
+
+class SimulatedExchange(object):
+    '''Replays history behind the ccxt calls made by CCXTStore.
+
+    Pass an instance as the store ``exchange`` to run CCXTBroker (and the
+    feeds) against history: orders go through the same submit, poll and fill
+    code as live trading, without network and at backtest speed.
+
+    Orders are matched against the bars of ``timeframe``, taken from the
+    ``ohlcv`` dict ({symbol: (N, 6) array or list of bars}) or from an
+    ``OHLCVCache`` (``cache``, an instance or a folder, with the bars cached
+    under ``cache_exchange``). An order becomes active ``latency`` ms after
+    the ``created`` timestamp CCXTBroker puts in the order params (the time
+    of the bar it was placed on) and can fill on the bars after it:
+
+        market: at the open of the first bar
+        limit: at the open if it is better than the limit, else at the limit
+            price when the bar trades through it
+        stop: at the open if it is past the stop, else at the stop price when
+            the bar reaches it
+
+    Fills pay ``fees['taker']`` (at the open) or ``fees['maker']`` (at the
+    limit price) in the quote currency and move the simulated ``balance``.
+    The simulated time of each symbol only moves forward through ``advance``,
+    which CCXTBroker calls with the datetime of the feeds of its open orders,
+    so no bar after the current one is ever used.
+    '''
+
+    id = 'simulated'
+    name = 'Simulated'
+    simulated = True
+    rateLimit = 0
+    has = {'fetchOHLCV': True, 'fetchOrder': True, 'fetchOpenOrders': True, 'fetchClosedOrders': True,
+           'createOrders': True, 'fetchTickers': False}
+    timeframes = {'1m': '1m', '3m': '3m', '5m': '5m', '15m': '15m', '30m': '30m', '1h': '1h', '2h': '2h',
+                  '4h': '4h', '6h': '6h', '8h': '8h', '12h': '12h', '1d': '1d', '1w': '1w'}
+
+    parse_timeframe = staticmethod(Exchange.parse_timeframe)
+
+    def __init__(self, config=None):
+        config = dict(config or {})
+        self.timeframe = config.get('timeframe', '1m')
+        self.latency = config.get('latency', 0)
+        self.fees = dict({'maker': 0.001, 'taker': 0.001}, **config.get('fees', {}))
+        cache = config.get('cache')
+        self.cache = OHLCVCache(cache) if isinstance(cache, string_types) else cache
+        self.cache_exchange = config.get('cache_exchange')
+        balance = config.get('balance', {})
+        self.balance = {'free': dict(balance), 'used': {}, 'total': dict(balance)}
+        self.markets = {}
+        self.currencies = {}
+        self.orders = {}
+        self._open = {}  # symbol -> {order id: order}
+        self._bars = {}  # symbol -> (N, 6) array of the matching timeframe
+        self._clock = {}  # symbol -> current simulated time (ms)
+        self._ids = itertools.count(1)
+        self._trade_ids = itertools.count(1)
+        self._lock = threading.RLock()
+        for symbol, bars in (config.get('ohlcv') or {}).items():
+            self.add_bars(symbol, bars)
+
+    def set_sandbox_mode(self, enabled):
+        pass
+
+    # Market data
+
+    def add_bars(self, symbol, bars):
+        '''Set the ``timeframe`` bars of ``symbol`` (timestamp, open, high, low, close, volume)'''
+        bars = np.asarray(bars, dtype=np.float64).reshape(-1, 6)
+        self._bars[symbol] = bars[np.argsort(bars[:, 0], kind='stable')]
+        self.markets[symbol] = {'symbol': symbol, 'precision': {}, 'limits': {}}
+
+    def bars(self, symbol, timeframe=None):
+        timeframe = timeframe or self.timeframe
+        if timeframe == self.timeframe and symbol in self._bars:
+            return self._bars[symbol]
+        if self.cache is None:
+            return np.empty((0, 6))
+        bars = np.asarray(self.cache.load(self.cache_exchange, symbol, timeframe))
+        if timeframe == self.timeframe:
+            self._bars[symbol] = bars
+        return bars
+
+    def advance(self, symbol, timestamp):
+        '''Move the simulated time of ``symbol`` forward to ``timestamp`` (ms)'''
+        with self._lock:
+            if timestamp > self._clock.get(symbol, 0):
+                self._clock[symbol] = timestamp
+
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=None, params={}):
+        bars = self.bars(symbol, timeframe)
+        start = 0 if since is None else np.searchsorted(bars[:, 0], since, side='left')
+        end = len(bars) if not limit else start + limit
+        return bars[start:end].tolist()
+
+    def load_markets(self, reload=False, params={}):
+        return self.markets
+
+    def set_markets(self, markets, currencies=None):
+        self.markets = markets
+
+    def amount_to_precision(self, symbol, amount):
+        return repr(float(amount))
+
+    def price_to_precision(self, symbol, price):
+        return repr(float(price))
+
+    # Orders
+
+    def create_order(self, symbol, type, side, amount, price=None, params={}):
+        if type not in ('market', 'limit', 'stop'):
+            raise InvalidOrder('{} does not simulate {} orders'.format(self.id, type))
+        if type != 'market' and price is None:
+            raise InvalidOrder('{} {} order without a price'.format(self.id, type))
+        with self._lock:
+            created = params.get('created', self._clock.get(symbol, 0))
+            self.advance(symbol, created)
+            oid = str(next(self._ids))
+            order = {'id': oid, 'clientOrderId': params.get('clientOrderId'), 'timestamp': created,
+                     'datetime': self._iso(created), 'lastTradeTimestamp': None, 'symbol': symbol, 'type': type,
+                     'side': side, 'amount': amount, 'price': price, 'status': 'open', 'filled': 0.0,
+                     'remaining': amount, 'average': None, 'cost': 0.0, 'fee': None, 'trades': [],
+                     'active_from': created + self.latency}
+            self.orders[oid] = order
+            self._open.setdefault(symbol, {})[oid] = order
+            return self._public(order)
+
+    def create_orders(self, orders, params={}):
+        return [self.create_order(o['symbol'], o['type'], o['side'], o['amount'], o.get('price'),
+                                  o.get('params', {})) for o in orders]
+
+    def cancel_order(self, id, symbol=None, params={}):
+        with self._lock:
+            order = self._order(id)
+            self._match(order['symbol'])
+            if order['status'] == 'open':
+                order['status'] = 'canceled'
+                self._open[order['symbol']].pop(id, None)
+            return self._public(order)
+
+    def fetch_order(self, id, symbol=None, params={}):
+        with self._lock:
+            order = self._order(id)
+            self._match(order['symbol'])
+            return self._public(order)
+
+    def fetch_open_orders(self, symbol=None, since=None, limit=None, params={}):
+        return self._fetch_orders(symbol, ('open',))
+
+    def fetch_closed_orders(self, symbol=None, since=None, limit=None, params={}):
+        return self._fetch_orders(symbol, ('closed', 'canceled'), since)
+
+    def fetch_balance(self, params=None):
+        with self._lock:
+            return copy.deepcopy(self.balance)
+
+    def _fetch_orders(self, symbol, statuses, since=None):
+        with self._lock:
+            symbols = [symbol] if symbol is not None else list(self._open)
+            for s in symbols:
+                self._match(s)
+            if statuses == ('open',):
+                orders = [o for s in symbols for o in self._open.get(s, {}).values()]
+            else:
+                orders = [o for o in self.orders.values() if o['status'] in statuses and
+                          (symbol is None or o['symbol'] == symbol) and (since is None or o['timestamp'] >= since)]
+            return [self._public(o) for o in orders]
+
+    def _order(self, id):
+        try:
+            return self.orders[id]
+        except KeyError:
+            raise OrderNotFound('{} order {} not found'.format(self.id, id))
+
+    @staticmethod
+    def _public(order):
+        order = dict(order, trades=[dict(t) for t in order['trades']])
+        del order['active_from']
+        return order
+
+    @staticmethod
+    def _iso(timestamp):
+        return datetime.utcfromtimestamp(timestamp / 1000.0).isoformat() + 'Z'
+
+    # Matching
+
+    def _match(self, symbol):
+        '''Fill the open orders of ``symbol`` on the bars up to its simulated time'''
+        open_orders = self._open.get(symbol)
+        if not open_orders:
+            return
+        bars = self.bars(symbol)
+        if not len(bars):
+            return
+        clock = self._clock.get(symbol, 0)
+        ts = bars[:, 0]
+        end = np.searchsorted(ts, clock, side='right')
+        for oid, order in list(open_orders.items()):
+            # 只用下单那根bar之后的bar撮合
+            start = np.searchsorted(ts, max(order['timestamp'] + 1, order['active_from']), side='left')
+            if start >= end:
+                continue
+            fill = self._first_fill(order, bars[start:end])
+            if fill is not None:
+                self._fill(order, *fill)
+                del open_orders[oid]
+
+    @staticmethod
+    def _first_fill(order, bars):
+        '''Returns (timestamp, price, maker) of the first bar of ``bars`` filling ``order``, None if none does'''
+        opens, highs, lows = bars[:, 1], bars[:, 2], bars[:, 3]
+        price, buy = order['price'], order['side'] == 'buy'
+        if order['type'] == 'market':
+            return bars[0, 0], float(opens[0]), False
+        if order['type'] == 'limit':
+            hit = lows <= price if buy else highs >= price
+            at_open = opens <= price if buy else opens >= price
+        else:  # stop
+            hit = highs >= price if buy else lows <= price
+            at_open = opens >= price if buy else opens <= price
+        index = np.argmax(hit)
+        if not hit[index]:
+            return None
+        if at_open[index]:
+            return bars[index, 0], float(opens[index]), False
+        return bars[index, 0], price, order['type'] == 'limit'
+
+    def _fill(self, order, timestamp, price, maker):
+        amount = order['amount']
+        cost = amount * price
+        base, quote, settle = split_symbol(order['symbol'])
+        fee = {'cost': cost * self.fees['maker' if maker else 'taker'], 'currency': settle or quote}
+        trade = {'id': str(next(self._trade_ids)), 'order': order['id'], 'timestamp': int(timestamp),
+                 'datetime': self._iso(timestamp), 'symbol': order['symbol'], 'side': order['side'],
+                 'type': order['type'], 'takerOrMaker': 'maker' if maker else 'taker', 'amount': amount,
+                 'price': price, 'cost': cost, 'fee': fee}
+        order.update(status='closed', filled=amount, remaining=0.0, average=price, cost=cost, fee=dict(fee),
+                     lastTradeTimestamp=int(timestamp))
+        order['trades'].append(trade)
+        if settle is None:
+            sign = 1 if order['side'] == 'buy' else -1
+            self._move(base, sign * amount)
+            self._move(quote, -sign * cost)
+        self._move(fee['currency'], -fee['cost'])
+
+    def _move(self, currency, delta):
+        for key in ('free', 'total'):
+            self.balance[key][currency] = self.balance[key].get(currency, 0.0) + delta
@@ -20,32 +20,182 @@
 ###############################################################################
 from __future__ import (absolute_import, division, print_function, unicode_literals)
 
+import collections
+import json
+import os
+import random
+import threading
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from functools import wraps
 
 import backtrader as bt
 import ccxt
 from backtrader.metabase import MetaParams
-from backtrader.utils.py3 import with_metaclass
-from ccxt.base.errors import NetworkError, ExchangeError
-
-
-class MetaSingleton(MetaParams):
-    '''Metaclass to make a metaclassed class a singleton'''
+from backtrader.utils.py3 import string_types, with_metaclass
+from ccxt.base.errors import (ArgumentsRequired, AuthenticationError, BadRequest, DDoSProtection, DuplicateOrderId,
+                              ExchangeError, InsufficientFunds, InvalidOrder, NetworkError, NotSupported,
+                              OperationRejected, OrderNotFound, RateLimitExceeded)
+
+from .ccxtmetrics import NULL_METRICS
+from .ccxtstream import CCXTStream
+from .ohlcvhub import OHLCVHub
+from .ohlcvresample import CALENDAR_UNITS, TIMEFRAME_SECONDS, SharedOHLCV
+
+# 永久性错误,重试也不会成功,直接抛出
+PERMANENT_ERRORS = (AuthenticationError, InsufficientFunds, InvalidOrder, BadRequest, ArgumentsRequired,
+                    NotSupported, OperationRejected)
+# 交易所限流,所有线程一起退避
+THROTTLE_ERRORS = (DDoSProtection, RateLimitExceeded)
+# 有的交易所刚下的订单会短暂查不到(例如Binance -2013),查询和撤单时仍然重试
+NOT_FOUND_RETRIED = ('fetch_order', 'cancel_order')
+
+
+class MetaStoreRegistry(MetaParams):
+    '''Metaclass pooling one instance per (exchange, account, sandbox) key.
+
+    Asking for a store whose key already has one returns that instance, so
+    every feed and broker of an account shares its ccxt exchange (and HTTP
+    session), rate limiter and schedulers, while several exchanges and
+    sub-accounts can live in one process. The account is the ``apiKey`` (or
+    ``uid``) of the config. Called without an exchange, the last requested
+    store is returned.
+    '''
 
     def __init__(cls, name, bases, dct):
-        super(MetaSingleton, cls).__init__(name, bases, dct)
-        cls._singleton = None
+        super(MetaStoreRegistry, cls).__init__(name, bases, dct)
+        cls._stores = {}
+        cls._last_store = None
+        cls._registry_lock = threading.Lock()
 
     def __call__(cls, *args, **kwargs):
-        if cls._singleton is None:
-            cls._singleton = (super(MetaSingleton, cls).__call__(*args, **kwargs))
-
-        return cls._singleton
+        if not args and 'exchange' not in kwargs:
+            if cls._last_store is None:
+                raise TypeError('No %s has been created yet' % cls.__name__)
+            return cls._last_store
+
+        key = cls.store_key(*args, **kwargs)
+        with cls._registry_lock:
+            store = cls._stores.get(key)
+            if store is None:
+                store = super(MetaStoreRegistry, cls).__call__(*args, **kwargs)
+                cls._stores[key] = store
+            cls._last_store = store
+        return store
+
+    def store_key(cls, exchange, currency=None, config=None, *args, **kwargs):
+        '''Returns the registry key of the store built from these arguments'''
+        config = config or {}
+        account = config.get('apiKey') or config.get('uid')
+        sandbox = kwargs.get('sandbox', args[2] if len(args) > 2 else False)
+        return exchange, account, bool(sandbox)
+
+    def clear_registry(cls):
+        '''Forget all pooled stores, the next request creates a new one'''
+        with cls._registry_lock:
+            cls._stores.clear()
+            cls._last_store = None
+
+
+class RateLimiter(object):
+    '''Token bucket shared by every exchange call made through the store.
+
+    The bucket refills at ``rate`` tokens per second up to ``capacity``
+    tokens. Each call takes the weight of its endpoint (``1`` when the
+    endpoint is not in ``weights``) and only sleeps once the bucket has run
+    dry, so calls made after a quiet period go out immediately. The bucket is
+    shared between threads: callers reserve their tokens under the lock and
+    sleep off the deficit outside it. ``pause`` holds every caller back, e.g.
+    after the exchange reported it is throttling us.
+    '''
 
+    def __init__(self, rate, capacity=1, weights=None):
+        self.rate = rate  # tokens per second, None for no limit
+        self.capacity = capacity
+        self.weights = weights or {}
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def pause(self, seconds):
+        '''No call goes out for the next ``seconds`` seconds'''
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def acquire(self, endpoint):
+        '''Take the tokens for one call to ``endpoint``, returns seconds slept'''
+        weight = self.weights.get(endpoint, 1)
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._paused_until - now)
+            if self.rate:
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                self._tokens -= weight
+                wait = max(wait, -self._tokens / self.rate if self._tokens < 0 else 0.0)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class OHLCVScheduler(object):
+    '''Refreshes the live bars of all registered feeds in coordinated cycles.
+
+    Every feed keeps its own next poll time, aligned to its bar closes. The
+    scheduler thread sleeps until the earliest one, refreshes every feed that
+    is due in a bounded thread pool and goes back to sleep. The thread only
+    runs while feeds are registered.
+    '''
 
-class CCXTStore(with_metaclass(MetaSingleton, object)):
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self._feeds = {}  # id(feed) -> feed, lines objects overload ==
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pool = None
+
+    def register(self, feed):
+        with self._lock:
+            self._feeds[id(feed)] = feed
+            if self._thread is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers)
+                self._thread = threading.Thread(target=self._run, name='CCXTStore-OHLCV')
+                self._thread.daemon = True
+                self._thread.start()
+        self._wakeup.set()
+
+    def unregister(self, feed):
+        with self._lock:
+            self._feeds.pop(id(feed), None)
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.clear()
+            with self._lock:
+                if not self._feeds:
+                    # 没有数据源了,线程退出,下次注册时再启动
+                    self._pool.shutdown(wait=False)
+                    self._thread = self._pool = None
+                    return
+                feeds = list(self._feeds.values())
+                pool = self._pool
+
+            now = time.time()
+            due = [feed for feed in feeds if feed._next_poll_time <= now]
+            if due:
+                # 一个周期内并发刷新所有到期的数据源,等待全部完成后再进入下一周期
+                list(pool.map(lambda feed: feed._background_poll(), due))
+            else:
+                self._wakeup.wait(min(feed._next_poll_time for feed in feeds) - now)
+
+
+class CCXTStore(with_metaclass(MetaStoreRegistry, object)):
     '''API provider for CCXT feed and broker classes.
 
     Added a new get_wallet_balance method. This will allow manual checking of the balance.
@@ -53,6 +203,61 @@ class CCXTStore(with_metaclass(MetaSingleton, object)):
 
     Added new private_end_point method to allow using any private non-unified end point
 
+    The store is no longer a process wide singleton. Stores are pooled per (exchange, account,
+        sandbox), see MetaStoreRegistry, so one process can trade several exchanges and sub-accounts.
+        The first arguments given for a key win. getdata()/getbroker() bind to the store they are
+        called on
+
+    Replaced the fixed rate limit sleep before every call with a shared token bucket. Calls only
+        wait once the budget derived from the exchange ``rateLimit`` is used up. The budget can hold
+        ``rate_limit_burst`` calls and ``rate_limit_weights`` maps method names to their weight, e.g.
+        for Binance: {'fetch_order': 2, 'fetch_open_orders': 3, 'fetch_balance': 10}
+        Failed attempts are retried after an exponential backoff with full jitter, starting at
+        ``retry_backoff`` seconds and capped at ``retry_backoff_max`` seconds
+
+    Retries depend on the error class. Permanent errors (PERMANENT_ERRORS: insufficient funds,
+        invalid order, order not found, authentication, bad request...) are raised at once, except
+        order not found for fetch_order and cancel_order (NOT_FOUND_RETRIED) as some exchanges
+        briefly miss the orders just placed.
+        Throttling errors (DDoSProtection, RateLimitExceeded) pause the rate limiter for all
+        threads, ``throttle_backoff`` seconds doubling on every attempt. create_order is never
+        resent blindly after an ambiguous failure (timeout, lost connection) as the order may
+        have been placed: with a client order id (``params['clientOrderId']``, or generated for
+        every order with ``idempotent_orders=True``) the open and closed orders are searched for
+        it first, without one the error is raised
+
+    ``metrics`` takes a Metrics collector (see ccxtmetrics) with the sinks to report to. Every
+        exchange call made through the store records its count, latency, errors, retries and
+        rate limiter sleep, the feeds record their lag and the broker its poll cycles. Without
+        it nothing is measured
+
+    Added an optional streaming backend. With ``stream=True`` the store builds the ccxt.pro version
+        of the exchange, or ``stream`` can be any ccxt.pro compatible exchange instance. Feeds created
+        with ``streaming=True`` then receive bars from watch_ohlcv and the broker receives order updates
+        from watch_orders/watch_my_trades instead of polling
+
+    Time frames the exchange does not offer (2m, 10m, 90m...) are resampled by the feeds from the
+        finest exchange granularity dividing them, see resample_plan(). The base bars are downloaded
+        once per symbol into ``shared_ohlcv`` for all the feeds of that symbol
+
+    Feeds created with ``shared=True`` subscribe to the ``ohlcv_hub``: the feeds of the same symbol
+        and granularity share one fetch of each bar and one buffer of bars
+
+    Added an OHLCV scheduler. Feeds created with ``store_poller=True`` register with it and are
+        refreshed together in one cycle by a thread pool of at most ``ohlcv_workers`` threads
+
+    Markets are loaded once, on first use, with load_markets(). With ``markets_cache`` set to a
+        folder they are also saved there and reused by later runs for ``markets_ttl`` seconds
+
+    With credentials the account balance is fetched at start-up. ``balance_fetch`` picks when:
+        'startup' (default): in the constructor, as before
+        'background': in a thread, so feeds can start backfilling right away
+        'deferred': on first use by the broker (its first next() call)
+    The time spent in each start-up phase (exchange construction, balance, markets, feed backfills)
+        is kept in ``startup_profile`` and printed with ``profile=True``. Note that ``import ccxt``
+        loads every exchange module of the library whatever exchange is used (about 0.3s), see
+        ``python -X importtime``
+
     '''
 
     # Supported granularities
@@ -82,35 +287,133 @@ class CCXTStore(with_metaclass(MetaSingleton, object)):
 
     BrokerCls = None  # broker class will auto register
     DataCls = None  # data class will auto register
-
-    @classmethod
-    def getdata(cls, *args, **kwargs):
-        '''Returns ``DataCls`` with args, kwargs'''
-        return cls.DataCls(*args, **kwargs)
-
-    @classmethod
-    def getbroker(cls, *args, **kwargs):
-        '''Returns broker with *args, **kwargs from registered ``BrokerCls``'''
-        return cls.BrokerCls(*args, **kwargs)
-
-    def __init__(self, exchange, currency, config, retries, debug=False, sandbox=False):
-        self.exchange = getattr(ccxt, exchange)(config)
-        if sandbox:
-            self.exchange.set_sandbox_mode(True)
+    TradeDataCls = None  # trade data class will auto register
+
+    def getdata(self, *args, **kwargs):
+        '''Returns ``DataCls`` with args, kwargs, bound to this store'''
+        kwargs.setdefault('store', self)
+        return self.DataCls(*args, **kwargs)
+
+    def gettradedata(self, *args, **kwargs):
+        '''Returns ``TradeDataCls`` (bars aggregated from trades) with args, kwargs, bound to this store'''
+        kwargs.setdefault('store', self)
+        return self.TradeDataCls(*args, **kwargs)
+
+    def getbroker(self, *args, **kwargs):
+        '''Returns broker with *args, **kwargs from registered ``BrokerCls``, bound to this store'''
+        kwargs.setdefault('store', self)
+        return self.BrokerCls(*args, **kwargs)
+
+    def __init__(self, exchange, currency, config, retries, debug=False, sandbox=False, ohlcv_workers=4,
+                 rate_limit_burst=1, rate_limit_weights=None, retry_backoff=0.5, retry_backoff_max=30.0,
+                 stream=None, markets_cache=None, markets_ttl=86400, balance_fetch='startup', profile=False,
+                 throttle_backoff=5.0, idempotent_orders=False, metrics=None):
+        self.debug = debug
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        self.profile = profile
+        self.startup_profile = collections.OrderedDict()  # phase -> seconds
+        with self.profiled('exchange'):
+            # 也可以直接传入交易所实例,例如回测用的SimulatedExchange
+            self.exchange = getattr(ccxt, exchange)(config) if isinstance(exchange, string_types) else exchange
+            if sandbox:
+                self.exchange.set_sandbox_mode(True)
+        if stream is True:
+            with self.profiled('stream exchange'):
+                from ccxt import pro
+                stream = getattr(pro, exchange)(config)
+                if sandbox:
+                    stream.set_sandbox_mode(True)
+        self.stream = CCXTStream(stream, debug=debug) if stream else None
         self.currency = currency
         self.retries = retries
-        self.debug = debug
-        balance = self.exchange.fetch_balance() if 'secret' in config else 0
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self.throttle_backoff = throttle_backoff
+        self.idempotent_orders = idempotent_orders
+        rate = 1000.0 / self.exchange.rateLimit if self.exchange.rateLimit else None
+        self.rate_limiter = RateLimiter(rate, rate_limit_burst, rate_limit_weights)
+        self.ohlcv_scheduler = OHLCVScheduler(ohlcv_workers)
+        self.shared_ohlcv = SharedOHLCV(self)  # base bars of the resampling feeds
+        self.ohlcv_hub = OHLCVHub(self)  # bars of the feeds created with shared=True
+        self.feeds = []  # running feeds, their last close prices the broker's valuation
+        self.sandbox = sandbox
+        self.markets_cache = markets_cache
+        self.markets_ttl = markets_ttl
+        self._markets_lock = threading.Lock()
+
+        self._balance = None  # 完整的账户余额,供broker的账本初始化
+        self._cash = 0
+        self._value = 0
+        self.balance_fetch = balance_fetch
+        self._balance_ready = threading.Event()
+        self._balance_lock = threading.Lock()
+        self._balance_thread = None
+        if 'secret' not in config and not getattr(self.exchange, 'simulated', False):
+            self._balance_ready.set()  # 没有密钥,没有余额可取
+        elif balance_fetch == 'startup':
+            self._fetch_initial_balance()
+        elif balance_fetch == 'background':
+            self._balance_thread = threading.Thread(target=self._background_balance, name='CCXTStoreBalance')
+            self._balance_thread.daemon = True
+            self._balance_thread.start()
+        # 'deferred': 第一次调用initial_balance()时再获取
+
+    @contextmanager
+    def profiled(self, phase):
+        '''Time a start-up phase into ``startup_profile``, printed as it ends with ``profile=True``'''
+        started = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - started
+            self.startup_profile[phase] = elapsed
+            if self.profile:
+                print('{} - Startup profile - {}: {:.3f}s'.format(datetime.now(), phase, elapsed))
+
+    def _fetch_initial_balance(self):
+        with self.profiled('balance'):
+            balance = self.exchange.fetch_balance()
+        self._set_balance(balance)
+        self._balance_ready.set()
+
+    def _background_balance(self):
+        try:
+            self._fetch_initial_balance()
+        except Exception as e:
+            # 失败时由下一次initial_balance()调用同步重试
+            if self.debug:
+                print('{} - Background balance fetch failed: {!r}'.format(datetime.now(), e))
+        finally:
+            self._balance_thread = None
+
+    def _set_balance(self, balance):
+        self._balance = balance
+        cash = balance['free'].get(self.currency)
+        value = balance['total'].get(self.currency)
+        # Fix if None is returned
+        self._cash = cash if cash else 0
+        self._value = value if value else 0
 
-        if balance == 0 or not balance['free'][currency]:
-            self._cash = 0
-        else:
-            self._cash = balance['free'][currency]
+    def balance_ready(self):
+        '''True once the start-up balance is known (or there are no credentials to fetch it with)'''
+        return self._balance_ready.is_set()
 
-        if balance == 0 or not balance['total'][currency]:
-            self._value = 0
-        else:
-            self._value = balance['total'][currency]
+    def initial_balance(self, wait=True):
+        '''Returns the balance fetched at start-up, None without credentials
+
+        With ``balance_fetch='background'`` this waits for the background fetch, with
+        ``'deferred'`` (or after a failed background fetch) the balance is fetched now.
+        With ``wait=False`` it never blocks and returns None while the balance is unknown
+        '''
+        if self._balance_ready.is_set() or not wait:
+            return self._balance
+        thread = self._balance_thread
+        if thread is not None:
+            thread.join()
+        with self._balance_lock:
+            if not self._balance_ready.is_set():
+                self._fetch_initial_balance()
+        return self._balance
 
     def get_granularity(self, timeframe, compression):
         if not self.exchange.has['fetchOHLCV']:
@@ -121,7 +424,7 @@ class CCXTStore(with_metaclass(MetaSingleton, object)):
         if granularity is None:
             raise ValueError("backtrader CCXT module doesn't support fetching OHLCV "
                              "data for time frame %s, comression %s" % \
-                             (bt.TimeFrame.getname(timeframe), compression))
+                             (bt.TimeFrame.getname(timeframe, compression), compression))
 
         if self.exchange.timeframes and granularity not in self.exchange.timeframes:
             raise ValueError("'%s' exchange doesn't support fetching OHLCV data for "
@@ -129,52 +432,231 @@ class CCXTStore(with_metaclass(MetaSingleton, object)):
 
         return granularity
 
+    def resample_plan(self, timeframe, compression):
+        '''Returns the granularity to fetch for (timeframe, compression) and the seconds of its bars
+
+        The granularity is the exchange one when it exists. Otherwise it is the finest granularity
+        of the exchange that divides the period, whose bars the feed resamples, e.g. 2m, 10m or 90m
+        from 1m, so feeds of other compressions of the same symbol share that base download.
+        '''
+        try:
+            granularity = self.get_granularity(timeframe, compression)
+            return granularity, self.exchange.parse_timeframe(granularity)
+        except ValueError:
+            unit = TIMEFRAME_SECONDS.get(timeframe)
+            if unit is None:
+                raise
+        seconds = unit * compression
+        candidates = self.exchange.timeframes or dict.fromkeys(self._GRANULARITIES.values())
+        bases = sorted((self.exchange.parse_timeframe(g), g) for g in candidates if not g.endswith(CALENDAR_UNITS))
+        for base_seconds, granularity in bases:
+            if seconds % base_seconds == 0:
+                return granularity, seconds
+        raise ValueError("'%s' exchange has no time frame to resample %s %s bars from" %
+                         (self.exchange.name, compression, bt.TimeFrame.getname(timeframe, compression)))
+
+    def load_markets(self):
+        '''Returns the exchange markets, loading them (from the disk cache if fresh) on first call'''
+        with self._markets_lock:
+            if self.exchange.markets:
+                return self.exchange.markets
+            path = self._markets_path()
+            if path is not None and os.path.exists(path) and time.time() - os.path.getmtime(path) < self.markets_ttl:
+                with open(path) as f:
+                    cached = json.load(f)
+                self.exchange.set_markets(cached['markets'], cached.get('currencies'))
+                return self.exchange.markets
+            with self.profiled('markets'):
+                self._load_markets()
+            if path is not None:
+                if not os.path.isdir(self.markets_cache):
+                    os.makedirs(self.markets_cache)
+                with open(path + '.tmp', 'w') as f:
+                    json.dump({'markets': self.exchange.markets, 'currencies': self.exchange.currencies}, f)
+                os.replace(path + '.tmp', path)
+            return self.exchange.markets
+
+    def _markets_path(self):
+        if not self.markets_cache:
+            return None
+        sandbox = '-sandbox' if self.sandbox else ''
+        return os.path.join(self.markets_cache, '{}{}-markets.json'.format(self.exchange.id, sandbox))
+
+    def _attempt(self, name, call, *args, **kwargs):
+        '''Make one rate limited call, recorded in the metrics when they are enabled'''
+        waited = self.rate_limiter.acquire(name)
+        metrics = self.metrics
+        if not metrics.enabled:
+            return call(*args, **kwargs)
+        if waited:
+            metrics.timing('rate_limit_sleep_seconds', waited, method=name)
+        metrics.count('store_calls', method=name)
+        started = time.perf_counter()
+        try:
+            return call(*args, **kwargs)
+        except Exception as e:
+            metrics.count('store_errors', method=name, error=type(e).__name__)
+            raise
+        finally:
+            metrics.timing('store_call_seconds', time.perf_counter() - started, method=name)
+
+    def _backoff(self, attempt, error):
+        '''Wait before attempt ``attempt + 1`` after ``error``'''
+        if isinstance(error, THROTTLE_ERRORS):
+            # 被限流时所有线程都要暂停,等待在下一次acquire()里
+            self.rate_limiter.pause(min(self.retry_backoff_max, self.throttle_backoff * 2 ** attempt))
+        else:
+            # 指数退避加随机抖动,避免多个线程同时重试
+            time.sleep(random.uniform(0, min(self.retry_backoff_max, self.retry_backoff * 2 ** attempt)))
+
     def retry(method):
         @wraps(method)
         def retry_method(self, *args, **kwargs):
             for i in range(self.retries):
                 if self.debug:
                     print('{} - {} - Attempt {}'.format(datetime.now(), method.__name__, i))
-                time.sleep(self.exchange.rateLimit / 1000)
                 try:
-                    return method(self, *args, **kwargs)
-                except (NetworkError, ExchangeError):
-                    if i == self.retries - 1:
+                    return self._attempt(method.__name__, method, self, *args, **kwargs)
+                except (NetworkError, ExchangeError) as e:
+                    permanent = isinstance(e, PERMANENT_ERRORS) and not (
+                        isinstance(e, OrderNotFound) and method.__name__ in NOT_FOUND_RETRIED)
+                    if permanent or i == self.retries - 1:
                         raise
+                    self.metrics.count('store_retries', method=method.__name__, error=type(e).__name__)
+                    self._backoff(i, e)
 
         return retry_method
 
     @retry
-    def get_wallet_balance(self, params=None):
-        balance = self.exchange.fetch_balance(params)
+    def _load_markets(self):
+        return self.exchange.load_markets()
+
+    @retry
+    def get_wallet_balance(self, params={}):
+        balance = self.exchange.fetch_balance(params if params is not None else {})
         return balance
 
     @retry
     def get_balance(self):
-        balance = self.exchange.fetch_balance()
-        cash = balance['free'][self.currency]
-        value = balance['total'][self.currency]
-        # Fix if None is returned
-        self._cash = cash if cash else 0
-        self._value = value if value else 0
+        self._set_balance(self.exchange.fetch_balance())
 
     @retry
     def getposition(self):
         return self._value
 
-    @retry
     def create_order(self, symbol, order_type, side, amount, price, params):
-        # returns the order
-        return self.exchange.create_order(symbol=symbol, type=order_type, side=side,
-                                          amount=amount, price=price, params=params)
+        '''Place an order, returns the ccxt order. See the class docstring for the retries'''
+        client_id = params.get('clientOrderId')
+        if client_id is None and self.idempotent_orders:
+            client_id = params['clientOrderId'] = self.new_client_order_id()
+        for i in range(self.retries):
+            if self.debug:
+                print('{} - create_order - Attempt {}'.format(datetime.now(), i))
+            try:
+                # returns the order
+                return self._attempt('create_order', self.exchange.create_order, symbol=symbol, type=order_type,
+                                     side=side, amount=amount, price=price, params=params)
+            except DuplicateOrderId:
+                # 重发时客户端订单号重复,说明上一次其实已经下单成功
+                order = self.find_order_by_client_id(symbol, client_id) if client_id and i else None
+                if order is None:
+                    raise
+                return order
+            except PERMANENT_ERRORS:
+                raise
+            except (NetworkError, ExchangeError) as e:
+                if i == self.retries - 1:
+                    raise
+                if not isinstance(e, THROTTLE_ERRORS):
+                    # 请求可能已经到达交易所,没有客户端订单号就无法确认,不能重发
+                    if client_id is None:
+                        raise
+                    order = self.find_order_by_client_id(symbol, client_id)
+                    if order is not None:
+                        return order
+                self.metrics.count('store_retries', method='create_order', error=type(e).__name__)
+                self._backoff(i, e)
+
+    @staticmethod
+    def new_client_order_id():
+        '''Returns a new client order id (32 alphanumeric characters, accepted by most exchanges)'''
+        return 'bt' + uuid.uuid4().hex[:30]
+
+    def find_order_by_client_id(self, symbol, client_id):
+        '''Returns the open or closed order of ``symbol`` with ``clientOrderId``, None if there is none'''
+        for fetch, has in ((self.fetch_open_orders, 'fetchOpenOrders'), (self.fetch_closed_orders, 'fetchClosedOrders')):
+            if not self.exchange.has.get(has):
+                continue
+            for order in fetch(symbol):
+                if order.get('clientOrderId') == client_id:
+                    return order
+        return None
+
+    def create_orders(self, orders, params={}):
+        '''Place several orders in one request, ``orders`` are dicts of the create_order arguments
+
+        Retried like create_order: after a failure which may have reached the exchange only the
+        orders not found by their clientOrderId are sent again, and without client order ids the
+        batch is not retried at all. Returns the ccxt orders in the order of ``orders``
+        '''
+        for order in orders:
+            # 和create_order一样直接写入params,调用方也能按客户端订单号查找
+            order.setdefault('params', {})
+            if self.idempotent_orders:
+                order['params'].setdefault('clientOrderId', self.new_client_order_id())
+        results = [None] * len(orders)
+        pending = list(range(len(orders)))
+        for i in range(self.retries):
+            if self.debug:
+                print('{} - create_orders - Attempt {}, {} orders'.format(datetime.now(), i, len(pending)))
+            try:
+                created = self._attempt('create_orders', self.exchange.create_orders,
+                                        [orders[j] for j in pending], params=params)
+                for j, order in zip(pending, created):
+                    results[j] = order
+                return results
+            except DuplicateOrderId:
+                # 重发时客户端订单号重复,说明上一次其实已经下单成功
+                if not i or not self._find_created(orders, pending, results):
+                    raise
+                pending = [j for j in pending if results[j] is None]
+                if not pending:
+                    return results
+            except PERMANENT_ERRORS:
+                raise
+            except (NetworkError, ExchangeError) as e:
+                if i == self.retries - 1:
+                    raise
+                if not isinstance(e, THROTTLE_ERRORS):
+                    # 请求可能已经到达交易所,只重发查不到的订单
+                    if not self._find_created(orders, pending, results):
+                        raise
+                    pending = [j for j in pending if results[j] is None]
+                    if not pending:
+                        return results
+                self.metrics.count('store_retries', method='create_orders', error=type(e).__name__)
+                self._backoff(i, e)
+
+    def _find_created(self, orders, pending, results):
+        '''Look the pending orders up by clientOrderId into ``results``, False if one has none'''
+        client_ids = [orders[j]['params'].get('clientOrderId') for j in pending]
+        if None in client_ids:
+            return False
+        for j, client_id in zip(pending, client_ids):
+            results[j] = self.find_order_by_client_id(orders[j]['symbol'], client_id)
+        return True
 
     @retry
     def cancel_order(self, order_id, symbol):
         return self.exchange.cancel_order(order_id, symbol)
 
     @retry
-    def fetch_trades(self, symbol):
-        return self.exchange.fetch_trades(symbol)
+    def fetch_tickers(self, symbols=None):
+        return self.exchange.fetch_tickers(symbols)
+
+    @retry
+    def fetch_trades(self, symbol, since=None, limit=None, params={}):
+        return self.exchange.fetch_trades(symbol, since=since, limit=limit, params=params)
 
     @retry
     def fetch_ohlcv(self, symbol, timeframe, since, limit, params={}):
@@ -187,8 +669,12 @@ class CCXTStore(with_metaclass(MetaSingleton, object)):
         return self.exchange.fetch_order(oid, symbol)
 
     @retry
-    def fetch_open_orders(self):
-        return self.exchange.fetchOpenOrders()
+    def fetch_open_orders(self, symbol=None, since=None, limit=None, params={}):
+        return self.exchange.fetch_open_orders(symbol, since, limit, params)
+
+    @retry
+    def fetch_closed_orders(self, symbol=None, since=None, limit=None, params={}):
+        return self.exchange.fetch_closed_orders(symbol, since, limit, params)
 
     @retry
     def private_end_point(self, type, endpoint, params):
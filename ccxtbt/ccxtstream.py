@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function, unicode_literals)
+
+import asyncio
+import threading
+from datetime import datetime
+
+
+class CCXTStream(object):
+    '''Streaming backend for the CCXT store.
+
+    Runs ``watch_*`` subscriptions of a ccxt.pro exchange (or any object with
+    the same coroutine methods, e.g. a test double talking to a local
+    WebSocket server) on an asyncio loop in a dedicated thread.
+
+    Each subscription awaits ``exchange.<method>(*args)`` in a loop and hands
+    every result to ``callback`` from the stream thread, so callbacks must
+    only hand the data over (e.g. put it into a queue). Failures, of the
+    exchange or of the callback, are passed to ``errback`` and the
+    subscription resumes after ``reconnect_delay`` seconds.
+    '''
+
+    def __init__(self, exchange, reconnect_delay=1.0, debug=False):
+        self.exchange = exchange
+        self.reconnect_delay = reconnect_delay
+        self.debug = debug
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name='CCXTStream')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            if self._thread is None:
+                return
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        close = getattr(self.exchange, 'close', None)
+        if close is not None:
+            asyncio.run_coroutine_threadsafe(close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+    def subscribe(self, method, args, callback, errback=None):
+        '''Start watching ``exchange.<method>(*args)``, returns a handle for ``unsubscribe``'''
+        self.start()
+        return asyncio.run_coroutine_threadsafe(self._watch(method, args, callback, errback), self._loop)
+
+    def unsubscribe(self, handle):
+        handle.cancel()
+
+    async def _watch(self, method, args, callback, errback):
+        watch = getattr(self.exchange, method)
+        while True:
+            try:
+                callback(await watch(*args))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self.debug:
+                    print('{} - {}{} - Stream error: {!r}'.format(datetime.now(), method, args, e))
+                if errback is not None:
+                    errback(e)
+                await asyncio.sleep(self.reconnect_delay)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function, unicode_literals)
+
+import time
+from datetime import datetime
+
+import numpy as np
+
+from .ccxtfeed import CCXTFeed
+from .ohlcvresample import TIMEFRAME_SECONDS, bar_start, reduce_ohlcv, resample_ohlcv
+
+
+def aggregate_trades(trades, bar_type, size, closed_until=None):
+    '''Aggregate trades into the bars they complete.
+
+    ``trades`` is a (N, 3) array of timestamp (ms), price and amount sorted
+    by timestamp. ``size`` is the bar length in ms for ``'time'`` bars, the
+    number of trades for ``'tick'`` bars and the traded amount for
+    ``'volume'`` bars. A time bar is complete once a later trade shows up or
+    its end is not after ``closed_until`` (ms); the other bars once they hold
+    ``size`` trades or amount, a trade is never split between two bars.
+
+    Returns the (M, 6) array of complete bars (timestamp, open, high, low,
+    close, volume) and the number of trades they used, the rest belongs to
+    the next bar. Time bars are stamped with their open time like exchange
+    candles (see ``resample_ohlcv``), tick and volume bars with their last trade.
+    '''
+    count = len(trades)
+    if not count:
+        return np.empty((0, 6)), 0
+    ts, price, amount = trades[:, 0], trades[:, 1], trades[:, 2]
+    # 每笔成交看作一根开高低收都是成交价的bar
+    bars = np.column_stack((ts, price, price, price, price, amount))
+    if bar_type == 'time':
+        return resample_ohlcv(bars, size, closed_until)
+    if bar_type == 'tick':
+        complete = count // int(size)
+        starts = np.arange(complete + 1) * int(size)
+    elif bar_type == 'volume':
+        cum = np.cumsum(amount)
+        # 每笔成交按它开始时的累计成交量归入对应的bar
+        keys = np.floor((cum - amount) / size)
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+        complete = len(starts) - (0 if cum[-1] >= (keys[-1] + 1) * size else 1)
+    else:
+        raise ValueError('Unknown bar type {!r}'.format(bar_type))
+    if not complete:
+        return np.empty((0, 6)), 0
+    used = int(starts[complete]) if complete < len(starts) else count
+    return reduce_ohlcv(bars, starts[:complete], used), used
+
+
+class CCXTTradeFeed(CCXTFeed):
+    """
+    Data feed of bars aggregated from the public trades (``fetch_trades``).
+
+    Builds bars the exchange candles do not offer, like 5 or 10 second bars
+    (``timeframe=TimeFrame.Seconds, compression=5``), or bars of a number of
+    trades or of a traded amount. Trades are paged through from ``fromdate``
+    on and each page is turned into arrays and aggregated at once, only the
+    trades of the bar still forming are kept between two pages.
+
+    Params (on top of the ``CCXTFeed`` ones, ``streaming``, ``cache`` and
+    ``download_workers`` do not apply):
+
+      - ``bar_type`` (default: ``'time'``)
+        ``'time'`` bars of ``timeframe``/``compression``, ``'tick'`` bars of
+        ``bar_size`` trades or ``'volume'`` bars of ``bar_size`` traded amount.
+      - ``bar_size`` (default: ``None``)
+        Trades or amount per bar of the tick and volume bars.
+      - ``trades_limit`` (default: ``1000``)
+        Trades requested per page.
+      - ``fetch_trades_params`` (default: ``{}``)
+        Extra params of every ``fetch_trades`` request.
+      - ``trades_cursor_param`` (default: ``None``)
+        Name of the exchange param paging by trade id (e.g. ``'fromId'`` on
+        binance). The pages after the first one are then requested from the
+        last trade id received instead of its timestamp.
+      - ``cursor`` (default: ``None``)
+        A ``cursor`` saved from a previous run: the feed resumes after the
+        last trade of the last bar that run delivered instead of ``fromdate``.
+
+    ``cursor`` always holds the position after the last delivered bar, as a
+    small json-serializable dict.
+    """
+
+    params = (
+        ('bar_type', 'time'),
+        ('bar_size', None),
+        ('trades_limit', 1000),
+        ('fetch_trades_params', {}),
+        ('trades_cursor_param', None),
+        ('cursor', None),
+    )
+
+    _store_slot = 'TradeDataCls'
+
+    def __init__(self, **kwargs):
+        super(CCXTTradeFeed, self).__init__(**kwargs)
+        if self.p.bar_type == 'time':
+            if self.p.timeframe not in TIMEFRAME_SECONDS:
+                raise ValueError('Time bars need a timeframe of seconds, minutes, days or weeks')
+            self._size = TIMEFRAME_SECONDS[self.p.timeframe] * self.p.compression * 1000
+        elif self.p.bar_size:
+            self._size = self.p.bar_size
+        else:
+            raise ValueError('{} bars need a bar_size'.format(self.p.bar_type))
+        self._pending = np.empty((0, 3))  # trades of the bar still forming
+        self._pending_ids = np.empty(0, dtype=object)
+        self._fetch_ts = None  # timestamp of the last trade fetched
+        self._fetch_ids = set()  # ids of the trades fetched with that timestamp
+        self._fetch_id = None  # id of the last trade fetched, for trades_cursor_param
+        self._page_full = False  # the last page held trades_limit trades
+        self.cursor = None
+        if self.p.cursor is not None:
+            self._resume(self.p.cursor)
+        else:
+            # 没有fromdate时从下一根bar开始,避免第一根bar不完整
+            now = int(time.time() * 1000)
+            self._fetch_ts = bar_start(now, self._size) + self._size - 1 if self.p.bar_type == 'time' else now
+
+    def start(self):
+        if self.p.streaming:
+            raise ValueError('CCXTTradeFeed does not stream, use threaded or store_poller to poll in the background')
+        super(CCXTTradeFeed, self).start()
+
+    def _resume(self, cursor):
+        self.cursor = dict(cursor)
+        self._fetch_ts = cursor['timestamp']
+        self._fetch_ids = set(cursor['ids'])
+        self._fetch_id = cursor['ids'][-1] if cursor['ids'] else None
+        self._last_ts = cursor.get('bar', self._last_ts)
+
+    def _bar_seconds(self):
+        return self._size / 1000.0 if self.p.bar_type == 'time' else 0.0
+
+    def _schedule_poll(self, now):
+        if self.p.bar_type == 'time':
+            return super(CCXTTradeFeed, self)._schedule_poll(now)
+        self._next_poll_time = now + self.p.poll_retry
+
+    @staticmethod
+    def _ms(dt):
+        return int((dt - datetime(1970, 1, 1)).total_seconds() * 1000)
+
+    def _update_bar(self, fromdate=None, livemode=False):
+        """Page through the trades since the last one fetched, queueing the bars they complete"""
+        if fromdate and self.p.cursor is None:
+            self._fetch_ts, self._fetch_ids, self._fetch_id = self._ms(fromdate), set(), None
+            self._pending = np.empty((0, 3))
+            self._pending_ids = np.empty(0, dtype=object)
+        until = self._ms(self.p.todate) if self.p.todate and not livemode else None
+        while True:
+            trades, ids = self._fetch_page()
+            if until is not None:
+                keep = trades[:, 0] <= until
+                trades, ids = trades[keep], ids[keep]
+            if not len(trades):
+                break
+            self._aggregate(trades, ids)
+            if not self._page_full or until is not None and self._fetch_ts > until:
+                break
+        if self.p.bar_type == 'time':
+            # 已经追上最新的成交,结束时间已过的bar不会再有成交
+            closed_until = until if until is not None else (time.time() - self.p.poll_delay) * 1000
+            self._aggregate(np.empty((0, 3)), np.empty(0, dtype=object), closed_until)
+
+    def _fetch_page(self):
+        '''Returns the (N, 3) array and the ids of the next page of new trades'''
+        params = dict(self.p.fetch_trades_params)
+        since = self._fetch_ts
+        if self.p.trades_cursor_param and self._fetch_id is not None:
+            params[self.p.trades_cursor_param] = self._fetch_id
+            since = None
+        page = self.store.fetch_trades(self.p.dataname, since=since, limit=self.p.trades_limit, params=params)
+        self._page_full = len(page) >= self.p.trades_limit
+        # 分页的边界上可能重复返回同一时间戳的成交,按id去重
+        rows = [(t['timestamp'], t['price'], t['amount'], t['id']) for t in page
+                if self._fetch_ts is None or t['timestamp'] > self._fetch_ts or
+                (t['timestamp'] == self._fetch_ts and t['id'] not in self._fetch_ids)]
+        if not rows:
+            return np.empty((0, 3)), np.empty(0, dtype=object)
+        rows.sort(key=lambda row: row[0])
+        last_ts = rows[-1][0]
+        ids = [row[3] for row in rows if row[0] == last_ts]
+        self._fetch_ids = (self._fetch_ids if last_ts == self._fetch_ts else set()) | set(ids)
+        self._fetch_ts = last_ts
+        self._fetch_id = rows[-1][3]
+        return np.array([row[:3] for row in rows], dtype=np.float64), np.array([row[3] for row in rows], dtype=object)
+
+    def _aggregate(self, trades, ids, closed_until=None):
+        '''Aggregate the new trades after the pending ones and queue the complete bars'''
+        trades = np.concatenate((self._pending, trades))
+        ids = np.concatenate((self._pending_ids, ids))
+        bars, used = aggregate_trades(trades, self.p.bar_type, self._size, closed_until)
+        if used:
+            self._data.put_many(bars)
+            self._last_ts = int(bars[-1, 0])
+            last_ts = trades[used - 1, 0]
+            done = ids[:used][trades[:used, 0] == last_ts].tolist()
+            if self.cursor is not None and self.cursor['timestamp'] == last_ts:
+                done = self.cursor['ids'] + [i for i in done if i not in self.cursor['ids']]
+            self.cursor = {'timestamp': int(last_ts), 'ids': done, 'bar': self._last_ts}
+        self._pending = trades[used:]
+        self._pending_ids = ids[used:]
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function, unicode_literals)
+
+import threading
+
+from .ccxtledger import split_symbol
+
+
+class CCXTValuation(object):
+    '''Marks the balances of a ``CCXTLedger`` to one quote currency.
+
+    Prices (in the quote currency) come from ``update_tickers``, fed with a
+    bulk ``fetch_tickers`` result, and from ``set_price``, fed with the last
+    close of the running feeds. ``value`` is cached until the ledger or a
+    price changes, so calling it on every ``next()`` costs nothing. Currencies
+    without a price are left out of the value and listed in ``unpriced``.
+    '''
+
+    def __init__(self, quote):
+        self.quote = quote
+        self.prices = {quote: 1.0}
+        self.unpriced = set()
+        self._version = 0
+        self._cached = None  # (ledger version, prices version, value)
+        self._lock = threading.Lock()
+
+    def set_price(self, currency, price):
+        if price is None or price != price or price <= 0 or currency == self.quote:
+            return
+        with self._lock:
+            if self.prices.get(currency) != price:
+                self.prices[currency] = price
+                self._version += 1
+
+    def update_tickers(self, tickers):
+        '''Take the prices of the ``quote`` markets out of a ``fetch_tickers`` result'''
+        inverse = {}
+        for symbol, ticker in tickers.items():
+            base, quote, settle = split_symbol(symbol)
+            price = ticker.get('last') or ticker.get('close')
+            if settle is not None or not price:
+                continue
+            if quote == self.quote:
+                self.set_price(base, price)
+            elif base == self.quote:
+                inverse[quote] = 1.0 / price
+        for currency, price in inverse.items():
+            if currency not in self.prices:
+                self.set_price(currency, price)
+
+    def value(self, ledger):
+        '''Returns the total balance of all currencies in the quote currency'''
+        cached = self._cached
+        if cached is not None and cached[0] == ledger.version and cached[1] == self._version:
+            return cached[2]
+        with self._lock:
+            version = self._version
+            value = 0.0
+            unpriced = set()
+            for currency, amount in list(ledger.total.items()):
+                if not amount:
+                    continue
+                price = self.prices.get(currency)
+                if price is None:
+                    unpriced.add(currency)
+                else:
+                    value += amount * price
+            self.unpriced = unpriced
+        self._cached = (ledger.version, version, value)
+        return value
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function, unicode_literals)
+
+import threading
+
+import numpy as np
+from backtrader.utils.py3 import queue
+
+# datetime(1970, 1, 1).toordinal(), bt.date2num counts days from year 1
+EPOCH_ORDINAL = 719163
+
+
+def ts_to_num(ts):
+    '''Vectorized ``bt.date2num(datetime.utcfromtimestamp(ts // 1000))``
+
+    ``ts`` are millisecond timestamps. The fraction of the day is added up
+    the same way ``bt.date2num`` does, so the results are identical.
+    '''
+    secs = np.asarray(ts, dtype=np.int64) // 1000
+    days, rem = np.divmod(secs, 86400)
+    hours, rem = np.divmod(rem, 3600)
+    minutes, seconds = np.divmod(rem, 60)
+    return (days + EPOCH_ORDINAL).astype(np.float64) + (hours / 24.0 + minutes / 1440.0 + seconds / 86400.0)
+
+
+def num_to_ts(num):
+    '''Millisecond timestamp of the backtrader float datetime ``num``, the inverse of ``ts_to_num``'''
+    return int(round((num - EPOCH_ORDINAL) * 86400000.0))
+
+
+class OHLCVBuffer(object):
+    '''Thread-safe FIFO of bars backed by a preallocated numpy array.
+
+    A page of bars is added with ``put_many`` in one vectorized copy, which
+    also converts the timestamps to backtrader's float datetime. Each row
+    holds ``timestamp, open, high, low, close, volume, datetime``. The array
+    is compacted, or grown, only when a page does not fit at its end.
+
+    ``put``/``get``/``qsize``/``empty`` mirror ``queue.Queue`` so the buffer
+    can stand in for the feed's former queue of bar lists.
+    '''
+
+    COLUMNS = 7
+
+    def __init__(self, capacity=1024):
+        self._array = np.empty((capacity, self.COLUMNS))
+        self._read = 0
+        self._write = 0
+        self._lock = threading.Lock()
+
+    def put(self, bar):
+        self.put_many([bar])
+
+    def put_many(self, bars):
+        bars = np.asarray(bars, dtype=np.float64).reshape(-1, self.COLUMNS - 1)
+        count = len(bars)
+        if not count:
+            return
+        dtnums = ts_to_num(bars[:, 0])
+        with self._lock:
+            self._reserve(count)
+            rows = self._array[self._write:self._write + count]
+            rows[:, :-1] = bars
+            rows[:, -1] = dtnums
+            self._write += count
+
+    def _reserve(self, count):
+        if self._write + count <= len(self._array):
+            return
+        pending = self._write - self._read
+        capacity = len(self._array)
+        while pending + count > capacity:
+            capacity *= 2
+        if capacity != len(self._array):
+            array = np.empty((capacity, self.COLUMNS))
+            array[:pending] = self._array[self._read:self._write]
+            self._array = array
+        else:
+            # 把未读取的数据移到数组开头,腾出尾部空间
+            self._array[:pending] = self._array[self._read:self._write]
+        self._read, self._write = 0, pending
+
+    def get(self, block=False):
+        '''Returns the oldest bar as ``[timestamp, open, high, low, close, volume, datetime]``'''
+        with self._lock:
+            if self._read == self._write:
+                raise queue.Empty
+            row = self._array[self._read].tolist()
+            self._read += 1
+            if self._read == self._write:
+                self._read = self._write = 0
+            return row
+
+    def get_many(self, count=None):
+        '''Returns (a copy of) up to ``count`` oldest bars, all if ``count`` is None'''
+        with self._lock:
+            end = self._write if count is None else min(self._write, self._read + count)
+            rows = self._array[self._read:end].copy()
+            self._read = end
+            if self._read == self._write:
+                self._read = self._write = 0
+            return rows
+
+    def qsize(self):
+        return self._write - self._read
+
+    def empty(self):
+        return self._write == self._read
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function, unicode_literals)
+
+import json
+import os
+import threading
+
+import numpy as np
+from ccxt import Exchange
+
+
+class OHLCVCache(object):
+    '''Local on-disk cache of closed OHLCV bars.
+
+    Bars are kept per exchange/symbol/granularity in a file of raw float64
+    records (timestamp, open, high, low, close, volume) sorted by timestamp,
+    next to a small json file with the time range the bars cover. Inside that
+    range the cache is complete: a bar missing there does not exist on the
+    exchange, so only the head or tail gaps outside of it need fetching.
+
+    Reads are memory mapped. Bars after the tail are appended in place, bars
+    before the head rewrite the file. A range which does not touch the
+    covered one is not written at all: the cache has to stay contiguous and
+    the history already cached is never given up for it.
+    '''
+
+    COLUMNS = 6
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _paths(self, exchange, symbol, granularity):
+        folder = os.path.join(self.path, exchange, symbol.replace('/', '_').replace(':', '_'))
+        base = os.path.join(folder, granularity)
+        return folder, base + '.f8', base + '.json'
+
+    def coverage(self, exchange, symbol, granularity):
+        '''Returns the (start, end) timestamps covered by the cache or None'''
+        _, _, meta_path = self._paths(exchange, symbol, granularity)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (IOError, ValueError):
+            return None
+        return meta['start'], meta['end']
+
+    def load(self, exchange, symbol, granularity):
+        '''Returns all cached bars as a read-only (N, 6) array'''
+        _, data_path, _ = self._paths(exchange, symbol, granularity)
+        if not os.path.exists(data_path) or not os.path.getsize(data_path):
+            return np.empty((0, self.COLUMNS))
+        return np.memmap(data_path, dtype=np.float64, mode='r').reshape(-1, self.COLUMNS)
+
+    def read(self, exchange, symbol, granularity, start, end):
+        '''Returns the cached bars with ``start < timestamp <= end``'''
+        data = self.load(exchange, symbol, granularity)
+        ts = data[:, 0]
+        return data[np.searchsorted(ts, start, side='right'):np.searchsorted(ts, end, side='right')]
+
+    def missing(self, exchange, symbol, granularity, start, end):
+        '''Returns the (since, until) ranges of ``[start, end]`` which are not cached'''
+        cov = self.coverage(exchange, symbol, granularity)
+        if cov is None or end < cov[0] or start > cov[1]:
+            return [(start, end)]
+        gaps = []
+        if start < cov[0]:
+            gaps.append((start, cov[0]))
+        if end > cov[1]:
+            gaps.append((cov[1], end))
+        return gaps
+
+    def write(self, exchange, symbol, granularity, bars, start, end):
+        '''Add the closed ``bars`` fetched for the complete range ``[start, end]``
+
+        Returns False, leaving the cache untouched, if the range does not touch
+        the covered one.
+        '''
+        period = Exchange.parse_timeframe(granularity) * 1000
+        bars = np.asarray(bars, dtype=np.float64).reshape(-1, self.COLUMNS)
+        bars = bars[np.unique(bars[:, 0], return_index=True)[1]]  # sorted, no duplicates
+        folder, data_path, meta_path = self._paths(exchange, symbol, granularity)
+        with self._lock:
+            if not os.path.isdir(folder):
+                os.makedirs(folder)
+            cov = self.coverage(exchange, symbol, granularity)
+            if cov is not None and (start > cov[1] + period or end < cov[0] - period):
+                # 和已缓存的区间不相连,不能覆盖已有的历史数据
+                return False
+            if cov is None:
+                self._rewrite(data_path, bars)
+            else:
+                data = self.load(exchange, symbol, granularity)
+                first, last = (data[0, 0], data[-1, 0]) if len(data) else (np.inf, -np.inf)
+                head, tail = bars[bars[:, 0] < first], bars[bars[:, 0] > last]
+                if len(head):
+                    self._rewrite(data_path, np.concatenate((head, data, tail)))
+                elif len(tail):
+                    with open(data_path, 'ab') as f:
+                        tail.tofile(f)
+                start, end = min(start, cov[0]), max(end, cov[1])
+            self._replace(meta_path, json.dumps({'start': int(start), 'end': int(end)}).encode())
+        return True
+
+    def _rewrite(self, data_path, bars):
+        self._replace(data_path, np.ascontiguousarray(bars, dtype=np.float64).tobytes())
+
+    @staticmethod
+    def _replace(path, content):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function, unicode_literals)
+
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+
+class OHLCVDownloader(object):
+    '''Downloads the bars of a known time range.
+
+    With one worker the range is paged through serially, each request
+    starting after the last bar received. With more workers the range is
+    split into windows of ``limit`` bars which are fetched concurrently (the
+    store's rate limiter keeps them within the exchange budget) and merged
+    back in order, without duplicates.
+
+    ``progress`` is called as ``progress(done, total, bars, elapsed)`` after
+    every window. The figures of the last download are kept in ``stats``.
+    '''
+
+    def __init__(self, store, symbol, granularity, limit, workers=1, params=None, progress=None, debug=False):
+        self.store = store
+        self.symbol = symbol
+        self.granularity = granularity
+        self.limit = limit
+        self.workers = workers
+        self.params = params or {}
+        self.progress = progress
+        self.debug = debug
+        self.stats = {}
+
+    def download(self, since, until):
+        '''Returns the sorted bars with ``since <= timestamp < until``'''
+        started = time.time()
+        if self.workers > 1:
+            span = self._period() * self.limit
+            windows = [(start, min(start + span, until)) for start in range(int(since), int(until), span)]
+            pages = [None] * len(windows)
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = {pool.submit(self._fetch, *window): i for i, window in enumerate(windows)}
+                for done, future in enumerate(as_completed(futures), 1):
+                    pages[futures[future]] = future.result()
+                    self._report(done, len(windows), sum(len(p) for p in pages if p), started)
+            # 各个窗口互不重叠,按顺序拼接即可
+            bars = [bar for page in pages for bar in page]
+        else:
+            bars = self._fetch(since, until)
+            self._report(1, 1, len(bars), started)
+        return bars
+
+    def _period(self):
+        return self.store.exchange.parse_timeframe(self.granularity) * 1000
+
+    def _fetch(self, since, until):
+        '''Fetch one window page by page'''
+        period = self._period()
+        result = []
+        while since < until:
+            bars = sorted(self.store.fetch_ohlcv(self.symbol, timeframe=self.granularity, since=since,
+                                                 limit=self.limit, params=self.params))
+            bars = [bar for bar in bars if None not in bar and bar[0] >= since]
+            if not bars:
+                break
+            result.extend(bar for bar in bars if bar[0] < until)
+            if bars[-1][0] + period >= until:
+                break
+            since = bars[-1][0] + 1
+        return result
+
+    def _report(self, done, total, bars, started):
+        elapsed = time.time() - started
+        self.stats = {'windows': total, 'done': done, 'bars': bars, 'seconds': elapsed,
+                      'bars_per_sec': bars / elapsed if elapsed > 0 else 0.0}
+        if self.debug:
+            print('{} - {} {} - Downloaded {}/{} windows, {} bars, {:.0f} bars/s'.format(
+                datetime.now(), self.symbol, self.granularity, done, total, bars, self.stats['bars_per_sec']))
+        if self.progress is not None:
+            self.progress(done, total, bars, elapsed)
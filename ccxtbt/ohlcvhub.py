@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function, unicode_literals)
+
+import json
+import threading
+import time
+
+import numpy as np
+from backtrader.utils.py3 import queue
+
+from .ohlcvbuffer import OHLCVBuffer, ts_to_num
+from .ohlcvresample import bar_start
+
+
+class OHLCVSeries(object):
+    '''The bars of one (symbol, granularity), fetched once for all its subscriptions.
+
+    Rows are ``timestamp, open, high, low, close, volume, datetime`` like in
+    ``OHLCVBuffer``, appended to a preallocated array that only the series
+    writes. The subscriptions read views of it, so N feeds of the same
+    symbol hold one copy of the bars. When the array is full it is
+    reallocated without the rows every subscription has already read; the
+    views handed out before keep the old array alive until they are dropped.
+    '''
+
+    COLUMNS = OHLCVBuffer.COLUMNS
+
+    def __init__(self, store, symbol, granularity, params=None, drop_newest=False, capacity=1024):
+        self.store = store
+        self.symbol = symbol
+        self.granularity = granularity
+        self.params = params or {}
+        self.drop_newest = drop_newest
+        self.subscriptions = {}  # id(subscription) -> subscription
+        self.fetches = 0  # fetch_ohlcv requests made for all the subscriptions
+        self._array = np.empty((capacity, self.COLUMNS))
+        self._count = 0
+        self._start = None  # rows cover the bars after this timestamp
+        self._last_ts = None
+        self._last_fetch = 0
+        self._lock = threading.Lock()
+
+    @property
+    def last_ts(self):
+        return self._last_ts
+
+    def rows(self):
+        '''Returns a read-only view of the rows'''
+        with self._lock:
+            rows = self._array[:self._count]
+        rows.flags.writeable = False
+        return rows
+
+    def backfill(self, since, limit):
+        '''Make the rows cover the bars after ``since``, then fetch up to the latest bar'''
+        with self._lock:
+            if self._start is None:
+                self._start = self._last_ts = since
+            elif since < self._start:
+                # 新的订阅要求更早的数据,补上开头缺的部分
+                rows = self._rows(self._fetch_range(since, self._start, limit))
+                total = len(rows) + self._count
+                array = np.empty((max(len(self._array), 2 * total), self.COLUMNS))
+                array[:len(rows)] = rows
+                array[len(rows):total] = self._array[:self._count]
+                self._array, self._count, self._start = array, total, since
+            if not self._current(time.time()):
+                self._fetch_tail(limit, livemode=False)
+
+    def refresh(self, since, limit, min_interval=0.0, now=None, catchup=False):
+        '''Fetch the latest bars, unless the last closed bar is already in or was just asked for
+
+        With ``catchup`` all the pages up to the latest bar are fetched instead of one.
+        '''
+        now = time.time() if now is None else now
+        with self._lock:
+            if self._start is None:
+                self._start = self._last_ts = since
+            if self._current(now) or now - self._last_fetch < min_interval:
+                return
+            self._fetch_tail(limit, livemode=not catchup)
+
+    def _current(self, now):
+        '''True if the bar which closed last is in the rows'''
+        period = self.store.exchange.parse_timeframe(self.granularity) * 1000
+        return self._count > 0 and self._last_ts >= bar_start(int(now * 1000), period) - period
+
+    def _fetch_tail(self, limit, livemode):
+        while True:
+            new_bars = self._fetch(self._last_ts, limit)
+            if new_bars:
+                self._append(self._rows(new_bars))
+                self._last_ts = new_bars[-1][0]
+            # 实时模式只取一页
+            if not new_bars or livemode:
+                break
+
+    def _fetch_range(self, since, until, limit):
+        '''The bars with ``since < timestamp <= until``'''
+        result = []
+        while True:
+            bars = self._fetch(since, limit)
+            keep = [bar for bar in bars if bar[0] <= until]
+            result.extend(keep)
+            if not keep or len(keep) < len(bars):
+                return result
+            since = keep[-1][0]
+
+    def _fetch(self, since, limit):
+        '''One page of the sorted, complete bars after ``since``'''
+        self.fetches += 1
+        self._last_fetch = time.time()
+        bars = sorted(self.store.fetch_ohlcv(self.symbol, timeframe=self.granularity, since=since, limit=limit,
+                                             params=self.params))
+        if self.drop_newest and bars:
+            del bars[-1]
+        return [bar for bar in bars if None not in bar and bar[0] > since]
+
+    def _rows(self, bars):
+        bars = np.asarray(bars, dtype=np.float64).reshape(-1, self.COLUMNS - 1)
+        return np.column_stack((bars, ts_to_num(bars[:, 0])))
+
+    def _append(self, rows):
+        count = len(rows)
+        if self._count + count > len(self._array):
+            # 所有订阅都已经读过的数据不用再保留
+            cursors = [s.cursor for s in self.subscriptions.values()]
+            keep = np.searchsorted(self._array[:self._count, 0], min(cursors), side='right') if cursors else 0
+            pending = self._count - keep
+            capacity = len(self._array)
+            while pending + count > capacity:
+                capacity *= 2
+            array = np.empty((capacity, self.COLUMNS))
+            array[:pending] = self._array[keep:self._count]
+            if keep:
+                self._start = self._array[keep - 1, 0]
+            self._array, self._count = array, pending
+        self._array[self._count:self._count + count] = rows
+        self._count += count
+
+
+class OHLCVSubscription(object):
+    '''A feed's reading position in a shared ``OHLCVSeries``.
+
+    ``get``/``get_many``/``qsize``/``empty`` mirror ``OHLCVBuffer`` so the
+    subscription stands in for the feed's own buffer; ``get_many`` returns
+    a read-only view of the shared rows instead of a copy.
+    '''
+
+    def __init__(self, series, cursor=None):
+        self.series = series
+        self.cursor = -np.inf if cursor is None else cursor  # timestamp of the last bar read
+
+    def seek(self, cursor):
+        self.cursor = cursor
+
+    def _pending(self):
+        rows = self.series.rows()
+        return rows[np.searchsorted(rows[:, 0], self.cursor, side='right'):]
+
+    def get(self, block=False):
+        rows = self._pending()
+        if not len(rows):
+            raise queue.Empty
+        self.cursor = rows[0, 0]
+        return rows[0].tolist()
+
+    def get_many(self, count=None):
+        rows = self._pending()[:count]
+        if len(rows):
+            self.cursor = rows[-1, 0]
+        return rows
+
+    def qsize(self):
+        return len(self._pending())
+
+    def empty(self):
+        return not self.qsize()
+
+
+class OHLCVHub(object):
+    '''Store-level registry of the ``OHLCVSeries`` the feeds with ``shared=True`` subscribe to.
+
+    Feeds of the same symbol, granularity and fetch params get the same
+    series: each bar is requested once, and stored once, whatever the number
+    of feeds.
+    '''
+
+    def __init__(self, store):
+        self.store = store
+        self._series = {}  # (symbol, granularity, params, drop_newest) -> OHLCVSeries
+        self._lock = threading.Lock()
+
+    def subscribe(self, symbol, granularity, params=None, drop_newest=False):
+        key = symbol, granularity, json.dumps(params or {}, sort_keys=True), bool(drop_newest)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = OHLCVSeries(self.store, symbol, granularity, params, drop_newest)
+            subscription = OHLCVSubscription(series)
+            series.subscriptions[id(subscription)] = subscription
+        return subscription
+
+    def unsubscribe(self, subscription):
+        series = subscription.series
+        with self._lock:
+            series.subscriptions.pop(id(subscription), None)
+            if not series.subscriptions:
+                # 最后一个订阅退出后释放数据
+                self._series = {k: s for k, s in self._series.items() if s is not series}
+
+    def series(self):
+        with self._lock:
+            return list(self._series.values())
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function, unicode_literals)
+
+import collections
+import threading
+
+import numpy as np
+from backtrader import TimeFrame
+
+from .ohlcvdownloader import OHLCVDownloader
+
+
+# Seconds per unit of the timeframes bars can be resampled (or built from trades) to
+TIMEFRAME_SECONDS = {TimeFrame.Seconds: 1, TimeFrame.Minutes: 60, TimeFrame.Days: 86400, TimeFrame.Weeks: 604800}
+
+WEEK = 604800000
+# 1970-01-01 is a Thursday, exchange weekly candles open on Mondays
+WEEK_OFFSET = 4 * 86400000
+# 月线和年线按日历划分,长度不固定,无法推算收盘时间
+CALENDAR_UNITS = ('M', 'y')
+
+
+def bar_start(ts, period):
+    '''Open timestamp of the bar of ``period`` ms holding ``ts`` (scalar or array)
+
+    Bars start at multiples of ``period`` since the epoch, except bars of whole weeks which start
+    on Mondays like the exchange candles.
+    '''
+    offset = WEEK_OFFSET if period % WEEK == 0 else 0
+    return (ts - offset) // period * period + offset
+
+
+def reduce_ohlcv(bars, starts, used):
+    '''Aggregate the groups of rows of ``bars[:used]`` starting at the indexes ``starts``
+
+    ``bars`` is a (N, 6) array (timestamp, open, high, low, close, volume). Returns one row per
+    group, stamped with the timestamp of its last row.
+    '''
+    ends = np.append(starts[1:], used) - 1
+    result = np.empty((len(starts), 6))
+    result[:, 0] = bars[ends, 0]
+    result[:, 1] = bars[starts, 1]
+    result[:, 2] = np.maximum.reduceat(bars[:used, 2], starts)
+    result[:, 3] = np.minimum.reduceat(bars[:used, 3], starts)
+    result[:, 4] = bars[ends, 4]
+    result[:, 5] = np.add.reduceat(bars[:used, 5], starts)
+    return result
+
+
+def resample_ohlcv(bars, period, closed_until=None):
+    '''Aggregate bars into the bars of ``period`` ms they complete.
+
+    ``bars`` is a (N, 6) array (timestamp, open, high, low, close, volume)
+    sorted by timestamp. The resampled bars start as given by ``bar_start``,
+    like exchange candles. A bar is complete once a bar of a later period
+    shows up or its end is not after ``closed_until`` (ms).
+
+    Returns the (M, 6) array of complete bars and the number of input bars
+    they used, the rest belongs to the next bar.
+    '''
+    count = len(bars)
+    if not count:
+        return np.empty((0, 6)), 0
+    opens = bar_start(bars[:, 0], period)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(opens)) + 1))
+    complete = len(starts) - 1
+    if closed_until is not None and opens[-1] + period <= closed_until:
+        complete += 1
+    if not complete:
+        return np.empty((0, 6)), 0
+    used = int(starts[complete]) if complete < len(starts) else count
+    starts = starts[:complete]
+    result = reduce_ohlcv(bars, starts, used)
+    result[:, 0] = opens[starts]
+    return result, used
+
+
+class SharedOHLCV(object):
+    '''Closed base bars downloaded once per symbol and granularity.
+
+    Feeds resampling the same symbol (to different compressions) read their
+    base bars from here, so each range is only fetched once whatever the
+    number of feeds. The bars of a key are kept as one contiguous array with
+    the time range it covers; a request only downloads the head or tail
+    outside of it, a request disjoint from it replaces it.
+    '''
+
+    def __init__(self, store):
+        self.store = store
+        self._series = {}  # (symbol, granularity) -> (bars, start, end)
+        self._locks = collections.defaultdict(threading.Lock)
+        self._lock = threading.Lock()
+
+    def bars(self, symbol, granularity, since, until, limit=1000, workers=1, params=None):
+        '''Returns the closed bars with ``since <= timestamp < until``
+
+        The covered range only grows up to the end of the last bar received, a bar the exchange has
+        not published yet is asked for again by the next request.
+        '''
+        key = symbol, granularity
+        period = self.store.exchange.parse_timeframe(granularity) * 1000
+        with self._lock:
+            lock = self._locks[key]
+        with lock:
+            bars, start, end = self._series.get(key, (None, None, None))
+            if bars is None or until < start or since > end:
+                bars = self._download(key, since, until, limit, workers, params)
+                start, end = since, bars[-1, 0] + period if len(bars) else since
+            else:
+                if since < start:
+                    bars = np.concatenate((self._download(key, since, start, limit, workers, params), bars))
+                    start = since
+                if until > end:
+                    tail = self._download(key, end, until, limit, workers, params)
+                    # 只拼接比已有数据更新的bar
+                    last = bars[-1, 0] if len(bars) else -np.inf
+                    tail = tail[tail[:, 0] > last]
+                    if len(tail):
+                        bars = np.concatenate((bars, tail))
+                        end = tail[-1, 0] + period
+            self._series[key] = bars, start, end
+        ts = bars[:, 0]
+        return bars[np.searchsorted(ts, since, side='left'):np.searchsorted(ts, until, side='left')]
+
+    def _download(self, key, since, until, limit, workers, params):
+        symbol, granularity = key
+        downloader = OHLCVDownloader(self.store, symbol, granularity, limit, workers=workers, params=params)
+        bars = [bar for bar in downloader.download(since, until) if None not in bar]
+        return np.asarray(bars, dtype=np.float64).reshape(-1, 6)
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
@@ -9,5 +9,5 @@ setup(
    author_email='dave@backtest-rookies.com',
    license='MIT',
    packages=['ccxtbt'],  
-   install_requires=['backtrader','ccxt'],
+   install_requires=['backtrader','ccxt','numpy'],
 )
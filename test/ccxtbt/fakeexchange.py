@@ -0,0 +1,194 @@
+import asyncio
+import collections
+import copy
+import itertools
+import math
+import queue
+import time
+
+import ccxt
+
+
+class FakeExchange(object):
+    """
+    Offline stand-in for a ccxt exchange, just enough of the unified API for the store, feed and broker.
+    Register it under a name on the ccxt module (see ``fake_exchange``) so the store can build it by name.
+    """
+
+    id = 'fake'
+    name = 'Fake'
+    rateLimit = 0
+    has = {'fetchOHLCV': True, 'fetchOrder': True, 'fetchOpenOrders': True, 'fetchClosedOrders': True}
+    timeframes = {'1m': '1m', '3m': '3m', '5m': '5m', '15m': '15m', '30m': '30m', '1h': '1h', '1d': '1d'}
+
+    parse_timeframe = staticmethod(ccxt.Exchange.parse_timeframe)
+
+    def __init__(self, config=None):
+        self.config = config or {}
+        self.ohlcv = collections.defaultdict(list)  # symbol -> sorted list of bars
+        self.trades = collections.defaultdict(list)  # symbol -> sorted list of public trades
+        self.calls = collections.Counter()
+        self.orders = collections.OrderedDict()  # id -> ccxt order structure
+        self._ids = itertools.count(1)
+        self.balance = {'free': {'USDT': 1000.0}, 'total': {'USDT': 1000.0}}
+        self.tickers = {}
+        self.markets = None
+        self.currencies = None
+        self.market_data = {symbol: {'symbol': symbol, 'precision': {'amount': 0.0001, 'price': 0.01},
+                                     'limits': {'amount': {'min': 0.0001, 'max': None}, 'price': {'min': None, 'max': None},
+                                                'cost': {'min': 10.0, 'max': None}}}
+                            for symbol in ('BTC/USDT', 'ETH/USDT', 'EOS/USDT')}
+
+    def set_sandbox_mode(self, enabled):
+        pass
+
+    def load_markets(self, reload=False, params={}):
+        self.calls['load_markets'] += 1
+        self.set_markets(copy.deepcopy(self.market_data), {})
+        return self.markets
+
+    def set_markets(self, markets, currencies=None):
+        self.markets = markets
+        self.currencies = currencies
+
+    def amount_to_precision(self, symbol, amount):
+        '''Truncate to the amount step (ccxt TICK_SIZE precision mode)'''
+        step = self.markets[symbol]['precision']['amount']
+        amount = math.floor(amount / step + 1e-9) * step
+        if amount <= 0:
+            raise ccxt.InvalidOrder('fake amount of {} must be greater than minimum amount precision of {}'.format(
+                symbol, step))
+        return '{:.8f}'.format(amount)
+
+    def price_to_precision(self, symbol, price):
+        step = self.markets[symbol]['precision']['price']
+        return '{:.8f}'.format(round(price / step) * step)
+
+    def add_bars(self, symbol, start_ts, count, period_ms=60000):
+        bars = self.ohlcv[symbol]
+        for i in range(count):
+            price = float(len(bars) + 1)
+            bars.append([start_ts + i * period_ms, price, price + 1, price - 1, price + 0.5, 10.0])
+
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=None, params={}):
+        self.calls['fetch_ohlcv'] += 1
+        bars = [list(b) for b in self.ohlcv[symbol] if since is None or b[0] >= since]
+        return bars[:limit] if limit else bars
+
+    def add_trades(self, symbol, trades):
+        '''Add (timestamp, price, amount) trades, numbered on from the last one'''
+        for timestamp, price, amount in trades:
+            self.trades[symbol].append({'id': str(len(self.trades[symbol]) + 1), 'timestamp': timestamp,
+                                        'price': price, 'amount': amount, 'symbol': symbol})
+
+    def fetch_trades(self, symbol, since=None, limit=None, params={}):
+        '''Pages by timestamp, or by trade id (inclusive) with a ``fromId`` param'''
+        self.calls['fetch_trades'] += 1
+        trades = self.trades[symbol]
+        if 'fromId' in params:
+            trades = [t for t in trades if int(t['id']) >= int(params['fromId'])]
+        elif since is not None:
+            trades = [t for t in trades if t['timestamp'] >= since]
+        return [dict(t) for t in (trades[:limit] if limit else trades)]
+
+    def create_order(self, symbol, type, side, amount, price=None, params={}):
+        self.calls['create_order'] += 1
+        oid = str(next(self._ids))
+        self.orders[oid] = {'id': oid, 'symbol': symbol, 'type': type, 'side': side, 'amount': amount,
+                            'price': price, 'status': 'open', 'filled': 0.0, 'remaining': amount,
+                            'average': None, 'timestamp': int(time.time() * 1000), 'trades': None,
+                            'clientOrderId': params.get('clientOrderId')}
+        return copy.deepcopy(self.orders[oid])
+
+    def create_orders(self, orders, params={}):
+        self.calls['create_orders'] += 1
+        return [self.create_order(o['symbol'], o['type'], o['side'], o['amount'], o.get('price'), o.get('params', {}))
+                for o in orders]
+
+    def fill(self, oid, amount, price, trade_id=None):
+        '''Simulate a fill of ``amount`` at ``price`` on an open order, listed in its trades if ``trade_id`` is given'''
+        order = self.orders[oid]
+        if trade_id is not None:
+            timestamp = int(time.time() * 1000)
+            order['trades'] = order.get('trades') or []
+            order['trades'].append({'id': trade_id, 'order': oid, 'timestamp': timestamp,
+                                                   'datetime': None, 'amount': amount, 'price': price})
+        cost = order['filled'] * (order['average'] or 0) + amount * price
+        order['filled'] += amount
+        order['remaining'] = order['amount'] - order['filled']
+        order['average'] = cost / order['filled']
+        if order['remaining'] <= 0:
+            order['status'] = 'closed'
+
+    def fetch_order(self, id, symbol=None, params={}):
+        self.calls['fetch_order'] += 1
+        return copy.deepcopy(self.orders[id])
+
+    def _orders(self, status, symbol):
+        return [copy.deepcopy(o) for o in self.orders.values()
+                if o['status'] in status and (symbol is None or o['symbol'] == symbol)]
+
+    def fetch_open_orders(self, symbol=None, since=None, limit=None, params={}):
+        self.calls['fetch_open_orders'] += 1
+        return self._orders(('open',), symbol)
+
+    def fetch_closed_orders(self, symbol=None, since=None, limit=None, params={}):
+        self.calls['fetch_closed_orders'] += 1
+        return self._orders(('closed', 'canceled'), symbol)
+
+    def cancel_order(self, id, symbol=None, params={}):
+        self.calls['cancel_order'] += 1
+        self.orders[id]['status'] = 'canceled'
+        return copy.deepcopy(self.orders[id])
+
+    def fetch_tickers(self, symbols=None, params={}):
+        self.calls['fetch_tickers'] += 1
+        return copy.deepcopy(self.tickers)
+
+    def fetch_balance(self, params={}):
+        self.calls['fetch_balance'] += 1
+        dict(params)  # 和ccxt一样,params不能是None
+        return copy.deepcopy(self.balance)
+
+
+class FakeStreamExchange(object):
+    '''ccxt.pro style double: each ``watch_*`` call returns the next result pushed by the test'''
+
+    has = {'watchOHLCV': True, 'watchOrders': True, 'watchMyTrades': True}
+
+    def __init__(self):
+        self.updates = {method: queue.Queue() for method in ('watch_ohlcv', 'watch_orders', 'watch_my_trades')}
+        self.closed = False
+
+    def push(self, method, result):
+        '''Queue a result (or an exception to raise) for ``method``'''
+        self.updates[method].put(result)
+
+    async def _next(self, method):
+        while True:
+            try:
+                result = self.updates[method].get_nowait()
+            except queue.Empty:
+                await asyncio.sleep(0.001)
+                continue
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+    async def watch_ohlcv(self, symbol, timeframe='1m', since=None, limit=None, params={}):
+        return await self._next('watch_ohlcv')
+
+    async def watch_orders(self, symbol=None, since=None, limit=None, params={}):
+        return await self._next('watch_orders')
+
+    async def watch_my_trades(self, symbol=None, since=None, limit=None, params={}):
+        return await self._next('watch_my_trades')
+
+    async def close(self):
+        self.closed = True
+
+
+def fake_exchange(name='fake'):
+    """Patch context registering ``FakeExchange`` as ``ccxt.<name>``"""
+    from unittest.mock import patch
+    return patch.object(ccxt, name, FakeExchange, create=True)
@@ -0,0 +1,361 @@
+import threading
+import time
+import unittest
+from datetime import datetime
+
+import backtrader as bt
+from ccxt.base.errors import OrderNotFound, RequestTimeout
+
+from ccxtbt import CCXTBroker, CCXTOrder, CCXTStore
+from test.ccxtbt.fakeexchange import FakeStreamExchange, fake_exchange
+from test.ccxtbt.test_ccxtfeed import make_feed, wait_for
+
+
+def make_data(dataname='BTC/USDT', close=100.0):
+    '''A feed with one loaded bar, enough for orders to be created against it'''
+    data = make_feed(dataname=dataname)
+    data._tz = None
+    data.forward()
+    data.lines.datetime[0] = bt.date2num(datetime(2020, 1, 1))
+    data.lines.close[0] = close
+    return data
+
+
+class BrokerTestCase(unittest.TestCase):
+
+    def broker_kwargs(self):
+        return {}
+
+    def setUp(self):
+        CCXTStore.clear_registry()
+        self.patcher = fake_exchange()
+        self.patcher.start()
+        self.addCleanup(self.patcher.stop)
+        kwargs = dict({'exchange': 'fake', 'currency': 'USDT', 'config': {}, 'retries': 1}, **self.broker_kwargs())
+        self.broker = CCXTBroker(**kwargs)
+        self.exchange = self.broker.store.exchange
+        self.datas = {}
+
+    def data(self, dataname='BTC/USDT'):
+        if dataname not in self.datas:
+            self.datas[dataname] = make_data(dataname)
+        return self.datas[dataname]
+
+    def buy(self, dataname='BTC/USDT', size=1.0, price=100.0):
+        return self.broker.buy(None, self.data(dataname), size, price=price, exectype=bt.Order.Limit,
+                               parent=None, transmit=True)
+
+    def notifications(self):
+        notifs = []
+        while True:
+            order = self.broker.get_notification()
+            if order is None:
+                return notifs
+            notifs.append(order)
+
+
+class TestBatchedOrderPolling(BrokerTestCase):
+
+    def test_order_not_found_yet_is_polled_again(self):
+        fetch_order = self.exchange.fetch_order
+
+        def not_found(*args, **kwargs):
+            raise OrderNotFound('-2013')
+        self.exchange.fetch_order = not_found
+        order = self.buy()  # 只有一个挂单,下单后直接查询
+        self.assertEqual(self.broker.open_orders, [order])
+        self.exchange.fill(order.ccxt_order['id'], 1.0, 100.0)
+        self.exchange.fetch_order = fetch_order
+        self.broker._next()
+        self.assertEqual(order.status, bt.Order.Completed)
+
+    def test_one_call_per_symbol(self):
+        orders = [self.buy('BTC/USDT') for _ in range(5)] + [self.buy('ETH/USDT') for _ in range(5)]
+        self.exchange.calls.clear()
+        self.broker._next()
+        self.assertEqual(self.exchange.calls['fetch_open_orders'], 2)
+        self.assertEqual(self.exchange.calls['fetch_order'], 0)
+        self.assertEqual(len(self.broker.open_orders), len(orders))
+
+    def test_only_gone_orders_are_fetched(self):
+        orders = [self.buy() for _ in range(5)]
+        self.exchange.fill(orders[2].ccxt_order['id'], 1.0, 99.0)
+        self.exchange.calls.clear()
+        self.notifications()
+        self.broker._next()
+        self.assertEqual(self.exchange.calls['fetch_open_orders'], 1)
+        self.assertEqual(self.exchange.calls['fetch_order'], 1)
+        self.assertEqual(len(self.broker.open_orders), 4)
+        notifs = self.notifications()
+        self.assertEqual([o.status for o in notifs], [bt.Order.Completed])
+        self.assertEqual(self.broker.getposition(self.data()).size, 1.0)
+
+    def test_account_wide_poll(self):
+        self.broker.order_poll = 'account'
+        self.buy('BTC/USDT')
+        self.buy('ETH/USDT')
+        self.exchange.calls.clear()
+        self.broker._next()
+        self.assertEqual(self.exchange.calls['fetch_open_orders'], 1)
+        self.assertEqual(self.exchange.calls['fetch_order'], 0)
+
+    def test_per_order_poll(self):
+        self.broker.order_poll = 'order'
+        for _ in range(3):
+            self.buy()
+        self.exchange.calls.clear()
+        self.broker._next()
+        self.assertEqual(self.exchange.calls['fetch_open_orders'], 0)
+        self.assertEqual(self.exchange.calls['fetch_order'], 3)
+
+
+class TestPollScheduling(BrokerTestCase):
+
+    def test_idle_without_open_orders(self):
+        self.broker.next()
+        self.assertIsNone(self.broker.poll_stats['interval'])
+        self.assertEqual(sum(self.exchange.calls.values()), 0)
+
+    def test_intervals_follow_the_orders(self):
+        now = time.time()
+        self.buy(price=90.0)
+        self.assertEqual(self.broker._poll_interval(now), self.broker.poll_fast)
+        later = now + self.broker.poll_fast_window + 1
+        self.assertEqual(self.broker._poll_interval(later), self.broker.poll_slow)
+        self.buy(price=99.0)
+        self.assertEqual(self.broker._poll_interval(later), self.broker.poll_interval)
+        self.buy(price=101.0)  # crosses the last close
+        self.assertEqual(self.broker._poll_interval(later), self.broker.poll_fast)
+
+    def test_polls_when_due_and_reports_lag(self):
+        self.buy(price=90.0)
+        polls = self.broker.poll_stats['polls']
+        self.broker.next()
+        self.assertEqual(self.broker.poll_stats['polls'], polls)
+        self.broker._last_op_time -= self.broker.poll_fast + 2
+        self.broker.next()
+        self.assertEqual(self.broker.poll_stats['polls'], polls + 1)
+        self.assertEqual(self.broker.poll_stats['interval'], self.broker.poll_fast)
+        self.assertGreaterEqual(self.broker.poll_stats['lag'], 2)
+
+
+class TestAsyncSubmission(BrokerTestCase):
+
+    def broker_kwargs(self):
+        return {'async_submit': True, 'submit_workers': 1}
+
+    def acks(self, count):
+        self.assertTrue(wait_for(lambda: self.broker._submit_acks.qsize() >= count))
+        self.broker._next_acks()
+        return self.notifications()
+
+    def test_returns_submitted_and_notifies_accepted(self):
+        order = self.buy()
+        self.assertEqual(order.status, bt.Order.Submitted)
+        self.assertEqual([n.status for n in self.acks(1)], [bt.Order.Submitted, bt.Order.Accepted])
+        self.assertEqual(self.broker.open_orders, [order])
+        self.assertEqual(self.exchange.calls['create_order'], 1)
+
+    def test_batches_orders_queued_while_in_flight(self):
+        self.exchange.has = dict(self.exchange.has, createOrders=True)
+        release = threading.Event()
+        create_order = self.exchange.create_order
+
+        def slow_create_order(*args, **kwargs):
+            release.wait(5)
+            return create_order(*args, **kwargs)
+        self.exchange.create_order = slow_create_order
+        orders = [self.buy() for _ in range(5)]
+        release.set()
+        self.acks(5)
+        self.assertEqual(len(self.broker.open_orders), 5)
+        self.assertEqual(self.exchange.calls['create_orders'], 1)
+        self.assertTrue(all(o.status == bt.Order.Accepted for o in orders))
+
+    def test_failed_batch_is_reconciled_by_client_id(self):
+        self.exchange.has = dict(self.exchange.has, createOrders=True)
+        self.broker.store.idempotent_orders = True
+        release = threading.Event()
+        create_order = self.exchange.create_order
+
+        def slow_create_order(*args, **kwargs):
+            release.wait(5)
+            return create_order(*args, **kwargs)
+
+        def timed_out_create_orders(orders, params={}):
+            # 交易所收下了前两张单,但请求超时
+            for o in orders[:2]:
+                create_order(o['symbol'], o['type'], o['side'], o['amount'], o['price'], o['params'])
+            raise RequestTimeout('timed out')
+        self.exchange.create_order = slow_create_order
+        self.exchange.create_orders = timed_out_create_orders
+        orders = [self.buy() for _ in range(4)]
+        release.set()
+        self.acks(4)
+        self.assertEqual([o.status for o in orders],
+                         [bt.Order.Accepted] * 3 + [bt.Order.Rejected])
+        self.assertEqual(len(self.exchange.orders), 3)
+
+    def test_orders_missing_from_batch_result_are_rejected(self):
+        self.exchange.has = dict(self.exchange.has, createOrders=True)
+        release, in_flight = threading.Event(), threading.Event()
+        create_order = self.exchange.create_order
+
+        def slow_create_order(*args, **kwargs):
+            release.wait(5)
+            return create_order(*args, **kwargs)
+
+        def short_create_orders(orders, params={}):
+            # 交易所只返回了第一张单的结果
+            in_flight.set()
+            release.wait(5)
+            o = orders[0]
+            return [create_order(o['symbol'], o['type'], o['side'], o['amount'], o['price'], o['params'])]
+        self.exchange.create_order = slow_create_order
+        self.exchange.create_orders = short_create_orders
+        orders = [self.buy() for _ in range(4)]
+        release.set()
+        self.assertTrue(in_flight.wait(5))
+        self.broker.cancel(orders[3])  # cancelled before its batch is acknowledged
+        self.acks(4)
+        self.assertEqual([o.status for o in orders],
+                         [bt.Order.Accepted] * 2 + [bt.Order.Rejected] * 2)
+        self.assertEqual(self.broker._cancel_on_ack, set())
+
+    def test_rejected_on_error(self):
+        self.exchange.create_order = lambda *args, **kwargs: 1 / 0
+        order = self.buy()
+        self.assertEqual(self.acks(1)[-1].status, bt.Order.Rejected)
+        self.assertEqual(order.status, bt.Order.Rejected)
+        self.assertEqual(self.broker.open_orders, [])
+
+    def test_cancel_before_ack(self):
+        release = threading.Event()
+        create_order = self.exchange.create_order
+        self.exchange.create_order = lambda *args, **kwargs: release.wait(5) and create_order(*args, **kwargs)
+        sent, queued = self.buy(), self.buy()
+        self.broker.cancel(queued)  # never sent
+        self.broker.cancel(sent)  # cancelled once acknowledged
+        release.set()
+        self.acks(1)
+        self.assertEqual(queued.status, bt.Order.Canceled)
+        self.assertEqual(sent.status, bt.Order.Canceled)
+        self.assertEqual(self.exchange.calls['create_order'], 1)
+        self.assertEqual(self.exchange.calls['cancel_order'], 1)
+
+
+class TestOrderChecks(BrokerTestCase):
+
+    def test_rounds_to_market_precision(self):
+        order = self.buy(size=0.123456, price=100.004)
+        sent = self.exchange.orders[order.ccxt_order['id']]
+        self.assertEqual((sent['amount'], sent['price']), (0.1234, 100.0))
+
+    def test_rejects_locally_with_reason(self):
+        for size, reason in ((0.00001, 'minimum amount precision'), (0.05, 'cost 5.0 is below the minimum')):
+            order = self.buy(size=size)
+            self.assertEqual(order.status, bt.Order.Rejected)
+            self.assertIn(reason, order.info.reject_reason)
+        self.assertEqual(self.exchange.calls['create_order'], 0)
+        self.assertEqual(self.exchange.calls['load_markets'], 1)
+
+
+class TestFillDeduplication(BrokerTestCase):
+
+    def test_trades_are_applied_once(self):
+        order = self.buy(size=3.0)
+        oid = order.ccxt_order['id']
+        self.notifications()
+        self.exchange.fill(oid, 1.0, 98.0, trade_id='t1')
+        self.broker._next()
+        self.broker._next()
+        self.exchange.fill(oid, 1.0, 100.0, trade_id='t2')
+        self.broker._next()
+        self.broker._next()
+        notifs = self.notifications()
+        self.assertEqual([n.status for n in notifs], [bt.Order.Partial, bt.Order.Partial])
+        self.assertEqual(self.broker.getposition(self.data()).size, 2.0)
+        self.assertEqual(order.executed_fills, {'t1', 't2'})
+
+    def test_trades_without_id_are_applied_once(self):
+        order = CCXTOrder(None, self.data(), bt.Order.Limit, 'buy', 3.0, 1.0, {})
+        trades = [{'id': None, 'timestamp': 1000, 'amount': 1.0, 'price': 1.0}]
+        self.assertEqual(len(order.new_fills(trades)), 1)
+        trades.append({'id': None, 'timestamp': 2000, 'amount': 1.0, 'price': 1.1})
+        trades.append({'id': None, 'timestamp': 2000, 'amount': 0.5, 'price': 1.1})
+        self.assertEqual([t['amount'] for t in order.new_fills(trades)], [1.0, 0.5])
+        self.assertEqual(order.new_fills(trades), [])
+
+    def test_only_trades_after_the_watermark_are_walked(self):
+        order = CCXTOrder(None, self.data(), bt.Order.Limit, 'buy', 1000, 1.0, {})
+        trades = [{'id': i, 'timestamp': 1000 + i, 'amount': 1.0, 'price': 1.0} for i in range(500)]
+        self.assertEqual(len(order.new_fills(trades)), 500)
+        self.assertEqual(order.fill_watermark, 1499)
+
+        class Counting(dict):
+            reads = 0
+
+            def get(self, key, default=None):
+                Counting.reads += 1
+                return dict.get(self, key, default)
+
+        trades = [Counting(t) for t in trades]
+        trades.append(Counting({'id': 500, 'timestamp': 1500, 'amount': 1.0, 'price': 1.0}))
+        self.assertEqual([t['id'] for t in order.new_fills(trades)], [500])
+        self.assertEqual(order.new_fills(trades), [])
+        # Each call stopped right below the watermark instead of re-walking all trades
+        self.assertLess(Counting.reads, 10)
+
+
+class TestStreamedOrderUpdates(BrokerTestCase):
+
+    def broker_kwargs(self):
+        self.stream = FakeStreamExchange()
+        return {'stream': self.stream}
+
+    def tearDown(self):
+        self.broker.stop()
+        self.broker.store.stream.stop()
+
+    def stream_next(self, expected):
+        '''Run broker.next() until ``expected`` notifications arrived'''
+        notifs = []
+        def received():
+            self.broker.next()
+            notifs.extend(self.notifications())
+            return len(notifs) >= expected
+        self.assertTrue(wait_for(received))
+        return notifs
+
+    def test_fill_from_order_update(self):
+        order = self.buy(size=2.0)
+        self.notifications()
+        self.broker.next()
+        update = dict(self.exchange.orders[order.ccxt_order['id']], status='closed', filled=2.0, average=99.0)
+        self.exchange.calls.clear()
+        self.stream.push('watch_orders', [update])
+        notifs = self.stream_next(1)
+        self.assertEqual(notifs[0].status, bt.Order.Completed)
+        self.assertEqual(notifs[0].executed.price, 99.0)
+        self.assertEqual(self.broker.open_orders, [])
+        # No REST call was needed to learn about the fill
+        self.assertEqual(sum(self.exchange.calls.values()), 0)
+
+    def test_fills_from_trades(self):
+        order = self.buy(size=2.0)
+        self.notifications()
+        self.broker.next()
+        oid = order.ccxt_order['id']
+        trades = [{'id': 't1', 'order': oid, 'datetime': None, 'amount': 1.0, 'price': 98.0},
+                  {'id': 't2', 'order': oid, 'datetime': None, 'amount': 1.0, 'price': 100.0}]
+        self.stream.push('watch_my_trades', trades)
+        self.assertTrue(wait_for(lambda: self.broker._stream_updates.qsize() == 1))
+        update = dict(self.exchange.orders[oid], status='closed', filled=2.0, average=99.0)
+        self.stream.push('watch_orders', [update])
+        notifs = self.stream_next(2)
+        self.assertEqual([n.executed.size for n in notifs], [1.0, 2.0])
+        self.assertEqual(self.broker.getposition(self.data()).price, 99.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
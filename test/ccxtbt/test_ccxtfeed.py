@@ -0,0 +1,194 @@
+import calendar
+import time
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import backtrader as bt
+from backtrader import TimeFrame
+
+from ccxtbt import CCXTFeed, CCXTStore
+from test.ccxtbt.fakeexchange import FakeStreamExchange, fake_exchange
+
+
+def make_feed(**kwargs):
+    params = dict(exchange='fake', currency='USDT', config={}, retries=1,
+                  dataname='BTC/USDT', timeframe=TimeFrame.Minutes, compression=1)
+    params.update(kwargs)
+    return CCXTFeed(**params)
+
+
+class TestLivePolling(unittest.TestCase):
+
+    def setUp(self):
+        CCXTStore.clear_registry()
+        self.patcher = fake_exchange()
+        self.patcher.start()
+        self.addCleanup(self.patcher.stop)
+
+    def test_schedule_follows_bar_close(self):
+        feed = make_feed(poll_delay=2.0, poll_retry=5.0)
+        now = 1600000030.0  # 30 seconds into a minute
+        # The bar that closed at 1600000020 has been received: wait for the next close
+        feed._last_ts = 1599999960 * 1000
+        feed._schedule_poll(now)
+        self.assertEqual(feed._next_poll_time, 1600000080 + 2.0)
+
+    def test_schedule_retries_late_bar(self):
+        feed = make_feed(poll_delay=2.0, poll_retry=5.0)
+        now = 1600000030.0
+        feed._last_ts = 1599999900 * 1000  # last closed bar still missing
+        feed._schedule_poll(now)
+        self.assertEqual(feed._next_poll_time, now + 5.0)
+
+    def test_weekly_schedule_follows_monday_close(self):
+        feed = make_feed(timeframe=TimeFrame.Weeks, poll_delay=1.0)
+        feed.store.exchange.timeframes = dict(feed.store.exchange.timeframes, **{'1w': '1w'})
+        monday = calendar.timegm((2024, 1, 8, 0, 0, 0))
+        feed._last_ts = (monday - 7 * 86400) * 1000  # 上周的bar已经收到
+        feed._schedule_poll(calendar.timegm((2024, 1, 2, 10, 0, 0)))
+        self.assertEqual(feed._next_poll_time, monday + 1.0)
+        # 周一刚收盘的bar还没有收到时稍后重试,收到后等到下周一
+        feed._last_ts = (monday - 14 * 86400) * 1000
+        feed._schedule_poll(monday + 30)
+        self.assertEqual(feed._next_poll_time, monday + 30 + 5.0)
+        feed._last_ts = (monday - 7 * 86400) * 1000
+        feed._schedule_poll(monday + 30)
+        self.assertEqual(feed._next_poll_time, monday + 7 * 86400 + 1.0)
+
+    def test_monthly_bars_are_polled_at_a_fixed_interval(self):
+        feed = make_feed(timeframe=TimeFrame.Months)
+        feed.store.exchange.timeframes = dict(feed.store.exchange.timeframes, **{'1M': '1M'})
+        now = calendar.timegm((2024, 1, 31, 12, 0, 0))
+        feed._last_ts = calendar.timegm((2023, 12, 1, 0, 0, 0)) * 1000
+        feed._schedule_poll(now)
+        self.assertEqual(feed._next_poll_time, now + feed.CALENDAR_POLL)
+
+    def test_threaded_poller_fills_queue(self):
+        feed = make_feed(threaded=True)
+        start_ts = (int(time.time()) // 60 - 5) * 60000
+        feed.store.exchange.add_bars('BTC/USDT', start_ts, 5)
+        feed._last_ts = start_ts - 60000
+        feed._start_poller()
+        try:
+            deadline = time.time() + 5
+            while feed._data.qsize() < 5 and time.time() < deadline:
+                time.sleep(0.01)
+        finally:
+            feed.stop()
+        self.assertEqual(feed._data.qsize(), 5)
+        self.assertIsNone(feed._poller)
+        # All bars are in: the next poll waits for the next bar close
+        self.assertGreater(feed._next_poll_time, time.time())
+
+    def test_gap_is_caught_up_in_one_poll(self):
+        feed = make_feed(ohlcv_limit=10)
+        exchange = feed.store.exchange
+        start_ts = (int(time.time()) // 60 - 100) * 60000
+        exchange.add_bars('BTC/USDT', start_ts, 100)
+        feed._last_ts = start_ts - 60000  # 断线了100分钟
+        feed._update_bar(livemode=True)
+        self.assertEqual(feed._data.qsize(), 100)
+        self.assertGreaterEqual(exchange.calls['fetch_ohlcv'], 10)
+        self.assertEqual(list(feed.notifs)[-1], (feed.LIVE, (), {'backfilled': 100}))
+
+    def test_only_the_closed_bar_missing_fetches_one_page(self):
+        feed = make_feed(ohlcv_limit=10)
+        exchange = feed.store.exchange
+        start_ts = (int(time.time()) // 60 - 1) * 60000
+        exchange.add_bars('BTC/USDT', start_ts, 1)
+        feed._last_ts = start_ts - 60000
+        feed._update_bar(livemode=True)
+        self.assertEqual(feed._data.qsize(), 1)
+        self.assertEqual(exchange.calls['fetch_ohlcv'], 1)
+        self.assertEqual(len(feed.notifs), 0)
+
+
+class RecordingStrategy(bt.Strategy):
+
+    def __init__(self):
+        self.bars = []
+
+    def next(self):
+        self.bars.append((self.data.datetime.datetime(0), self.data.close[0]))
+
+
+class TestHistorical(unittest.TestCase):
+
+    def setUp(self):
+        CCXTStore.clear_registry()
+        self.patcher = fake_exchange()
+        self.patcher.start()
+        self.addCleanup(self.patcher.stop)
+
+    def run_cerebro(self, preload=True, runonce=True, **kwargs):
+        start = datetime(2020, 1, 1)
+        feed = make_feed(fromdate=start, todate=start + timedelta(minutes=99), historical=True, ohlcv_limit=30, **kwargs)
+        feed.store.exchange.add_bars('BTC/USDT', 1577836800000, 200)
+        cerebro = bt.Cerebro(preload=preload, runonce=runonce)
+        cerebro.adddata(feed)
+        cerebro.addstrategy(RecordingStrategy)
+        return cerebro.run()[0].bars
+
+    def test_bars_reach_strategy(self):
+        bars = self.run_cerebro()
+        # The bar at fromdate itself is skipped, as it always has been
+        self.assertEqual(len(bars), 99)
+        self.assertEqual(bars[0], (datetime(2020, 1, 1, 0, 1), 2.5))
+        self.assertEqual(bars[-1], (datetime(2020, 1, 1, 1, 39), 100.5))
+
+    def test_bulk_preload_matches_bar_by_bar(self):
+        with patch.object(CCXTFeed, '_load', wraps=CCXTFeed._load, autospec=True) as load:
+            preloaded = self.run_cerebro()
+        # The whole history went into the lines without a _load call per bar
+        load.assert_not_called()
+        CCXTStore.clear_registry()
+        self.assertEqual(preloaded, self.run_cerebro(preload=False, runonce=False))
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+class TestStreaming(unittest.TestCase):
+
+    def setUp(self):
+        CCXTStore.clear_registry()
+        self.patcher = fake_exchange()
+        self.patcher.start()
+        self.addCleanup(self.patcher.stop)
+        self.stream = FakeStreamExchange()
+        self.feed = make_feed(streaming=True, stream=self.stream)
+        self.feed._last_ts = 0
+        self.feed._laststatus = None  # normally set when cerebro starts the feed
+        self.addCleanup(self.feed.store.stream.stop)
+
+    def test_only_closed_bars_are_queued(self):
+        feed = self.feed
+        feed._subscribe()
+        self.stream.push('watch_ohlcv', [[60000, 1, 2, 0, 1, 5], [120000, 1, 2, 0, 1, 1]])
+        self.assertTrue(wait_for(lambda: feed._data.qsize() == 1))
+        self.stream.push('watch_ohlcv', [[120000, 1, 3, 0, 2, 7]])
+        self.stream.push('watch_ohlcv', [[180000, 2, 2, 2, 2, 1]])
+        self.assertTrue(wait_for(lambda: feed._data.qsize() == 2))
+        feed.stop()
+        bars = [feed._data.get()[:6], feed._data.get()[:6]]
+        self.assertEqual(bars, [[60000, 1, 2, 0, 1, 5], [120000, 1, 3, 0, 2, 7]])
+        self.assertEqual(feed._last_ts, 120000)
+
+    def test_stream_errors_are_notified(self):
+        feed = self.feed
+        feed.store.stream.reconnect_delay = 0
+        feed._subscribe()
+        self.stream.push('watch_ohlcv', RuntimeError('disconnected'))
+        self.stream.push('watch_ohlcv', [[60000, 1, 2, 0, 1, 5]])
+        self.assertTrue(wait_for(lambda: len(feed.notifs) == 2))
+        feed.stop()
+        self.assertEqual([n[0] for n in feed.notifs], [feed.CONNBROKEN, feed.LIVE])
+
+
+if __name__ == '__main__':
+    unittest.main()
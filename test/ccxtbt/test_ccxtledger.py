@@ -0,0 +1,82 @@
+import unittest
+
+import backtrader as bt
+
+from ccxtbt import CCXTLedger
+from test.ccxtbt.test_ccxtbroker import BrokerTestCase
+
+
+class TestCCXTLedger(unittest.TestCase):
+
+    def setUp(self):
+        self.ledger = CCXTLedger({'free': {'USDT': 1000.0}, 'total': {'USDT': 1000.0}})
+
+    def test_limit_buy_reserves_then_fills(self):
+        self.ledger.open_order('1', 'BTC/USDT', 'buy', 2.0, 100.0)
+        self.assertEqual(self.ledger.free['USDT'], 800.0)
+        self.assertEqual(self.ledger.total['USDT'], 1000.0)
+        self.ledger.fill('1', 'BTC/USDT', 'buy', 1.0, 99.0, {'cost': 0.001, 'currency': 'BTC'})
+        self.assertEqual(self.ledger.free['USDT'], 801.0)
+        self.assertEqual(self.ledger.total['USDT'], 901.0)
+        self.assertAlmostEqual(self.ledger.total['BTC'], 0.999)
+        self.ledger.close_order('1')
+        self.assertEqual(self.ledger.free['USDT'], 901.0)
+
+    def test_contracts_book_fees_only(self):
+        self.ledger.fill('1', 'BTC/USDT:USDT', 'sell', 1.0, 100.0, {'cost': 0.5, 'currency': 'USDT'})
+        self.assertEqual(self.ledger.total['USDT'], 999.5)
+        self.assertNotIn('BTC', self.ledger.total)
+
+    def test_reconcile_reports_drift(self):
+        self.ledger.fill('1', 'BTC/USDT', 'buy', 1.0, 100.0)
+        drift = self.ledger.reconcile({'free': {'USDT': 899.0, 'BTC': 1.0}, 'total': {'USDT': 899.0, 'BTC': 1.0}})
+        self.assertEqual(drift, {'USDT': -1.0})
+        self.assertEqual(self.ledger.total['USDT'], 899.0)
+
+
+class TestBrokerLedger(BrokerTestCase):
+
+    def broker_kwargs(self):
+        return {'config': {'apiKey': 'key', 'secret': 'secret'}, 'reconcile_interval': 60}
+
+    def test_cash_and_value_follow_fills_without_rest_calls(self):
+        self.assertEqual((self.broker.getcash(), self.broker.getvalue()), (1000.0, 1000.0))
+        order = self.buy(size=2.0, price=100.0)
+        self.assertEqual(self.broker.getcash(), 800.0)
+        self.exchange.fill(order.ccxt_order['id'], 2.0, 100.0)
+        self.exchange.orders[order.ccxt_order['id']]['fee'] = {'cost': 0.2, 'currency': 'USDT'}
+        self.exchange.calls.clear()
+        self.broker._next()
+        self.assertEqual(self.broker.getcash(), 799.8)
+        self.assertEqual(self.broker.getvalue(), 799.8)
+        self.assertEqual(self.broker.ledger.total['BTC'], 2.0)
+        self.assertEqual(self.exchange.calls['fetch_balance'], 0)
+
+    def test_periodic_reconciliation(self):
+        self.exchange.balance = {'free': {'USDT': 990.0}, 'total': {'USDT': 990.0}}
+        self.broker.next()
+        self.assertEqual(self.exchange.calls['fetch_balance'], 1)  # only the initial fetch
+        self.broker._last_reconcile -= 60
+        self.broker.next()
+        self.assertEqual(self.broker.ledger_drift, {'USDT': -10.0})
+        self.assertEqual(self.broker.getcash(), 990.0)
+
+    def test_unpolled_fill_is_not_booked_twice(self):
+        order = self.buy(size=2.0, price=100.0)
+        self.exchange.fill(order.ccxt_order['id'], 2.0, 100.0)
+        # 交易所余额已经包含了这笔成交,但是经纪商还没有轮询到
+        self.exchange.balance = {'free': {'USDT': 800.0, 'BTC': 2.0}, 'total': {'USDT': 800.0, 'BTC': 2.0}}
+        self.broker._last_reconcile -= 60
+        self.broker.next()
+        self.assertEqual(order.status, bt.Order.Completed)
+        self.assertEqual(self.broker.ledger.total['BTC'], 2.0)
+        self.assertEqual(self.broker.getcash(), 800.0)
+        due = self.broker._last_reconcile
+        self.broker.next()  # 上次轮询到了成交没有核对,现在没有挂单了
+        self.assertGreater(self.broker._last_reconcile, due)
+        self.assertEqual(self.broker.ledger_drift, {})
+        self.assertEqual(self.broker.ledger.total['BTC'], 2.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
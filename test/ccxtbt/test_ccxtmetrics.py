@@ -0,0 +1,132 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from ccxt.base.errors import RequestTimeout
+
+from ccxtbt import CCXTBroker, CCXTStore, MemorySink, Metrics, NULL_METRICS, PrometheusFileSink, StatsDSink
+from test.ccxtbt.fakeexchange import fake_exchange
+from test.ccxtbt.test_ccxtfeed import make_feed
+
+
+class TestSinks(unittest.TestCase):
+
+    def test_memory_histogram(self):
+        sink = MemorySink(buckets=(0.1, 1.0))
+        metrics = Metrics(sink)
+        for seconds in (0.05, 0.5, 5.0):
+            metrics.timing('call_seconds', seconds, method='fetch_order')
+        self.assertEqual(sink.snapshot()['histograms'][('call_seconds', (('method', 'fetch_order'),))],
+                         [1, 1, 5.55, 3])
+
+    def test_prometheus_text_file(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        sink = PrometheusFileSink(os.path.join(path, 'ccxtbt.prom'), buckets=(0.1, 1.0))
+        metrics = Metrics(sink)
+        metrics.count('store_calls', method='fetch_order')
+        metrics.timing('store_call_seconds', 0.5, method='fetch_order')
+        sink.flush()
+        with open(sink.path) as f:
+            text = f.read()
+        self.assertIn('# TYPE ccxtbt_store_calls_total counter\nccxtbt_store_calls_total{method="fetch_order"} 1.0\n',
+                      text)
+        self.assertIn('ccxtbt_store_call_seconds_bucket{method="fetch_order",le="0.1"} 0\n', text)
+        self.assertIn('ccxtbt_store_call_seconds_bucket{method="fetch_order",le="+Inf"} 1\n', text)
+        self.assertIn('ccxtbt_store_call_seconds_count{method="fetch_order"} 1\n', text)
+
+    def test_prometheus_concurrent_flushes(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        sink = PrometheusFileSink(os.path.join(path, 'ccxtbt.prom'), interval=0)
+        metrics = Metrics(sink)
+
+        def record():
+            for _ in range(50):
+                metrics.count('store_calls', method='fetch_order')
+
+        threads = [threading.Thread(target=record) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        sink.flush()
+        self.assertEqual(os.listdir(path), ['ccxtbt.prom'])
+        with open(sink.path) as f:
+            self.assertIn('ccxtbt_store_calls_total{method="fetch_order"} 200.0\n', f.read())
+
+    def test_prometheus_write_errors_are_ignored(self):
+        CCXTStore.clear_registry()
+        patcher = fake_exchange()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        sink = PrometheusFileSink(os.path.join(tempfile.gettempdir(), 'missing-folder', 'ccxtbt.prom'), interval=0)
+        store = CCXTStore(exchange='fake', currency='USDT', config={}, retries=1, metrics=Metrics(sink))
+        with patch.object(store.exchange, 'fetch_order', return_value={'id': '1'}):
+            self.assertEqual(store.fetch_order('1', 'BTC/USDT'), {'id': '1'})
+        sink.flush()
+        self.assertEqual(sink.snapshot()['counters'][('store_calls', (('method', 'fetch_order'),))], 1)
+
+    def test_statsd_datagrams(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.addCleanup(listener.close)
+        listener.bind(('127.0.0.1', 0))
+        listener.settimeout(5)
+        metrics = Metrics(StatsDSink(port=listener.getsockname()[1]))
+        metrics.timing('store_call_seconds', 0.25, method='fetch_order')
+        self.assertEqual(listener.recv(1024), b'ccxtbt.store_call_seconds:250.0|ms|#method:fetch_order')
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        CCXTStore.clear_registry()
+        self.patcher = fake_exchange()
+        self.patcher.start()
+        self.addCleanup(self.patcher.stop)
+        self.sink = MemorySink()
+        self.store = CCXTStore(exchange='fake', currency='USDT', config={}, retries=2, retry_backoff=0,
+                               metrics=Metrics(self.sink))
+
+    def test_store_calls_errors_and_retries(self):
+        with patch.object(self.store.exchange, 'fetch_order', side_effect=[RequestTimeout('slow'), {}]):
+            self.store.fetch_order('1', 'BTC/USDT')
+        counters = self.sink.snapshot()['counters']
+        self.assertEqual(counters[('store_calls', (('method', 'fetch_order'),))], 2)
+        self.assertEqual(counters[('store_errors', (('error', 'RequestTimeout'), ('method', 'fetch_order')))], 1)
+        self.assertEqual(counters[('store_retries', (('error', 'RequestTimeout'), ('method', 'fetch_order')))], 1)
+        self.assertEqual(self.sink.snapshot()['histograms'][('store_call_seconds', (('method', 'fetch_order'),))][-1], 2)
+
+    def test_broker_poll_cycle(self):
+        broker = self.store.getbroker()
+        broker._next()
+        snapshot = self.sink.snapshot()
+        self.assertEqual(snapshot['gauges'][('broker_open_orders', ())], 0)
+        self.assertEqual(snapshot['histograms'][('broker_poll_seconds', ())][-1], 1)
+
+    def test_feed_lag(self):
+        feed = make_feed(store=self.store)
+        feed._state = feed._ST_LIVE
+        feed._tz = None
+        feed.forward()
+        close_ts = (int(time.time()) // 60) * 60000
+        feed._data.put([close_ts - 60000, 1.0, 1.0, 1.0, 1.0, 1.0])
+        feed._load_bar()
+        histogram = self.sink.snapshot()['histograms'][('feed_lag_seconds', (('symbol', 'BTC/USDT'),))]
+        self.assertEqual(histogram[-1], 1)
+        self.assertLess(histogram[-2], 61)
+
+    def test_disabled_by_default(self):
+        CCXTStore.clear_registry()
+        store = CCXTStore(exchange='fake', currency='USDT', config={}, retries=1)
+        self.assertIs(store.metrics, NULL_METRICS)
+        self.assertIsInstance(store.getbroker(), CCXTBroker)
+
+
+if __name__ == '__main__':
+    unittest.main()
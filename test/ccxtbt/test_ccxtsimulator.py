@@ -0,0 +1,119 @@
+import unittest
+from datetime import datetime, timedelta
+
+import backtrader as bt
+import numpy as np
+from ccxt.base.errors import InvalidOrder
+
+from ccxtbt import CCXTStore, SimulatedExchange
+
+START = 1577836800000  # 2020-01-01
+
+
+def bars(closes):
+    closes = np.asarray(closes, dtype=np.float64)
+    ts = START + np.arange(len(closes)) * 60000
+    return np.column_stack([ts, closes, closes + 1, closes - 1, closes, np.ones(len(closes))])
+
+
+class TestSimulatedExchange(unittest.TestCase):
+
+    def setUp(self):
+        self.exchange = SimulatedExchange({'ohlcv': {'BTC/USDT': bars([100, 102, 98, 95, 105])},
+                                           'balance': {'USDT': 1000.0},
+                                           'fees': {'maker': 0.001, 'taker': 0.002}})
+
+    def order(self, *args, **kwargs):
+        params = {'created': kwargs.pop('created', START)}
+        return self.exchange.create_order('BTC/USDT', *args, params=params, **kwargs)
+
+    def advance(self, bar):
+        self.exchange.advance('BTC/USDT', START + bar * 60000)
+
+    def test_market_order_fills_at_the_next_open(self):
+        order = self.order('market', 'buy', 2.0)
+        self.assertEqual(self.exchange.fetch_order(order['id'])['status'], 'open')
+        self.advance(1)
+        order = self.exchange.fetch_order(order['id'])
+        self.assertEqual(order['status'], 'closed')
+        self.assertEqual(order['average'], 102.0)
+        self.assertEqual(order['trades'][0]['takerOrMaker'], 'taker')
+        self.assertAlmostEqual(order['fee']['cost'], 204.0 * 0.002)
+        balance = self.exchange.fetch_balance()
+        self.assertEqual(balance['free']['BTC'], 2.0)
+        self.assertAlmostEqual(balance['free']['USDT'], 1000.0 - 204.0 - 204.0 * 0.002)
+
+    def test_limit_order_fills_at_its_price_when_touched(self):
+        order = self.order('limit', 'buy', 1.0, 97.5)
+        self.advance(1)
+        self.assertEqual(self.exchange.fetch_order(order['id'])['status'], 'open')  # low 101
+        self.advance(4)
+        order = self.exchange.fetch_order(order['id'])
+        self.assertEqual(order['average'], 97.5)
+        self.assertEqual(order['trades'][0]['timestamp'], START + 2 * 60000)
+        self.assertEqual(order['trades'][0]['takerOrMaker'], 'maker')
+
+    def test_marketable_limit_and_stop_fill_at_the_open(self):
+        limit = self.order('limit', 'sell', 1.0, 101.0)
+        stop = self.order('stop', 'sell', 1.0, 99.0, created=START + 60000)
+        self.advance(4)
+        self.assertEqual(self.exchange.fetch_order(limit['id'])['average'], 102.0)
+        self.assertEqual(self.exchange.fetch_order(stop['id'])['average'], 98.0)
+
+    def test_latency_delays_the_fill(self):
+        self.exchange.latency = 90000
+        order = self.order('market', 'buy', 1.0)
+        self.advance(4)
+        self.assertEqual(self.exchange.fetch_order(order['id'])['average'], 98.0)
+
+    def test_cancel_and_unsupported_orders(self):
+        order = self.order('limit', 'buy', 1.0, 50.0)
+        self.advance(4)
+        self.assertEqual(self.exchange.cancel_order(order['id'])['status'], 'canceled')
+        self.assertEqual(self.exchange.fetch_open_orders('BTC/USDT'), [])
+        with self.assertRaises(InvalidOrder):
+            self.order('stop limit', 'buy', 1.0, 50.0)
+
+
+class TestSimulatedBacktest(unittest.TestCase):
+
+    class Strategy(bt.Strategy):
+
+        def __init__(self):
+            self.completed = []
+            self.first = None
+
+        def notify_order(self, order):
+            if order.status == order.Completed:
+                self.completed.append((bt.num2date(self.data.datetime[0]), order.executed.price))
+
+        def next(self):
+            if self.first is None:
+                self.first = (bt.num2date(self.data.datetime[0]), self.data.close[0])
+            if len(self) % 2:
+                self.buy(size=0.5)
+            else:
+                self.sell(size=0.5)
+
+    def test_cerebro_run_through_the_broker(self):
+        CCXTStore.clear_registry()
+        exchange = SimulatedExchange({'ohlcv': {'BTC/USDT': bars(100 + np.arange(50))},
+                                      'balance': {'USDT': 1000.0}, 'fees': {'taker': 0.0}})
+        store = CCXTStore(exchange=exchange, currency='USDT', config={}, retries=1)
+        cerebro = bt.Cerebro()
+        cerebro.setbroker(store.getbroker())
+        cerebro.adddata(store.getdata(dataname='BTC/USDT', timeframe=bt.TimeFrame.Minutes, compression=1,
+                                      fromdate=datetime(2020, 1, 1), historical=True, ohlcv_limit=20))
+        strategy = cerebro.addstrategy(self.Strategy)
+        strategy = cerebro.run()[0]
+
+        # 每张单都在下一根bar按开盘价成交,最后一张单没有下一根bar
+        first_bar, first_close = strategy.first
+        self.assertEqual(len(strategy.completed), len(strategy) - 1)
+        self.assertEqual(strategy.completed[0], (first_bar + timedelta(minutes=1), first_close + 1))
+        self.assertAlmostEqual(cerebro.broker.getcash(), exchange.fetch_balance()['free']['USDT'])
+        self.assertEqual(cerebro.broker.ledger.total['BTC'], exchange.fetch_balance()['total'].get('BTC', 0.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,316 @@
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from ccxt.base.errors import InsufficientFunds, NetworkError, OrderNotFound, RateLimitExceeded, RequestTimeout
+
+from ccxtbt import CCXTStore, RateLimiter
+from test.ccxtbt.fakeexchange import FakeExchange, fake_exchange
+from test.ccxtbt.test_ccxtfeed import make_feed
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+class TestOHLCVScheduler(unittest.TestCase):
+
+    def setUp(self):
+        CCXTStore.clear_registry()
+        self.patcher = fake_exchange()
+        self.patcher.start()
+        self.addCleanup(self.patcher.stop)
+
+    def test_refreshes_all_registered_feeds(self):
+        symbols = ['BTC/USDT', 'ETH/USDT', 'EOS/USDT']
+        feeds = [make_feed(dataname=symbol, store_poller=True) for symbol in symbols]
+        store = feeds[0].store
+        start_ts = (int(time.time()) // 60 - 3) * 60000
+        for feed in feeds:
+            store.exchange.add_bars(feed.p.dataname, start_ts, 3)
+            feed._last_ts = start_ts - 60000
+            store.ohlcv_scheduler.register(feed)
+
+        self.assertTrue(wait_for(lambda: all(feed._data.qsize() == 3 for feed in feeds)))
+        # One refresh per feed, not one per feed and retry
+        self.assertEqual(store.exchange.calls['fetch_ohlcv'], 3)
+
+        for feed in feeds:
+            store.ohlcv_scheduler.unregister(feed)
+        self.assertTrue(wait_for(lambda: store.ohlcv_scheduler._thread is None))
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_idle_bucket_does_not_sleep(self):
+        limiter = RateLimiter(rate=10, capacity=2)
+        with patch('time.sleep') as sleep:
+            self.assertEqual(limiter.acquire('fetch_order'), 0)
+            self.assertEqual(limiter.acquire('fetch_order'), 0)
+        sleep.assert_not_called()
+
+    def test_sleeps_once_budget_is_used(self):
+        limiter = RateLimiter(rate=10, capacity=1, weights={'fetch_balance': 5})
+        with patch('time.sleep') as sleep:
+            limiter.acquire('fetch_order')
+            waited = limiter.acquire('fetch_balance')
+        self.assertAlmostEqual(waited, 0.5, places=2)
+        sleep.assert_called_once()
+
+    def test_no_rate_limit(self):
+        limiter = RateLimiter(rate=None)
+        for _ in range(100):
+            self.assertEqual(limiter.acquire('create_order'), 0)
+
+
+class TestRetry(unittest.TestCase):
+
+    def setUp(self):
+        CCXTStore.clear_registry()
+        self.patcher = fake_exchange()
+        self.patcher.start()
+        self.addCleanup(self.patcher.stop)
+        self.store = CCXTStore(exchange='fake', currency='USDT', config={}, retries=3,
+                               retry_backoff=1.0, retry_backoff_max=3.0)
+
+    def test_exponential_backoff_with_jitter(self):
+        with patch.object(self.store.exchange, 'fetch_ohlcv', side_effect=NetworkError('down')), \
+                patch('time.sleep') as sleep, patch('random.uniform', side_effect=lambda a, b: b):
+            with self.assertRaises(NetworkError):
+                self.store.fetch_ohlcv('BTC/USDT', '1m', None, 10)
+        self.assertEqual([c[0][0] for c in sleep.call_args_list], [1.0, 2.0])
+
+    def test_success_does_not_sleep(self):
+        with patch('time.sleep') as sleep:
+            self.store.fetch_ohlcv('BTC/USDT', '1m', None, 10)
+        sleep.assert_not_called()
+
+    def test_permanent_errors_fail_fast(self):
+        with patch.object(self.store.exchange, 'fetch_balance', side_effect=InsufficientFunds('no')) as fetch, \
+                patch('time.sleep') as sleep:
+            with self.assertRaises(InsufficientFunds):
+                self.store.get_wallet_balance()
+        self.assertEqual(fetch.call_count, 1)
+        sleep.assert_not_called()
+
+    def test_order_just_placed_is_looked_up_again(self):
+        # 有的交易所刚下的订单会短暂查不到
+        with patch.object(self.store.exchange, 'fetch_order', side_effect=[OrderNotFound('-2013'), {'id': '1'}]), \
+                patch('time.sleep'):
+            self.assertEqual(self.store.fetch_order('1', 'BTC/USDT'), {'id': '1'})
+        with patch.object(self.store.exchange, 'cancel_order', side_effect=[OrderNotFound('-2013'), {'id': '1'}]), \
+                patch('time.sleep'):
+            self.assertEqual(self.store.cancel_order('1', 'BTC/USDT'), {'id': '1'})
+
+    def test_throttling_pauses_the_rate_limiter(self):
+        self.store.throttle_backoff = 2.0
+        with patch.object(self.store.exchange, 'fetch_ohlcv', side_effect=[RateLimitExceeded('slow down'), []]), \
+                patch('time.sleep') as sleep:
+            self.assertEqual(self.store.fetch_ohlcv('BTC/USDT', '1m', None, 10), [])
+        self.assertAlmostEqual(sleep.call_args[0][0], 2.0, places=1)
+
+
+class TestIdempotentCreateOrder(unittest.TestCase):
+
+    def setUp(self):
+        CCXTStore.clear_registry()
+        self.patcher = fake_exchange()
+        self.patcher.start()
+        self.addCleanup(self.patcher.stop)
+
+    def store(self, **kwargs):
+        CCXTStore.clear_registry()
+        store = CCXTStore(exchange='fake', currency='USDT', config={}, retries=3, retry_backoff=0, **kwargs)
+        self.exchange = store.exchange
+        return store
+
+    def timeout(self, placed):
+        create_order = self.exchange.create_order
+        calls = []
+
+        def flaky_create_order(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 1:
+                if placed:
+                    create_order(*args, **kwargs)
+                raise RequestTimeout('timed out')
+            return create_order(*args, **kwargs)
+        self.exchange.create_order = flaky_create_order
+        return calls
+
+    def create_order(self, store):
+        return store.create_order('BTC/USDT', 'limit', 'buy', 1.0, 100.0, {})
+
+    def test_ambiguous_failure_is_not_resent_without_client_id(self):
+        store = self.store()
+        calls = self.timeout(placed=True)
+        with self.assertRaises(RequestTimeout):
+            self.create_order(store)
+        self.assertEqual(len(calls), 1)
+
+    def test_placed_order_is_found_instead_of_resent(self):
+        store = self.store(idempotent_orders=True)
+        calls = self.timeout(placed=True)
+        order = self.create_order(store)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(list(self.exchange.orders), [order['id']])
+        self.assertTrue(order['clientOrderId'].startswith('bt'))
+
+    def test_lost_order_is_resent_with_the_same_client_id(self):
+        store = self.store(idempotent_orders=True)
+        calls = self.timeout(placed=False)
+        order = self.create_order(store)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(list(self.exchange.orders), [order['id']])
+
+    def batch_timeout(self, placed):
+        '''The first create_orders times out after the exchange placed the first ``placed`` orders'''
+        create_order = self.exchange.create_order
+        batches = []
+
+        def flaky_create_orders(orders, params={}):
+            batches.append(len(orders))
+            if len(batches) == 1:
+                for order in orders[:placed]:
+                    create_order(order['symbol'], order['type'], order['side'], order['amount'], order['price'],
+                                 order['params'])
+                raise RequestTimeout('timed out')
+            return [create_order(o['symbol'], o['type'], o['side'], o['amount'], o['price'], o['params'])
+                    for o in orders]
+        self.exchange.create_orders = flaky_create_orders
+        return batches
+
+    def create_orders(self, store, count=3):
+        return store.create_orders([{'symbol': 'BTC/USDT', 'type': 'limit', 'side': 'buy', 'amount': 1.0,
+                                     'price': 100.0 + i, 'params': {}} for i in range(count)])
+
+    def test_batch_resends_only_the_missing_orders(self):
+        store = self.store(idempotent_orders=True)
+        batches = self.batch_timeout(placed=2)
+        orders = self.create_orders(store)
+        self.assertEqual(batches, [3, 1])
+        self.assertEqual(len(self.exchange.orders), 3)
+        self.assertEqual([o['price'] for o in orders], [100.0, 101.0, 102.0])
+
+    def test_ambiguous_batch_is_not_resent_without_client_ids(self):
+        store = self.store()
+        batches = self.batch_timeout(placed=2)
+        with self.assertRaises(RequestTimeout):
+            self.create_orders(store)
+        self.assertEqual(batches, [3])
+
+
+class TestMarketsCache(unittest.TestCase):
+
+    def setUp(self):
+        CCXTStore.clear_registry()
+        self.patcher = fake_exchange()
+        self.patcher.start()
+        self.addCleanup(self.patcher.stop)
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def store(self, **kwargs):
+        CCXTStore.clear_registry()
+        return CCXTStore(exchange='fake', currency='USDT', config={}, retries=1, markets_cache=self.path, **kwargs)
+
+    def test_loaded_once_and_reused_from_disk(self):
+        store = self.store()
+        store.load_markets()
+        store.load_markets()
+        self.assertEqual(store.exchange.calls['load_markets'], 1)
+
+        store = self.store()
+        self.assertIn('BTC/USDT', store.load_markets())
+        self.assertEqual(store.exchange.calls['load_markets'], 0)
+
+    def test_stale_cache_is_reloaded(self):
+        self.store().load_markets()
+        store = self.store(markets_ttl=0)
+        store.load_markets()
+        self.assertEqual(store.exchange.calls['load_markets'], 1)
+
+
+class TestStartup(unittest.TestCase):
+
+    def setUp(self):
+        CCXTStore.clear_registry()
+        self.patcher = fake_exchange()
+        self.patcher.start()
+        self.addCleanup(self.patcher.stop)
+
+    def store(self, **kwargs):
+        return CCXTStore(exchange='fake', currency='USDT', config={'apiKey': 'key', 'secret': 'secret'},
+                         retries=1, **kwargs)
+
+    def test_background_balance_does_not_block(self):
+        release = threading.Event()
+        fetch_balance = FakeExchange.fetch_balance
+        with patch.object(FakeExchange, 'fetch_balance', lambda self: release.wait(5) and fetch_balance(self)):
+            store = self.store(balance_fetch='background')
+            broker = store.getbroker()
+            self.assertFalse(store.balance_ready())
+            self.assertEqual(broker.getcash(), 0.0)
+            release.set()
+            self.assertEqual(store.initial_balance()['free']['USDT'], 1000.0)
+        self.assertEqual(broker.getcash(), 1000.0)
+
+    def test_deferred_balance_is_fetched_on_first_use(self):
+        store = self.store(balance_fetch='deferred')
+        self.assertEqual(store.exchange.calls['fetch_balance'], 0)
+        broker = store.getbroker()
+        self.assertEqual(store.exchange.calls['fetch_balance'], 0)
+        broker.next()
+        self.assertEqual(store.exchange.calls['fetch_balance'], 1)
+        self.assertEqual(broker.getvalue(), 1000.0)
+
+    def test_profile_records_phases(self):
+        store = self.store()
+        store.load_markets()
+        self.assertEqual(list(store.startup_profile), ['exchange', 'balance', 'markets'])
+
+
+class TestStoreRegistry(unittest.TestCase):
+
+    def setUp(self):
+        CCXTStore.clear_registry()
+        self.patcher = fake_exchange()
+        self.patcher.start()
+        self.addCleanup(self.patcher.stop)
+        self.addCleanup(CCXTStore.clear_registry)
+
+    def store(self, api_key=None, sandbox=False, currency='USDT'):
+        config = {'apiKey': api_key} if api_key else {}
+        return CCXTStore(exchange='fake', currency=currency, config=config, retries=1, sandbox=sandbox)
+
+    def test_same_account_shares_the_store(self):
+        store = self.store('key-a')
+        self.assertIs(self.store('key-a', currency='BTC'), store)
+        self.assertIs(CCXTStore(), store)
+
+    def test_accounts_and_sandbox_get_their_own_store(self):
+        stores = [self.store('key-a'), self.store('key-b'), self.store('key-a', sandbox=True), self.store()]
+        self.assertEqual(len(set(map(id, stores))), 4)
+        self.assertIsNot(stores[0].exchange, stores[1].exchange)
+
+    def test_getdata_and_getbroker_bind_to_the_store(self):
+        store_a, store_b = self.store('key-a'), self.store('key-b')
+        data = store_a.getdata(dataname='BTC/USDT', name='BTC/USDT', timeframe=1, compression=1)
+        broker = store_a.getbroker()
+        self.assertIs(data.store, store_a)
+        self.assertIs(broker.store, store_a)
+        self.assertIs(store_b.getbroker().store, store_b)
+
+    def test_no_store_yet(self):
+        with self.assertRaises(TypeError):
+            CCXTStore()
+
+
+if __name__ == '__main__':
+    unittest.main()
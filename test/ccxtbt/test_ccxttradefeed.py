@@ -0,0 +1,85 @@
+import unittest
+from datetime import datetime
+
+import numpy as np
+from backtrader import TimeFrame
+
+from ccxtbt import CCXTStore, CCXTTradeFeed, aggregate_trades
+from test.ccxtbt.fakeexchange import fake_exchange
+
+START = 1577836800000  # 2020-01-01
+
+
+class TestAggregateTrades(unittest.TestCase):
+
+    def test_time_bars(self):
+        trades = np.array([[START + 1000, 10, 1], [START + 4000, 12, 2], [START + 6000, 9, 1], [START + 11000, 11, 1]],
+                          dtype=np.float64)
+        bars, used = aggregate_trades(trades, 'time', 5000)
+        self.assertEqual(used, 3)
+        self.assertEqual(bars.tolist(), [[START, 10, 12, 10, 12, 3], [START + 5000, 9, 9, 9, 9, 1]])
+        bars, used = aggregate_trades(trades, 'time', 5000, closed_until=START + 15000)
+        self.assertEqual(used, 4)
+        self.assertEqual(bars[-1].tolist(), [START + 10000, 11, 11, 11, 11, 1])
+
+    def test_tick_and_volume_bars(self):
+        trades = np.array([[START + i, 10 + i, 1 + i % 2] for i in range(5)], dtype=np.float64)
+        bars, used = aggregate_trades(trades, 'tick', 2)
+        self.assertEqual(used, 4)
+        self.assertEqual(bars.tolist(), [[START + 1, 10, 11, 10, 11, 3], [START + 3, 12, 13, 12, 13, 3]])
+        # 成交量 1, 2, 1, 2, 1: 每根bar至少3
+        bars, used = aggregate_trades(trades, 'volume', 3)
+        self.assertEqual(used, 4)
+        self.assertEqual(bars[:, 5].tolist(), [3, 3])
+        self.assertEqual(aggregate_trades(trades[:1], 'volume', 3)[1], 0)
+
+
+class TestCCXTTradeFeed(unittest.TestCase):
+
+    def setUp(self):
+        CCXTStore.clear_registry()
+        self.patcher = fake_exchange()
+        self.patcher.start()
+        self.addCleanup(self.patcher.stop)
+        self.store = CCXTStore(exchange='fake', currency='USDT', config={}, retries=1)
+        self.exchange = self.store.exchange
+        # 每秒一笔成交,共60秒,有几笔成交时间戳相同
+        trades = [(START + i * 1000, 100.0 + i, 1.0) for i in range(60)]
+        trades[11:11] = [(START + 10000, 50.0, 2.0)] * 3
+        self.exchange.add_trades('BTC/USDT', trades)
+
+    def feed(self, **kwargs):
+        params = dict(dataname='BTC/USDT', timeframe=TimeFrame.Seconds, compression=10, trades_limit=7,
+                      fromdate=datetime(2020, 1, 1), todate=datetime(2020, 1, 1, 0, 1), historical=True)
+        params.update(kwargs)
+        feed = self.store.gettradedata(**params)
+        feed._update_bar(feed.p.fromdate)
+        return feed
+
+    def test_ten_second_bars(self):
+        self.assertIs(self.store.getdata(dataname='BTC/USDT').__class__, self.store.DataCls)
+        feed = self.feed()
+        self.assertIsInstance(feed, CCXTTradeFeed)
+        bars = feed._data.get_many()
+        self.assertEqual(bars[:, 0].tolist(), [START + i * 10000 for i in range(6)])
+        self.assertEqual(bars[1, 1:6].tolist(), [110.0, 119.0, 50.0, 119.0, 16.0])
+        self.assertEqual(bars[:, 5].sum(), 66.0)  # 没有漏掉或重复的成交
+
+    def test_cursor_pagination(self):
+        feed = self.feed(trades_cursor_param='fromId')
+        self.assertEqual(feed._data.get_many()[:, 5].sum(), 66.0)
+
+    def test_resume_from_cursor(self):
+        feed = self.feed(bar_type='tick', bar_size=5, todate=datetime(2020, 1, 1, 0, 0, 30))
+        first = feed._data.get_many()
+        self.assertEqual(len(first), 6)  # 34笔成交, 4笔还在形成中的bar里
+        self.assertEqual(feed.cursor['timestamp'], START + 26000)
+
+        feed = self.feed(bar_type='tick', bar_size=5, cursor=feed.cursor)
+        second = feed._data.get_many()
+        self.assertEqual(len(first) + len(second), 12)
+        self.assertEqual(second[0, 1], 127.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
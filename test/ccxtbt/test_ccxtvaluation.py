@@ -0,0 +1,57 @@
+import unittest
+
+from ccxtbt import CCXTLedger, CCXTValuation
+from test.ccxtbt.test_ccxtbroker import BrokerTestCase
+
+BALANCE = {'free': {'USDT': 100.0, 'BTC': 1.0, 'ETH': 2.0, 'XYZ': 5.0},
+           'total': {'USDT': 100.0, 'BTC': 1.0, 'ETH': 2.0, 'XYZ': 5.0}}
+
+
+class TestCCXTValuation(unittest.TestCase):
+
+    def test_marks_all_currencies_to_the_quote(self):
+        ledger = CCXTLedger(BALANCE)
+        valuation = CCXTValuation('USDT')
+        valuation.update_tickers({'BTC/USDT': {'last': 1000.0}, 'ETH/BTC': {'last': 0.1},
+                                  'USDT/ETH': {'last': 0.01}, 'BTC/USDT:USDT': {'last': 5.0}})
+        self.assertEqual(valuation.value(ledger), 100.0 + 1000.0 + 2 * 100.0)
+        self.assertEqual(valuation.unpriced, {'XYZ'})
+
+    def test_value_is_cached_until_something_changes(self):
+        ledger = CCXTLedger(BALANCE)
+        valuation = CCXTValuation('USDT')
+        valuation.set_price('BTC', 1000.0)
+        self.assertEqual(valuation.value(ledger), 1100.0)
+        ledger.total['USDT'] = 0.0  # not a booked change, the cached value stays
+        self.assertEqual(valuation.value(ledger), 1100.0)
+        ledger.fill('1', 'BTC/USDT', 'sell', 1.0, 1000.0)
+        self.assertEqual(valuation.value(ledger), 1000.0)
+        valuation.set_price('ETH', 50.0)
+        self.assertEqual(valuation.value(ledger), 1100.0)
+
+
+class TestBrokerValuation(BrokerTestCase):
+
+    def broker_kwargs(self):
+        return {'config': {'apiKey': 'key', 'secret': 'secret'}}
+
+    def setUp(self):
+        super(TestBrokerValuation, self).setUp()
+        self.exchange.has = dict(self.exchange.has, fetchTickers=True)
+        self.exchange.tickers = {'BTC/USDT': {'last': 1000.0}, 'ETH/USDT': {'last': 100.0}}
+        self.broker.ledger.seed(BALANCE)
+
+    def test_feed_closes_win_over_tickers(self):
+        data = self.data('ETH/USDT')
+        data.lines.close[0] = 150.0
+        self.broker.store.feeds.append(data)
+        self.broker.next()
+        self.assertEqual(self.broker.getvalue(), 100.0 + 1000.0 + 2 * 150.0)
+        self.broker.next()
+        self.broker.getvalue()
+        # Tickers are refreshed on their own schedule, not on every next()
+        self.assertEqual(self.exchange.calls['fetch_tickers'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+from datetime import datetime
+
+import backtrader as bt
+import numpy as np
+from backtrader.utils.py3 import queue
+
+from ccxtbt import OHLCVBuffer, ts_to_num
+
+
+def bars(start, count):
+    return [[(start + i) * 60000, 1.0, 2.0, 0.5, 1.5, float(i)] for i in range(count)]
+
+
+class TestTsToNum(unittest.TestCase):
+
+    def test_matches_date2num(self):
+        ts = np.random.default_rng(0).integers(0, 2000000000000, 5000)
+        expected = [bt.date2num(datetime.utcfromtimestamp(t // 1000)) for t in ts.tolist()]
+        self.assertEqual(ts_to_num(ts).tolist(), expected)
+
+
+class TestOHLCVBuffer(unittest.TestCase):
+
+    def test_fifo(self):
+        buf = OHLCVBuffer(capacity=4)
+        self.assertTrue(buf.empty())
+        self.assertRaises(queue.Empty, buf.get)
+        buf.put_many(bars(0, 3))
+        buf.put(bars(3, 1)[0])
+        self.assertEqual(buf.qsize(), 4)
+        row = buf.get()
+        self.assertEqual(row[:6], bars(0, 1)[0])
+        self.assertEqual(row[6], bt.date2num(datetime(1970, 1, 1)))
+
+    def test_compacts_and_grows(self):
+        buf = OHLCVBuffer(capacity=4)
+        buf.put_many(bars(0, 3))
+        buf.get()
+        buf.get()
+        buf.put_many(bars(3, 3))  # fits after moving the unread bar to the front
+        self.assertEqual(len(buf._array), 4)
+        buf.put_many(bars(6, 10))
+        self.assertEqual(len(buf._array), 16)
+        self.assertEqual([buf.get()[5] for _ in range(buf.qsize())], [2.0, 0.0, 1.0, 2.0] + [float(i) for i in range(10)])
+        self.assertTrue(buf.empty())
+
+    def test_get_many(self):
+        buf = OHLCVBuffer()
+        buf.put_many(bars(0, 10))
+        self.assertEqual(buf.get_many(4)[:, 0].tolist(), [i * 60000 for i in range(4)])
+        self.assertEqual(len(buf.get_many()), 6)
+        self.assertTrue(buf.empty())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import shutil
+import tempfile
+import time
+import unittest
+from datetime import datetime
+
+from ccxtbt import CCXTStore, OHLCVCache
+from test.ccxtbt.fakeexchange import fake_exchange
+from test.ccxtbt.test_ccxtfeed import make_feed
+
+KEY = ('fake', 'BTC/USDT', '1m')
+
+
+def bars(start, count):
+    return [[start + i * 60000, 1.0, 2.0, 0.5, 1.5, 10.0] for i in range(count)]
+
+
+class TestOHLCVCache(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.cache = OHLCVCache(self.path)
+
+    def test_empty(self):
+        self.assertIsNone(self.cache.coverage(*KEY))
+        self.assertEqual(len(self.cache.load(*KEY)), 0)
+        self.assertEqual(self.cache.missing(*KEY, start=0, end=600000), [(0, 600000)])
+
+    def test_append_and_prepend(self):
+        self.cache.write(*KEY, bars=bars(600000, 10), start=600000, end=1140000)
+        self.cache.write(*KEY, bars=bars(1140000, 5), start=1140000, end=1380000)
+        self.cache.write(*KEY, bars=bars(0, 10), start=0, end=600000)
+        data = self.cache.load(*KEY)
+        self.assertEqual(data[:, 0].tolist(), [i * 60000 for i in range(24)])
+        self.assertEqual(self.cache.coverage(*KEY), (0, 1380000))
+
+    def test_gaps(self):
+        self.cache.write(*KEY, bars=bars(600000, 10), start=600000, end=1140000)
+        self.assertEqual(self.cache.missing(*KEY, start=0, end=2000000), [(0, 600000), (1140000, 2000000)])
+        self.assertEqual(self.cache.missing(*KEY, start=700000, end=800000), [])
+        self.assertEqual(self.cache.read(*KEY, start=600000, end=720000)[:, 0].tolist(), [660000, 720000])
+
+    def test_disjoint_write_keeps_history(self):
+        self.cache.write(*KEY, bars=bars(0, 5), start=0, end=240000)
+        self.assertFalse(self.cache.write(*KEY, bars=bars(6000000, 5), start=6000000, end=6240000))
+        self.assertFalse(self.cache.write(*KEY, bars=bars(0, 5), start=-6000000, end=-5760000))
+        self.assertEqual(self.cache.coverage(*KEY), (0, 240000))
+        self.assertEqual(self.cache.load(*KEY)[:, 0].tolist(), [i * 60000 for i in range(5)])
+        # 相连的写入仍然可以扩展缓存
+        self.assertTrue(self.cache.write(*KEY, bars=bars(300000, 2), start=240000, end=360000))
+        self.assertEqual(self.cache.coverage(*KEY), (0, 360000))
+
+
+class TestFeedCache(unittest.TestCase):
+
+    def setUp(self):
+        CCXTStore.clear_registry()
+        self.patcher = fake_exchange()
+        self.patcher.start()
+        self.addCleanup(self.patcher.stop)
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def backfill(self, fromdate):
+        feed = make_feed(cache=self.path, ohlcv_limit=10)
+        exchange = feed.store.exchange
+        if not exchange.ohlcv['BTC/USDT']:
+            start = (int(time.time()) // 60 - 100) * 60000
+            exchange.add_bars('BTC/USDT', start, 100)
+        exchange.calls.clear()
+        feed._update_bar(fromdate)
+        return feed, exchange
+
+    def test_second_backfill_is_served_from_cache(self):
+        fromdate = datetime.utcfromtimestamp((int(time.time()) // 60 - 90) * 60)
+        feed, exchange = self.backfill(fromdate)
+        self.assertEqual(feed._data.qsize(), 89)
+        self.assertGreater(exchange.calls['fetch_ohlcv'], 5)
+
+        feed, exchange = self.backfill(fromdate)
+        self.assertEqual(feed._data.qsize(), 89)
+        # Only the tail after the cached range was fetched
+        self.assertEqual(exchange.calls['fetch_ohlcv'], 1)
+
+    def test_missing_head_is_fetched(self):
+        now = int(time.time()) // 60
+        self.backfill(datetime.utcfromtimestamp((now - 50) * 60))
+        feed, exchange = self.backfill(datetime.utcfromtimestamp((now - 90) * 60))
+        self.assertEqual(feed._data.qsize(), 89)
+        self.assertEqual(OHLCVCache(self.path).coverage('fake', 'BTC/USDT', '1m')[0], (now - 90) * 60000)
+
+
+if __name__ == '__main__':
+    unittest.main()
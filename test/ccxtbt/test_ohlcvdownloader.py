@@ -0,0 +1,70 @@
+import time
+import unittest
+from datetime import datetime
+
+from ccxtbt import CCXTStore, OHLCVDownloader
+from test.ccxtbt.fakeexchange import fake_exchange
+from test.ccxtbt.test_ccxtfeed import make_feed
+
+
+class TestOHLCVDownloader(unittest.TestCase):
+
+    def setUp(self):
+        CCXTStore.clear_registry()
+        self.patcher = fake_exchange()
+        self.patcher.start()
+        self.addCleanup(self.patcher.stop)
+        self.store = CCXTStore(exchange='fake', currency='USDT', config={}, retries=1)
+        self.store.exchange.add_bars('BTC/USDT', 0, 1000)
+
+    def download(self, workers, since=0, until=1000 * 60000):
+        progress = []
+        downloader = OHLCVDownloader(self.store, 'BTC/USDT', '1m', 100, workers=workers,
+                                     progress=lambda *args: progress.append(args))
+        return downloader.download(since, until), downloader, progress
+
+    def test_parallel_matches_serial(self):
+        serial, _, _ = self.download(1)
+        self.store.exchange.calls.clear()
+        parallel, downloader, progress = self.download(4)
+        self.assertEqual(parallel, serial)
+        self.assertEqual([bar[0] for bar in parallel], [i * 60000 for i in range(1000)])
+        # One request per window of 100 bars
+        self.assertEqual(self.store.exchange.calls['fetch_ohlcv'], 10)
+        self.assertEqual(len(progress), 10)
+        self.assertEqual(downloader.stats['bars'], 1000)
+
+    def test_partial_range(self):
+        bars, _, _ = self.download(3, since=150 * 60000, until=420 * 60000)
+        self.assertEqual([bar[0] for bar in bars], [i * 60000 for i in range(150, 420)])
+
+
+class TestFeedDownload(unittest.TestCase):
+
+    def setUp(self):
+        CCXTStore.clear_registry()
+        self.patcher = fake_exchange()
+        self.patcher.start()
+        self.addCleanup(self.patcher.stop)
+
+    def test_backfill_with_workers(self):
+        now = int(time.time()) // 60
+        feed = make_feed(download_workers=4, ohlcv_limit=50)
+        feed.store.exchange.add_bars('BTC/USDT', (now - 500) * 60000, 500)
+        feed._update_bar(datetime.utcfromtimestamp((now - 500) * 60))
+        self.assertEqual(feed._data.qsize(), 499)
+        self.assertEqual(feed.download_stats['windows'], 10)
+
+    def test_historical_stops_at_todate(self):
+        now = int(time.time()) // 60
+        feed = make_feed(download_workers=4, ohlcv_limit=50, historical=True,
+                         todate=datetime.utcfromtimestamp((now - 400) * 60))
+        exchange = feed.store.exchange
+        exchange.add_bars('BTC/USDT', (now - 500) * 60000, 500)
+        feed._update_bar(datetime.utcfromtimestamp((now - 500) * 60))
+        self.assertEqual(feed._data.qsize(), 100)
+        self.assertEqual(exchange.calls['fetch_ohlcv'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import time
+import unittest
+from datetime import datetime
+
+import numpy as np
+
+from ccxtbt import CCXTStore, OHLCVSeries, OHLCVSubscription
+from test.ccxtbt.fakeexchange import fake_exchange
+from test.ccxtbt.test_ccxtfeed import make_feed
+
+
+class TestOHLCVHub(unittest.TestCase):
+
+    def setUp(self):
+        CCXTStore.clear_registry()
+        self.patcher = fake_exchange()
+        self.patcher.start()
+        self.addCleanup(self.patcher.stop)
+        self.now = int(time.time()) // 60 * 60
+        self.feeds = [make_feed(shared=True, ohlcv_limit=10) for _ in range(3)]
+        self.store = self.feeds[0].store
+        self.exchange = self.store.exchange
+        self.exchange.add_bars('BTC/USDT', (self.now - 100 * 60) * 1000, 100)
+        for feed in self.feeds:
+            feed._tz = None
+            feed.start()
+
+    def tearDown(self):
+        for feed in self.feeds:
+            feed.stop()
+
+    def minutes_ago(self, minutes):
+        return datetime.utcfromtimestamp(self.now - minutes * 60)
+
+    def test_feeds_share_one_fetch_and_one_buffer(self):
+        self.feeds[0]._update_bar(self.minutes_ago(50))
+        calls = self.exchange.calls['fetch_ohlcv']
+        self.feeds[1]._update_bar(self.minutes_ago(50))
+        self.feeds[2]._update_bar(self.minutes_ago(20))
+        self.assertEqual(self.exchange.calls['fetch_ohlcv'], calls)
+        self.assertEqual(len(self.store.ohlcv_hub.series()), 1)
+
+        first, second = self.feeds[0]._data.get_many(), self.feeds[1]._data.get_many()
+        self.assertEqual(len(first), 49)
+        self.assertTrue(np.shares_memory(first, second))
+        self.assertFalse(first.flags.writeable)
+        self.assertEqual(self.feeds[2]._data.qsize(), 19)
+        self.assertEqual(self.feeds[2]._data.get()[0], (self.now - 19 * 60) * 1000)
+
+    def test_earlier_fromdate_fetches_the_head_only(self):
+        self.feeds[0]._update_bar(self.minutes_ago(20))
+        calls = self.exchange.calls['fetch_ohlcv']
+        self.feeds[1]._update_bar(self.minutes_ago(50))
+        self.assertEqual(self.exchange.calls['fetch_ohlcv'] - calls, 4)  # 30 bars, 10 per page
+        self.assertEqual(self.feeds[0]._data.qsize(), 19)
+        rows = self.feeds[1]._data.get_many()
+        self.assertEqual(rows[:, 0].tolist(), [(self.now - i * 60) * 1000 for i in range(49, 0, -1)])
+
+    def test_live_poll_is_made_once(self):
+        for feed in self.feeds:
+            feed._update_bar(self.minutes_ago(50))
+        self.exchange.add_bars('BTC/USDT', self.now * 1000, 1)
+        calls = self.exchange.calls['fetch_ohlcv']
+        for feed in self.feeds:
+            feed._update_bar(livemode=True)
+        self.assertEqual(self.exchange.calls['fetch_ohlcv'] - calls, 0)  # 最新收盘的bar已经有了
+
+        self.exchange.add_bars('BTC/USDT', (self.now + 60) * 1000, 1)
+        series = self.store.ohlcv_hub.series()[0]
+        series.refresh(self.feeds[0]._last_ts, 10, now=self.now + 125)
+        series.refresh(self.feeds[0]._last_ts, 10, now=self.now + 125)
+        self.assertEqual(self.exchange.calls['fetch_ohlcv'] - calls, 1)
+        for feed in self.feeds:
+            self.assertEqual(feed._data.get_many()[-1, 0], (self.now + 60) * 1000)
+
+    def test_gap_is_caught_up_for_all_feeds(self):
+        for feed in self.feeds:
+            feed._update_bar(self.minutes_ago(90))
+            feed._data.get_many()
+        series = self.store.ohlcv_hub.series()[0]
+        series._last_ts = (self.now - 60 * 60) * 1000  # 断线了一小时
+        series._count -= 59
+        for feed in self.feeds:
+            feed._last_ts = series._last_ts
+            feed._data.seek(series._last_ts)
+        self.feeds[0]._update_bar(livemode=True)
+        calls = self.exchange.calls['fetch_ohlcv']
+        for feed in self.feeds[1:]:
+            feed._update_bar(livemode=True)
+        self.assertEqual(self.exchange.calls['fetch_ohlcv'], calls)  # 第一个数据源已经补上了
+        for feed in self.feeds:
+            self.assertEqual(feed._data.qsize(), 59)
+            self.assertEqual(list(feed.notifs)[-1], (feed.LIVE, (), {'backfilled': 59}))
+            self.assertEqual(feed._last_ts, series.last_ts)
+
+    def test_unsubscribe_releases_the_series(self):
+        for feed in self.feeds:
+            feed.stop()
+        self.assertEqual(self.store.ohlcv_hub.series(), [])
+
+
+class TestOHLCVSeries(unittest.TestCase):
+
+    def test_read_rows_are_dropped_when_full(self):
+        series = OHLCVSeries(store=None, symbol='BTC/USDT', granularity='1m', capacity=4)
+        fast, slow = OHLCVSubscription(series, 0), OHLCVSubscription(series, 0)
+        for sub in (fast, slow):
+            series.subscriptions[id(sub)] = sub
+        series._append(series._rows([[i * 60000, 1, 1, 1, 1, 1] for i in range(1, 5)]))
+        fast.get_many()
+        slow.get_many(2)
+        series._append(series._rows([[i * 60000, 1, 1, 1, 1, 1] for i in range(5, 7)]))
+        self.assertEqual(series.rows()[:, 0].tolist(), [i * 60000 for i in range(3, 7)])
+        self.assertEqual(slow.qsize(), 4)
+        self.assertEqual(fast.qsize(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import time
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+import numpy as np
+from backtrader import TimeFrame
+
+from ccxtbt import CCXTStore, resample_ohlcv
+from test.ccxtbt.fakeexchange import fake_exchange
+from test.ccxtbt.test_ccxtfeed import make_feed
+
+
+class TestResampleOHLCV(unittest.TestCase):
+
+    def test_aggregates_complete_periods(self):
+        bars = np.array([[i * 60000, 10 + i, 20 + i, 5 - i, 11 + i, 1.0] for i in range(5)])
+        result, used = resample_ohlcv(bars, 120000)
+        self.assertEqual(used, 4)
+        self.assertEqual(result.tolist(), [[0, 10, 21, 4, 12, 2], [120000, 12, 23, 2, 14, 2]])
+        result, used = resample_ohlcv(bars, 120000, closed_until=360000)
+        self.assertEqual(used, 5)
+        self.assertEqual(result[-1].tolist(), [240000, 14, 24, 1, 15, 1])
+
+    def test_weeks_start_on_monday(self):
+        monday = 1704067200000  # 2024-01-01
+        week = 604800000
+        bars = np.array([[monday + i * 86400000, 1, 2, 0, 1, 1] for i in range(28)], dtype=np.float64)
+        result, used = resample_ohlcv(bars, week, closed_until=monday + 4 * week)
+        self.assertEqual(result[:, 0].tolist(), [monday + i * week for i in range(4)])
+        result, used = resample_ohlcv(bars, 2 * week, closed_until=monday + 5 * week)
+        self.assertEqual([datetime.utcfromtimestamp(ts / 1000).weekday() for ts in result[:, 0]], [0, 0, 0])
+        self.assertEqual(result[:, 5].tolist(), [7, 14, 7])
+
+    def test_missing_base_bars(self):
+        bars = np.array([[0, 1, 2, 0, 1, 1], [240000, 3, 4, 2, 3, 1], [300000, 3, 5, 2, 4, 1]], dtype=np.float64)
+        result, used = resample_ohlcv(bars, 120000, closed_until=360000)
+        self.assertEqual(result[:, 0].tolist(), [0, 240000])
+        self.assertEqual(result[1].tolist(), [240000, 3, 5, 2, 4, 2])
+
+
+class TestResampledFeed(unittest.TestCase):
+
+    def setUp(self):
+        CCXTStore.clear_registry()
+        self.patcher = fake_exchange()
+        self.patcher.start()
+        self.addCleanup(self.patcher.stop)
+
+    def test_plan(self):
+        store = make_feed().store
+        self.assertEqual(store.resample_plan(TimeFrame.Minutes, 5), ('5m', 300))
+        self.assertEqual(store.resample_plan(TimeFrame.Minutes, 10), ('1m', 600))
+        self.assertEqual(store.resample_plan(TimeFrame.Minutes, 90), ('1m', 5400))
+        self.assertEqual(store.resample_plan(TimeFrame.Days, 2), ('1m', 172800))
+        self.assertEqual(store.resample_plan(TimeFrame.Weeks, 2), ('1m', 1209600))
+        with self.assertRaises(ValueError):
+            store.resample_plan(TimeFrame.Months, 2)
+
+    def test_feeds_share_the_base_download(self):
+        now = int(time.time()) // 600 * 600
+        start = now - 3600
+        feeds = [make_feed(compression=compression, ohlcv_limit=100) for compression in (2, 10)]
+        exchange = feeds[0].store.exchange
+        exchange.add_bars('BTC/USDT', start * 1000, 60)
+        fromdate = datetime.utcfromtimestamp(start)
+        # 交易所已经发布了最新收盘的bar
+        with patch('time.time', return_value=now + 30):
+            feeds[0]._update_bar(fromdate)
+            calls = exchange.calls['fetch_ohlcv']
+            feeds[1]._update_bar(fromdate)
+        self.assertEqual(exchange.calls['fetch_ohlcv'], calls)
+
+        two, ten = feeds[0]._data.get_many(), feeds[1]._data.get_many()
+        self.assertEqual(len(two), 29)
+        self.assertEqual(len(ten), 5)
+        self.assertEqual(ten[0, 0], (start + 600) * 1000)
+        self.assertEqual(ten[0, 1:6].tolist(), [11.0, 21.0, 10.0, 20.5, 100.0])
+        # 10分钟bar和对应的5根2分钟bar一致
+        self.assertEqual(ten[:, 5].tolist(), two[4:, 5].reshape(-1, 5).sum(axis=1).tolist())
+        self.assertEqual(ten[:, 4].tolist(), two[8::5, 4].tolist())
+
+    def test_first_bar_matches_native_feeds(self):
+        now = int(time.time()) // 120 * 120
+        start = now - 1200
+        native = make_feed(dataname='ETH/USDT', compression=2, ohlcv_limit=100)
+        resampled = make_feed(compression=2, ohlcv_limit=100)
+        exchange = native.store.exchange
+        exchange.add_bars('ETH/USDT', start * 1000, 10, period_ms=120000)
+        exchange.add_bars('BTC/USDT', start * 1000, 20)
+        for offset in (0, 30):
+            fromdate = datetime.utcfromtimestamp(start + offset)
+            with patch('time.time', return_value=now + 30):
+                # 2m只有原生数据源可以直接获取
+                exchange.timeframes = dict(exchange.timeframes, **{'2m': '2m'})
+                native._update_bar(fromdate)
+                del exchange.timeframes['2m']
+                resampled._update_bar(fromdate)
+            first = native._data.get_many()[0, 0]
+            self.assertEqual(first, (start + 120) * 1000)
+            self.assertEqual(resampled._data.get_many()[0, 0], first)
+
+
+    def test_late_base_bar_is_waited_for(self):
+        now = int(time.time()) // 120 * 120
+        start = now - 1200
+        feed = make_feed(compression=2, ohlcv_limit=100, poll_retry=60.0)
+        exchange = feed.store.exchange
+        exchange.add_bars('BTC/USDT', start * 1000, 19)  # 最后一根1分钟bar迟到
+        with patch('time.time', return_value=now + 30):
+            feed._update_bar(datetime.utcfromtimestamp(start))
+        self.assertEqual(feed._data.get_many()[-1, 0], (now - 240) * 1000)
+
+        exchange.add_bars('BTC/USDT', (now - 60) * 1000, 1)
+        with patch('time.time', return_value=now + 35):
+            feed._update_bar(livemode=True)
+        bars = feed._data.get_many()
+        self.assertEqual(bars[:, 0].tolist(), [(now - 120) * 1000])
+        self.assertEqual(bars[0, 5], 20.0)
+        self.assertEqual(feed.store.shared_ohlcv.bars('BTC/USDT', '1m', start * 1000, now * 1000)[:, 0].tolist(),
+                         [(start + 60 * i) * 1000 for i in range(20)])
+
+    def test_missing_base_bar_times_out(self):
+        now = int(time.time()) // 120 * 120
+        start = now - 1200
+        feed = make_feed(compression=2, ohlcv_limit=100, poll_retry=60.0)
+        feed.store.exchange.add_bars('BTC/USDT', start * 1000, 19)
+        with patch('time.time', return_value=now + 30):
+            feed._update_bar(datetime.utcfromtimestamp(start))
+        feed._data.get_many()
+        with patch('time.time', return_value=now + 61):
+            feed._update_bar(livemode=True)
+        bars = feed._data.get_many()
+        self.assertEqual(bars[:, 0].tolist(), [(now - 120) * 1000])
+        self.assertEqual(bars[0, 5], 10.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
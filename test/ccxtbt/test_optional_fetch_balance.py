@@ -24,13 +24,13 @@ class TestFeedInitialFetchBalance(unittest.TestCase):
     def setUp(self):
         """
         The initial balance is fetched in the context of the initialization of the CCXTStore.
-        But as the CCXTStore is a singleton it's normally initialized only once and the instance is reused
-        causing side effects.
+        But as the CCXTStore instances are pooled per exchange and account, it's normally initialized only once
+        and the instance is reused causing side effects.
         If the  first test run initializes the store without fetching the balance a subsequent test run
         would not try to fetch the balance again as the initialization won't happen again.
-        Resetting the singleton to None here causes the initialization of the store to happen in every test method.
+        Clearing the store registry here causes the initialization of the store to happen in every test method.
         """
-        CCXTStore._singleton = None
+        CCXTStore.clear_registry()
 
     @patch('ccxt.binance.fetch_balance')
     def test_fetch_balance_throws_error(self, fetch_balance_mock):